@@ -0,0 +1,404 @@
+# =========================================
+# benchmarks/run_benchmarks.py
+# Repeatable throughput benchmarks; results are written as JSON
+# =========================================
+#
+#   python -m benchmarks.run_benchmarks --scale 100000 --output bench.json
+#   python -m benchmarks.run_benchmarks --only migrate_from_csv --baseline bench.json
+#
+# Every benchmark runs against its own SQLite file in a scratch directory and
+# against the local HubSpot/NetSuite stubs, never the real services. Timed
+# writes end with an audit flush, so background audit work is counted.
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import database
+from database import close_all_connections, count_customers, fetch_customer_page, fetch_environment_customers
+from hubspot_extractor import HubSpotExtractor
+from netsuite_loader import NetSuiteLoader
+from services.audit import close_audit_log, flush_audit_log
+from services.id_mapping_cache import IdMappingCache
+from services.migration_engine import (
+    get_target_id,
+    migrate_from_csv,
+    migrate_hubspot_contacts,
+    migrate_hubspot_to_netsuite,
+)
+from services.reporting import fetch_customer_stats
+from stubs import hubspot_stub, netsuite_stub
+from utils.helpers import load_config
+from benchmarks.synthetic import ID_OFFSETS, generate_contacts, write_contacts_csv
+
+ENVIRONMENT = "SANDBOX"
+
+
+class Stopwatch:
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+
+
+# ---------------------------
+# Shared fixtures
+# ---------------------------
+class BenchContext:
+    """
+    Scale, seed and scratch directory shared by every benchmark, plus the
+    fixtures that are expensive to build and safe to reuse: the CSV file,
+    a database already holding `scale` migrated contacts, and the stubs.
+    """
+
+    def __init__(self, scale, seed, workdir, batch_size=500, chunk_size=10_000,
+                 lookups=10_000, netsuite_limit=2_000, netsuite_latency=0.0, workers=None):
+        self.scale = scale
+        self.seed = seed
+        self.workdir = workdir
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.lookups = min(lookups, scale)
+        self.netsuite_limit = min(netsuite_limit, scale)
+        self.netsuite_latency = netsuite_latency
+        self.workers = workers or os.cpu_count() or 1
+        self._databases = 0
+        self._csv_path = None
+        self._populated_path = None
+        self._hubspot_url = None
+        self._netsuite = None
+
+    def contacts(self, count=None):
+        return generate_contacts(self.scale if count is None else count, self.seed)
+
+    def fresh_db(self):
+        """Point the database module at a new, empty, migrated SQLite file."""
+        self._databases += 1
+        self.use_db(os.path.join(self.workdir, f"bench_{self._databases}.db"))
+        database.ensure_schema()
+        return database.DB_PATH
+
+    def use_db(self, path):
+        close_all_connections()
+        database.DB_PATH = path
+
+    def populated_db(self):
+        """A database holding every contact of the dataset (built once)."""
+        if self._populated_path is None:
+            self._populated_path = self.fresh_db()
+            migrate_hubspot_contacts(self.contacts(), environment=ENVIRONMENT, batch_size=self.batch_size)
+        self.use_db(self._populated_path)
+        return self._populated_path
+
+    def csv_path(self):
+        if self._csv_path is None:
+            self._csv_path = write_contacts_csv(os.path.join(self.workdir, "contacts.csv"), self.scale, self.seed)
+        return self._csv_path
+
+    def hubspot_url(self):
+        if self._hubspot_url is None:
+            counts = {"contacts": self.scale, "companies": max(1, self.scale // 10), "deals": self.scale}
+            _, self._hubspot_url = hubspot_stub.start_hubspot_stub(counts)
+        return self._hubspot_url
+
+    def netsuite(self):
+        """(server, config) of a NetSuite stub, with rate limiting out of the way."""
+        if self._netsuite is None:
+            server, url = netsuite_stub.start_netsuite_stub(latency=self.netsuite_latency)
+            config = netsuite_stub.stub_config(load_config(), url)
+            config["netsuite"]["requests_per_second"] = 1_000_000
+            self._netsuite = (server, config)
+        return self._netsuite
+
+    def sample_ids(self, count):
+        rng = random.Random(self.seed)
+        return [str(ID_OFFSETS["contacts"] + rng.randrange(self.scale)) for _ in range(count)]
+
+
+# ---------------------------
+# Benchmarks
+# ---------------------------
+# Each takes the context and returns {"records": ..., "seconds": ...} plus
+# any counters worth keeping; only the work inside the Stopwatch is timed.
+def bench_hubspot_extract(ctx):
+    config = hubspot_stub.stub_config(load_config(), ctx.hubspot_url())
+    config["migration"]["dry_run"] = False
+    config["migration"]["batch_size"] = hubspot_stub.MAX_PAGE_SIZE
+    extractor = HubSpotExtractor(config)
+    with Stopwatch() as t:
+        records = sum(1 for _ in extractor.iter_objects("contacts"))
+    return {"records": records, "seconds": t.seconds}
+
+
+def bench_migrate_hubspot_contacts(ctx):
+    ctx.fresh_db()
+    with Stopwatch() as t:
+        summary = migrate_hubspot_contacts(ctx.contacts(), environment=ENVIRONMENT, batch_size=ctx.batch_size)
+        flush_audit_log()
+    return {"records": ctx.scale, "seconds": t.seconds, "created": summary["created"], "failed": summary["failed"]}
+
+
+def bench_migrate_hubspot_contacts_parallel(ctx):
+    ctx.fresh_db()
+    with Stopwatch() as t:
+        summary = migrate_hubspot_contacts(
+            ctx.contacts(), environment=ENVIRONMENT, batch_size=ctx.batch_size, workers=ctx.workers
+        )
+        flush_audit_log()
+    return {"records": ctx.scale, "seconds": t.seconds, "created": summary["created"],
+            "failed": summary["failed"], "workers": ctx.workers}
+
+
+def bench_migrate_hubspot_contacts_unchanged(ctx):
+    ctx.fresh_db()
+    migrate_hubspot_contacts(ctx.contacts(), environment=ENVIRONMENT, batch_size=ctx.batch_size)
+    with Stopwatch() as t:
+        summary = migrate_hubspot_contacts(ctx.contacts(), environment=ENVIRONMENT, batch_size=ctx.batch_size)
+    return {"records": ctx.scale, "seconds": t.seconds, "unchanged": summary["unchanged"]}
+
+
+def bench_migrate_from_csv(ctx):
+    path = ctx.csv_path()
+    ctx.fresh_db()
+    with Stopwatch() as t:
+        summary = migrate_from_csv(
+            path, environment=ENVIRONMENT, chunk_size=ctx.chunk_size, on_progress=lambda *args: None
+        )
+        flush_audit_log()
+    return {"records": ctx.scale, "seconds": t.seconds, "created": summary["created"], "failed": summary["failed"]}
+
+
+def bench_get_target_id(ctx):
+    ctx.populated_db()
+    ids = ctx.sample_ids(ctx.lookups)
+    with Stopwatch() as t:
+        found = sum(1 for source_id in ids if get_target_id("hubspot", source_id, "fwd_crm"))
+    return {"records": len(ids), "seconds": t.seconds, "found": found}
+
+
+def bench_get_target_id_cached(ctx):
+    ctx.populated_db()
+    ids = ctx.sample_ids(ctx.lookups)
+    cache = IdMappingCache()
+    with Stopwatch() as t:
+        found = 0
+        for i in range(0, len(ids), ctx.batch_size):
+            batch = ids[i:i + ctx.batch_size]
+            cache.prefetch("hubspot", batch, "fwd_crm")
+            found += sum(1 for source_id in batch if cache.get_target_id("hubspot", source_id, "fwd_crm"))
+    return {"records": len(ids), "seconds": t.seconds, "found": found, "hit_rate": cache.stats()["hit_rate"]}
+
+
+def _netsuite_push(ctx, batch_mode):
+    server, config = ctx.netsuite()
+    ctx.fresh_db()
+    contacts = list(ctx.contacts(ctx.netsuite_limit))
+    migrate_hubspot_contacts(contacts, environment=ENVIRONMENT, batch_size=ctx.batch_size)
+    loader = NetSuiteLoader(config)
+    requests_before = server.state.requests
+    try:
+        with Stopwatch() as t:
+            summary = migrate_hubspot_to_netsuite(
+                contacts, loader, environment=ENVIRONMENT, batch_size=ctx.batch_size, batch_mode=batch_mode
+            )
+    finally:
+        loader.close()
+    return {
+        "records": len(contacts), "seconds": t.seconds, "created": summary["created"],
+        "failed": summary["failed"], "requests": server.state.requests - requests_before,
+    }
+
+
+def bench_migrate_hubspot_to_netsuite(ctx):
+    return _netsuite_push(ctx, batch_mode=False)
+
+
+def bench_migrate_hubspot_to_netsuite_batched(ctx):
+    return _netsuite_push(ctx, batch_mode=True)
+
+
+def bench_dashboard_customer_pages(ctx, pages=20, page_size=50):
+    ctx.populated_db()
+    with Stopwatch() as t:
+        rows, after = 0, None
+        for _ in range(pages):
+            page, after = fetch_customer_page(ENVIRONMENT, sort_by="last_name", after=after, page_size=page_size)
+            rows += len(page)
+            if after is None:
+                break
+    return {"records": rows, "seconds": t.seconds}
+
+
+def bench_dashboard_count_customers(ctx):
+    ctx.populated_db()
+    with Stopwatch() as t:
+        total = count_customers(ENVIRONMENT, {"customer_type": "Retail"})
+    return {"records": 1, "seconds": t.seconds, "matched": total}
+
+
+def bench_dashboard_customer_stats(ctx):
+    ctx.populated_db()
+    with Stopwatch() as t:
+        stats = fetch_customer_stats(ENVIRONMENT)
+    return {"records": 1, "seconds": t.seconds, "values": sum(len(v) for v in stats.values())}
+
+
+def bench_dashboard_environment_customers(ctx):
+    ctx.populated_db()
+    with Stopwatch() as t:
+        customers = fetch_environment_customers(ENVIRONMENT)
+    return {"records": len(customers), "seconds": t.seconds}
+
+
+BENCHMARKS = {
+    "hubspot_extract": bench_hubspot_extract,
+    "migrate_hubspot_contacts": bench_migrate_hubspot_contacts,
+    "migrate_hubspot_contacts_parallel": bench_migrate_hubspot_contacts_parallel,
+    "migrate_hubspot_contacts_unchanged": bench_migrate_hubspot_contacts_unchanged,
+    "migrate_from_csv": bench_migrate_from_csv,
+    "get_target_id": bench_get_target_id,
+    "get_target_id_cached": bench_get_target_id_cached,
+    "migrate_hubspot_to_netsuite": bench_migrate_hubspot_to_netsuite,
+    "migrate_hubspot_to_netsuite_batched": bench_migrate_hubspot_to_netsuite_batched,
+    "dashboard_customer_pages": bench_dashboard_customer_pages,
+    "dashboard_count_customers": bench_dashboard_count_customers,
+    "dashboard_customer_stats": bench_dashboard_customer_stats,
+    "dashboard_environment_customers": bench_dashboard_environment_customers,
+}
+
+
+# ---------------------------
+# Runner
+# ---------------------------
+def run_benchmarks(ctx, names, repeat=3, log=None):
+    """
+    Run each named benchmark `repeat` times.
+    Returns {name: {"records", "seconds" (min/median/mean/runs), "records_per_sec", ...}};
+    records_per_sec uses the median run and extra counters come from the last one.
+    """
+    results = {}
+    for name in names:
+        runs = [BENCHMARKS[name](ctx) for _ in range(repeat)]
+        seconds = [run["seconds"] for run in runs]
+        median = statistics.median(seconds)
+        result = {k: v for k, v in runs[-1].items() if k != "seconds"}
+        result["seconds"] = {"min": min(seconds), "median": median, "mean": statistics.mean(seconds), "runs": seconds}
+        result["records_per_sec"] = result["records"] / median if median else None
+        results[name] = result
+        if log:
+            log(f"{name}: {result['records']} records, median {median:.3f}s, "
+                f"{result['records_per_sec'] or 0:,.0f} records/s")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Benchmarks whose median got slower than baseline by more than tolerance
+    (0.2 = 20%): [(name, baseline_median, median)].
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before or before.get("records") != result["records"]:
+            continue
+        old, new = before["seconds"]["median"], result["seconds"]["median"]
+        if old and new > old * (1 + tolerance):
+            regressions.append((name, old, new))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migration engine benchmarks")
+    parser.add_argument("--scale", type=int, default=10_000, help="contacts in the synthetic dataset")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--lookups", type=int, default=10_000, help="ids looked up by the get_target_id benchmarks")
+    parser.add_argument("--netsuite-limit", type=int, default=2_000, help="contacts pushed to the NetSuite stub")
+    parser.add_argument("--netsuite-latency", type=float, default=0.0, help="seconds the NetSuite stub adds per request")
+    parser.add_argument("--workers", type=int, help="processes for the parallel benchmarks (default: CPU count)")
+    parser.add_argument("--workdir", help="scratch directory (default: a temporary one, removed afterwards)")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON output to compare medians against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="fwd_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    ctx = BenchContext(
+        args.scale, args.seed, workdir, batch_size=args.batch_size, chunk_size=args.chunk_size,
+        lookups=args.lookups, netsuite_limit=args.netsuite_limit, netsuite_latency=args.netsuite_latency,
+        workers=args.workers,
+    )
+    names = args.only or list(BENCHMARKS)
+    log = lambda line: print(line, file=sys.stderr)
+
+    started = datetime.now(timezone.utc).isoformat()
+    try:
+        # The code under test prints progress; keep stdout for the JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run_benchmarks(ctx, names, repeat=args.repeat, log=log)
+    finally:
+        # The audit writer still holds the workdir's audit database
+        close_audit_log()
+        close_all_connections()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "started_at": started,
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "batch_size": args.batch_size,
+            "chunk_size": args.chunk_size,
+            "workers": ctx.workers,
+        },
+        "results": results,
+    }
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, old, new in regressions:
+            log(f"REGRESSION {name}: median {old:.3f}s -> {new:.3f}s")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# =========================================
+# benchmarks/synthetic.py
+# Seeded synthetic CRM data for benchmarks
+# =========================================
+
+import csv
+import random
+
+from services.migration_engine import CSV_COLUMNS
+
+FIRST_NAMES = ["Alice", "Bob", "Carmen", "Dev", "Elena", "Farid", "Grace", "Hiro", "Ines", "Jamal",
+               "Kasia", "Luis", "Mei", "Noah", "Olga", "Priya", "Quinn", "Rosa", "Sven", "Tara"]
+LAST_NAMES = ["Smith", "Jones", "Garcia", "Nguyen", "Patel", "Kim", "Müller", "Rossi", "Silva", "Cohen",
+              "Okafor", "Larsen", "Tanaka", "Dubois", "Novak", "Reyes", "Walsh", "Ahmed", "Berg", "Costa"]
+BRANDS = ["FWD", "Northwind", "Contoso", "Fabrikam", ""]
+LIFECYCLE_STAGES = ["Lead", "Subscriber", "Opportunity", "Customer"]
+PIPELINE_STAGES = ["Lead", "Qualified", "Proposal", "Won", "Lost"]
+CUSTOMER_TYPES = ["Retail", "Wholesale", "VIP", "Distributor", "Internal"]
+DEAL_STAGES = ["appointmentscheduled", "qualifiedtobuy", "presentationscheduled", "closedwon", "closedlost"]
+PLACES = [
+    ("New York", "NY", "10001"), ("San Francisco", "CA", "94105"), ("Atlanta", "GA", "30301"),
+    ("Rochester", "NH", "03867"), ("Austin", "TX", "73301"), ("Boston", "MA", "02108"),
+    ("Chicago", "IL", "60601"), ("Seattle", "WA", "98101"),
+]
+
+# Each object type draws from its own stream, so adding companies to a
+# dataset never changes its contacts
+_STREAMS = {"contacts": 1, "companies": 2, "deals": 3}
+ID_OFFSETS = {"contacts": 1_000_000, "companies": 2_000_000, "deals": 3_000_000}
+
+
+def _rng(seed, object_type):
+    return random.Random(seed * 10 + _STREAMS[object_type])
+
+
+def generate_contacts(count, seed=0, company_count=None):
+    """
+    Yield count HubSpot contacts in the flat shape map_hubspot_contact reads
+    (the CSV_COLUMNS keys). Same seed, same records; emails are unique.
+    """
+    rng = _rng(seed, "contacts")
+    company_count = company_count or max(1, count // 10)
+    for i in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        city, state, zip_code = rng.choice(PLACES)
+        yield {
+            "hubspot_id": str(ID_OFFSETS["contacts"] + i),
+            "netsuite_id": None,
+            "firstname": first,
+            "lastname": last,
+            "email": f"{first.lower()}.{i}@example.com",
+            "phone": f"555{rng.randrange(10_000_000):07d}",
+            "company": f"Company {rng.randrange(company_count)}",
+            "brand": rng.choice(BRANDS) or None,
+            "lifecycle_stage": rng.choice(LIFECYCLE_STAGES),
+            "pipeline_stage": rng.choice(PIPELINE_STAGES),
+            "customer_type": rng.choice(CUSTOMER_TYPES),
+            "address": f"{rng.randrange(1, 9999)} Main St",
+            "city": city,
+            "state": state,
+            "zip": zip_code,
+            "country": "United States",
+            "notes": None if rng.random() < 0.8 else "Imported from synthetic data",
+        }
+
+
+def generate_companies(count, seed=0):
+    """Yield count HubSpot companies, flattened like HubSpotExtractor output."""
+    rng = _rng(seed, "companies")
+    for i in range(count):
+        city, state, zip_code = rng.choice(PLACES)
+        record_id = str(ID_OFFSETS["companies"] + i)
+        yield {
+            "id": record_id,
+            "hubspot_id": record_id,
+            "name": f"Company {i}",
+            "domain": f"company{i}.example.com",
+            "phone": f"555{rng.randrange(10_000_000):07d}",
+            "city": city,
+            "state": state,
+            "zip": zip_code,
+            "country": "United States",
+        }
+
+
+def generate_deals(count, seed=0, contact_count=None, company_count=None):
+    """
+    Yield count HubSpot deals, each associated with one contact and one
+    company drawn from the given counts (the same ids generate_contacts and
+    generate_companies produce).
+    """
+    rng = _rng(seed, "deals")
+    contact_count = contact_count or count
+    company_count = company_count or max(1, count // 10)
+    for i in range(count):
+        record_id = str(ID_OFFSETS["deals"] + i)
+        contact_id = str(ID_OFFSETS["contacts"] + rng.randrange(contact_count))
+        company_id = str(ID_OFFSETS["companies"] + rng.randrange(company_count))
+        yield {
+            "id": record_id,
+            "hubspot_id": record_id,
+            "dealname": f"Deal {i}",
+            "amount": str(rng.randrange(100, 100_000)),
+            "dealstage": rng.choice(DEAL_STAGES),
+            "pipeline": "default",
+            "associations": {
+                "contacts": {"results": [{"id": contact_id, "type": "deal_to_contact"}]},
+                "companies": {"results": [{"id": company_id, "type": "deal_to_company"}]},
+            },
+        }
+
+
+def write_contacts_csv(path, count, seed=0):
+    """
+    Write count contacts as a HubSpot export CSV (CSV_COLUMNS), streaming
+    so 10M rows never sit in memory. Returns path.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        for contact in generate_contacts(count, seed):
+            writer.writerow(contact)
+    return path
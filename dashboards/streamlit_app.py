@@ -2,7 +2,7 @@
 # FWD CRM Streamlit App — SaaS Ready Version
 # =========================================
 
-import os, sys
+import os, sys, math
 from datetime import datetime
 
 import streamlit as st
@@ -20,7 +20,7 @@ if PROJECT_ROOT not in sys.path:
 from database import (
     init_db,
     get_conn,
-    fetch_customers,
+    fetch_environment_customers,
     fetch_pipeline_stages,
     fetch_tickets,
     fetch_brands,
@@ -28,11 +28,24 @@ from database import (
     get_brand_by_name,
     fetch_templates_by_brand,
     create_template,
-    deactivate_template
+    deactivate_template,
+    get_data_versions,
+    fetch_customer_page,
+    count_customers,
+    GRID_COLUMNS,
+    GRID_SORT_COLUMNS
 )
 
 from utils.helpers import get_city_state
 from services.migration_engine import save_or_update_contact
+from services.reporting import fetch_customer_stats
+from services.contact_import import (
+    classify_import,
+    import_contacts,
+    SKIP_DUPLICATES,
+    OVERWRITE_EXISTING,
+    ASK_FOR_EACH
+)
 
 # ---------------------------
 # Cloudinary config
@@ -64,17 +77,114 @@ environment_toggle = st.sidebar.toggle("Live Mode", value=False)
 env_text = "LIVE" if environment_toggle else "SANDBOX"
 st.sidebar.markdown(f"**Environment:** {env_text}")
 
+# ---------------------------
+# Cached reads
+# ---------------------------
+# Keyed on environment plus the dataset's data version. Every write bumps
+# that version, so a rerun only goes back to SQLite after the data changed.
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_customers(environment, version):
+    return fetch_environment_customers(environment)
+
+
+@st.cache_data(ttl=300, max_entries=8, show_spinner=False)
+def load_pipeline_stages(environment):
+    return fetch_pipeline_stages(environment)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_brands(environment, version):
+    return fetch_brands(environment)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_templates(brand_id, environment, version):
+    return fetch_templates_by_brand(brand_id, environment)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_customer_stats(environment, version):
+    return fetch_customer_stats(environment)
+
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def load_customer_page(environment, filters, sort_by, descending, after, page_size, version):
+    return fetch_customer_page(environment, dict(filters), sort_by, descending, after, page_size)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_customer_count(environment, filters, version):
+    return count_customers(environment, dict(filters))
+
+
 # ---------------------------
 # Load Data
 # ---------------------------
-customers_raw = fetch_customers(None)
+# The full customer list is only loaded by the pages that still need it
+data_versions = get_data_versions()
+pipeline_stages = load_pipeline_stages(env_text)
 
-for c in customers_raw:
-    if "environment" not in c or not c["environment"]:
-        c["environment"] = "SANDBOX"
+CUSTOMER_TYPES = ["Retail", "Wholesale", "VIP", "Distributor", "Internal"]
 
-customers = [c for c in customers_raw if c["environment"] == env_text]
-pipeline_stages = fetch_pipeline_stages(env_text)
+
+# ---------------------------
+# Customer Grid
+# ---------------------------
+def render_customer_grid(key):
+    """
+    Paginated customer table: filters, sort and paging all run in SQL and
+    only one page of rows reaches the browser.
+    """
+    brand_names = [b["name"] for b in load_brands(env_text, data_versions.get("brands", 0))]
+    stage_names = [p["name"] for p in pipeline_stages] if pipeline_stages else ["Lead", "Prospect", "Customer"]
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        brand_filter = st.selectbox("Brand", ["All"] + brand_names, key=f"{key}_brand")
+    with col2:
+        stage_filter = st.selectbox("Pipeline Stage", ["All"] + stage_names, key=f"{key}_stage")
+    with col3:
+        type_filter = st.selectbox("Customer Type", ["All"] + CUSTOMER_TYPES, key=f"{key}_type")
+    with col4:
+        sort_by = st.selectbox("Sort by", GRID_SORT_COLUMNS, key=f"{key}_sort")
+    with col5:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1, key=f"{key}_size")
+    descending = st.toggle("Descending", value=True, key=f"{key}_desc")
+
+    filters = tuple(
+        (column, value) for column, value in [
+            ("brand", brand_filter),
+            ("pipeline_stage", stage_filter),
+            ("customer_type", type_filter),
+        ] if value != "All"
+    )
+    version = data_versions.get("customers", 0)
+
+    # Stack of page cursors; reset whenever the query itself changes
+    query = (env_text, filters, sort_by, descending, page_size)
+    if st.session_state.get(f"{key}_query") != query:
+        st.session_state[f"{key}_query"] = query
+        st.session_state[f"{key}_cursors"] = [None]
+    cursors = st.session_state[f"{key}_cursors"]
+
+    total = load_customer_count(env_text, filters, version)
+    if not total:
+        st.info("No customers found for this environment.")
+        return
+
+    rows, next_cursor = load_customer_page(env_text, filters, sort_by, descending, cursors[-1], page_size, version)
+    st.caption(f"{total} customers — page {len(cursors)} of {max(1, math.ceil(total / page_size))}")
+    st.dataframe(pd.DataFrame(rows, columns=GRID_COLUMNS), hide_index=True)
+
+    prev_col, next_col, _ = st.columns([1, 1, 6])
+    with prev_col:
+        if st.button("◀ Previous", key=f"{key}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with next_col:
+        if st.button("Next ▶", key=f"{key}_next", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
 
 # ---------------------------
 # Sidebar Navigation
@@ -111,10 +221,7 @@ if section == "Dashboard":
     st.title("FWD CRM Dashboard")
     st.subheader("Customers Overview")
 
-    if customers:
-        st.dataframe(pd.DataFrame(customers))
-    else:
-        st.info("No customers found for this environment.")
+    render_customer_grid("dashboard_grid")
 
 # -------- Customers --------
 elif section == "Customers":
@@ -204,16 +311,17 @@ elif section == "Customers":
                         "environment": env_text
                     }
 
-                    save_or_update_contact(contact, environment=env_text)
-                    st.success("Customer created successfully.")
-                    st.rerun()
+                    try:
+                        save_or_update_contact(contact, environment=env_text)
+                    except ValueError as e:
+                        st.error(str(e))
+                    else:
+                        st.success("Customer created successfully.")
+                        st.rerun()
 
     elif child_item == "👥 View Customers":
         st.title("All Customers")
-        if customers:
-            st.dataframe(pd.DataFrame(customers))
-        else:
-            st.info("No customers found for this environment.")
+        render_customer_grid("customers_grid")
 
 # -------- Marketing --------
 elif section == "Marketing":
@@ -222,7 +330,7 @@ elif section == "Marketing":
 
         st.title("📧 Email Templates")
 
-        brands = fetch_brands(env_text)
+        brands = load_brands(env_text, data_versions.get("brands", 0))
 
         if not brands:
             st.info("No brands yet. Create a customer with a brand first.")
@@ -237,7 +345,7 @@ elif section == "Marketing":
         # ---- Existing Templates ----
         st.subheader("Existing Templates")
 
-        templates = fetch_templates_by_brand(brand_id, env_text)
+        templates = load_templates(brand_id, env_text, data_versions.get("templates", 0))
 
         if templates:
             for t in templates:
@@ -309,7 +417,8 @@ elif section == "Pipeline & Reports":
     if child_item == "📋 Pipeline Board":
         st.title("📋 Pipeline Board")
 
-        brands = fetch_brands(env_text)
+        customers = load_customers(env_text, data_versions.get("customers", 0))
+        brands = load_brands(env_text, data_versions.get("brands", 0))
         brand_names = [b["name"] for b in brands] if brands else []
 
         selected_brand = st.selectbox("Filter by Brand", ["All"] + brand_names)
@@ -341,122 +450,107 @@ elif section == "Pipeline & Reports":
         import altair as alt
         st.title("📈 CRM Reporting")
 
-        if not customers:
+        # A few dozen pre-aggregated rows from customer_stats, not the raw table
+        stats = load_customer_stats(env_text, data_versions.get("customers", 0))
+        if not any(stats.values()):
             st.info("No customers to report.")
             st.stop()
 
-        df_pipeline = pd.DataFrame(customers)
-
-        st.subheader("Pipeline Stage Distribution")
-        chart_pipeline = alt.Chart(df_pipeline).mark_bar().encode(
-            x='pipeline_stage:N',
-            y='count()',
-            tooltip=['pipeline_stage', 'count()']
-        )
-        st.altair_chart(chart_pipeline, use_container_width=True)
-
-        st.subheader("Customer Type Distribution")
-        chart_type = alt.Chart(df_pipeline).mark_bar().encode(
-            x='customer_type:N',
-            y='count()',
-            tooltip=['customer_type', 'count()']
-        )
-        st.altair_chart(chart_type, use_container_width=True)
-
-        st.subheader("Customers per Brand")
-        chart_brand = alt.Chart(df_pipeline).mark_bar().encode(
-            x='brand:N',
-            y='count()',
-            tooltip=['brand', 'count()']
-        )
-        st.altair_chart(chart_brand, use_container_width=True)
+        for dimension, heading in [
+            ("pipeline_stage", "Pipeline Stage Distribution"),
+            ("customer_type", "Customer Type Distribution"),
+            ("brand", "Customers per Brand"),
+        ]:
+            st.subheader(heading)
+            df_stats = pd.DataFrame(stats[dimension]).rename(columns={"value": dimension})
+            chart = alt.Chart(df_stats).mark_bar().encode(
+                x=f'{dimension}:N',
+                y='count:Q',
+                tooltip=[dimension, 'count']
+            )
+            st.altair_chart(chart, use_container_width=True)
 
     # ---------- Import Contacts ----------
-elif child_item == "📥 Import Contacts":
-    import io
-
-    st.title("📥 Import Contacts (CSV)")
-
-    # CSV template for download
-    st.subheader("Download CSV Template")
-    csv_template = pd.DataFrame([{
-        "first_name": "",
-        "last_name": "",
-        "email": "",
-        "phone": "",
-        "company": "",
-        "brand": "",
-        "customer_type": "",
-        "address": "",
-        "city": "",
-        "state": "",
-        "zip": "",
-        "country": "",
-        "notes": "",
-        "pipeline_stage": "",
-        "hubspot_id": "",
-        "netsuite_id": "",
-        "lifecycle_stage": ""
-    }])
-    csv_buffer = io.StringIO()
-    csv_template.to_csv(csv_buffer, index=False)
-    st.download_button(
-        label="Download CSV Template",
-        data=csv_buffer.getvalue(),
-        file_name="fwd_crm_import_template.csv",
-        mime="text/csv"
-    )
-
-    # Upload and import CSV
-    uploaded_file = st.file_uploader("Upload CSV", type=["csv"])
-    if uploaded_file:
-        df_import = pd.read_csv(uploaded_file)
-        st.write(f"{len(df_import)} contacts found in CSV")
-
-        # Validate columns
-        expected_cols = set(csv_template.columns)
-        missing_cols = expected_cols - set(df_import.columns)
-        for col in missing_cols:
-            df_import[col] = None  # add missing columns with None
-
-        # Conflict handling option
-        conflict_option = st.radio(
-            "If duplicate contacts are found (same email):",
-            ["Skip duplicates", "Overwrite existing", "Ask for each"]
+    elif child_item == "📥 Import Contacts":
+        import io
+
+        st.title("📥 Import Contacts (CSV)")
+
+        # CSV template for download
+        st.subheader("Download CSV Template")
+        csv_template = pd.DataFrame([{
+            "first_name": "",
+            "last_name": "",
+            "email": "",
+            "phone": "",
+            "company": "",
+            "brand": "",
+            "customer_type": "",
+            "address": "",
+            "city": "",
+            "state": "",
+            "zip": "",
+            "country": "",
+            "notes": "",
+            "pipeline_stage": "",
+            "hubspot_id": "",
+            "netsuite_id": "",
+            "lifecycle_stage": ""
+        }])
+        csv_buffer = io.StringIO()
+        csv_template.to_csv(csv_buffer, index=False)
+        st.download_button(
+            label="Download CSV Template",
+            data=csv_buffer.getvalue(),
+            file_name="fwd_crm_import_template.csv",
+            mime="text/csv"
         )
 
-        conflicts_found = []
-        imported_count = 0
-
-        for _, row in df_import.iterrows():
-            contact = row.to_dict()
-            contact["environment"] = env_text
-
-            # Check for existing contact
-            existing = [c for c in customers if c.get("email") == contact.get("email")]
-            if existing:
-                if conflict_option == "Skip duplicates":
-                    continue
-                elif conflict_option == "Overwrite existing":
-                    save_or_update_contact(contact, environment=env_text)
-                    imported_count += 1
-                elif conflict_option == "Ask for each":
-                    key = contact.get("email")
+        # Upload and import CSV
+        uploaded_file = st.file_uploader("Upload CSV", type=["csv"])
+        if uploaded_file:
+            df_import = pd.read_csv(uploaded_file, dtype=str)
+            st.write(f"{len(df_import)} contacts found in CSV")
+
+            # Validate columns
+            expected_cols = set(csv_template.columns)
+            missing_cols = expected_cols - set(df_import.columns)
+            for col in missing_cols:
+                df_import[col] = None  # add missing columns with None
+
+            # One staging-table join classifies every row as new or duplicate
+            classified = classify_import(df_import, env_text)
+            conflicts = classified[classified["existing_id"].notna()]
+            st.write(f"{len(classified) - len(conflicts)} new, {len(conflicts)} already exist")
+
+            # Conflict handling option
+            conflict_option = st.radio(
+                "If duplicate contacts are found (same email):",
+                [SKIP_DUPLICATES, OVERWRITE_EXISTING, ASK_FOR_EACH]
+            )
+
+            # Only the actual conflicts need a per-row decision
+            overwrite_emails = []
+            if conflict_option == ASK_FOR_EACH:
+                for key in conflicts["email"].unique():
                     overwrite = st.radio(
                         f"Duplicate found for {key}. Overwrite?",
                         ["Yes", "No"],
                         key=f"dup_{key}"
                     )
                     if overwrite == "Yes":
-                        save_or_update_contact(contact, environment=env_text)
-                        imported_count += 1
-                    else:
-                        continue
-            else:
-                save_or_update_contact(contact, environment=env_text)
-                imported_count += 1
-
-        st.success(f"✅ Imported {imported_count} contacts successfully.")
+                        overwrite_emails.append(key)
+
+            if st.button("Import Contacts"):
+                result = import_contacts(classified, env_text, conflict_option, overwrite_emails)
+                imported_count = result["created"] + result["updated"]
+                st.success(f"✅ Imported {imported_count} contacts successfully.")
+                if result["skipped"]:
+                    st.info(f"Skipped {result['skipped']} duplicates.")
+                if result["unchanged"]:
+                    st.info(f"{result['unchanged']} contacts were already up to date.")
+                for error in result["errors"]:
+                    st.error(f"{error['email']}: {error['error']}")
 
 # -------- Tickets --------
 elif section == "Tickets":
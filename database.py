@@ -1,7 +1,14 @@
+import json
 import sqlite3
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 
+from utils import metrics
+
 # ---------------------------
 # Paths
 # ---------------------------
@@ -14,18 +21,204 @@ os.makedirs(DATA_DIR, exist_ok=True)
 # ---------------------------
 # Database Connection
 # ---------------------------
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# Applied to every new connection. WAL lets dashboard readers run while a
+# migration is writing; NORMAL sync is safe under WAL and avoids an fsync
+# per commit.
+CONNECTION_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -64000,        # ~64 MB page cache
+    "mmap_size": 268435456,      # 256 MB memory-mapped I/O
+    "temp_store": "MEMORY",
+}
+BUSY_TIMEOUT_SECONDS = 30
+MAX_IDLE_CONNECTIONS = 4         # per thread, per flavour
+
+_pool = threading.local()
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that goes back to the thread-local pool on close().
+    Uncommitted work is rolled back, exactly as a real close would discard it.
+    """
+    _pool_key = None
+    _idle = False
+
+    def close(self):
+        if self._pool_key is None:
+            return super().close()
+        if self._idle:
+            return
+        if self.in_transaction:
+            self.rollback()
+        self.row_factory = sqlite3.Row
+        idle = _idle_connections(self._pool_key)
+        if len(idle) < MAX_IDLE_CONNECTIONS:
+            self._idle = True
+            idle.append(self)
+        else:
+            self._pool_key = None
+            super().close()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor whose statements are timed into metrics sql_seconds."""
+
+    def execute(self, sql, *args):
+        with metrics.timer("sql_seconds", family=statement_family(sql)):
+            return super().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        with metrics.timer("sql_seconds", family=statement_family(sql)):
+            return super().executemany(sql, *args)
+
+
+class InstrumentedConnection(PooledConnection):
+    """
+    PooledConnection that times every statement and commit. Only opened
+    while metrics are enabled, so plain runs pay nothing for it.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+    def commit(self):
+        with metrics.timer("sql_seconds", family="COMMIT"):
+            return super().commit()
+
+
+_families = {}
+
+
+def statement_family(sql):
+    """
+    "SELECT customers", "INSERT audit_log", "PRAGMA", ...: the verb plus the
+    first table it touches, the label statements are timed under.
+    """
+    family = _families.get(sql)
+    if family is None:
+        words = sql.replace("(", " ").replace(",", " ").split()
+        verb = words[0].upper() if words else ""
+        upper = [w.upper() for w in words]
+        table = None
+        for marker in ("FROM", "INTO", "UPDATE", "TABLE", "ON"):
+            if marker in upper:
+                i = upper.index(marker) + 1
+                while i < len(words) and upper[i] in ("OR", "REPLACE", "IGNORE", "IF", "NOT", "EXISTS"):
+                    i += 1
+                if i < len(words):
+                    table = words[i]
+                break
+        family = f"{verb} {table}" if table else verb
+        if len(_families) < 1000:
+            _families[sql] = family
+    return family
+
+
+def _idle_connections(key):
+    if not hasattr(_pool, "idle"):
+        _pool.idle = {}
+    return _pool.idle.setdefault(key, [])
+
+
+def _open_connection(read_only):
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_SECONDS,
+        check_same_thread=False,
+        factory=InstrumentedConnection if metrics.enabled() else PooledConnection,
+    )
+    if not read_only:
+        conn.execute("PRAGMA journal_mode=WAL")
+    for name, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    if read_only:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+def get_conn(read_only=False):
+    """
+    Return a tuned connection from the calling thread's pool.
+    Calling close() hands it back instead of closing it.
+    read_only=True gives a query_only connection for dashboard readers.
+    """
+    with metrics.timer("db_get_conn_seconds", read_only=bool(read_only)):
+        key = (DB_PATH, bool(read_only))
+        idle = _idle_connections(key)
+        conn = idle.pop() if idle else _open_connection(read_only)
+    conn._pool_key = key
+    conn._idle = False
     conn.row_factory = sqlite3.Row
     return conn
 
 
+@contextmanager
+def db_session(read_only=False):
+    """
+    Context manager around get_conn().
+    Commits on success, rolls back on error, always returns the connection.
+    """
+    conn = get_conn(read_only=read_only)
+    try:
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def close_all_connections():
+    """
+    Really close every idle connection pooled by the calling thread.
+    """
+    for idle in getattr(_pool, "idle", {}).values():
+        while idle:
+            conn = idle.pop()
+            conn._pool_key = None
+            conn.close()
+
+
 # =========================================================
 # INITIALIZE DATABASE
 # =========================================================
 def init_db():
+    _init_schema()
+    print("✅ Database initialized.")
+
+
+def ensure_schema():
+    """
+    Quietly run init_db once per process for the current DB_PATH.
+    Used by code paths that may run before the dashboard has initialised the DB.
+    """
+    if DB_PATH not in _schema_ready:
+        _init_schema()
+
+
+_schema_ready = set()
+
+
+def _init_schema():
     conn = get_conn()
-    cursor = conn.cursor()
+    _create_base_tables(conn.cursor())
+    conn.commit()
+    migrate_schema(conn)
+    conn.close()
+    _schema_ready.add(DB_PATH)
+
+
+def _create_base_tables(cursor):
 
     # ===============================
     # CUSTOMERS
@@ -165,41 +358,436 @@ def init_db():
     )
     """)
 
-    conn.commit()
-    conn.close()
-    print("✅ Database initialized.")
+
+# Seeded into `states` by schema migration 10
+US_STATES = [
+    ("AL", "Alabama"), ("AK", "Alaska"), ("AZ", "Arizona"), ("AR", "Arkansas"), ("CA", "California"),
+    ("CO", "Colorado"), ("CT", "Connecticut"), ("DE", "Delaware"), ("DC", "District of Columbia"),
+    ("FL", "Florida"), ("GA", "Georgia"), ("HI", "Hawaii"), ("ID", "Idaho"), ("IL", "Illinois"),
+    ("IN", "Indiana"), ("IA", "Iowa"), ("KS", "Kansas"), ("KY", "Kentucky"), ("LA", "Louisiana"),
+    ("ME", "Maine"), ("MD", "Maryland"), ("MA", "Massachusetts"), ("MI", "Michigan"), ("MN", "Minnesota"),
+    ("MS", "Mississippi"), ("MO", "Missouri"), ("MT", "Montana"), ("NE", "Nebraska"), ("NV", "Nevada"),
+    ("NH", "New Hampshire"), ("NJ", "New Jersey"), ("NM", "New Mexico"), ("NY", "New York"),
+    ("NC", "North Carolina"), ("ND", "North Dakota"), ("OH", "Ohio"), ("OK", "Oklahoma"), ("OR", "Oregon"),
+    ("PA", "Pennsylvania"), ("RI", "Rhode Island"), ("SC", "South Carolina"), ("SD", "South Dakota"),
+    ("TN", "Tennessee"), ("TX", "Texas"), ("UT", "Utah"), ("VT", "Vermont"), ("VA", "Virginia"),
+    ("WA", "Washington"), ("WV", "West Virginia"), ("WI", "Wisconsin"), ("WY", "Wyoming"),
+    ("AS", "American Samoa"), ("GU", "Guam"), ("MP", "Northern Mariana Islands"), ("PR", "Puerto Rico"),
+    ("VI", "U.S. Virgin Islands"), ("AA", "Armed Forces Americas"), ("AE", "Armed Forces Europe"),
+    ("AP", "Armed Forces Pacific"),
+]
+
+# =========================================================
+# SCHEMA MIGRATIONS
+# =========================================================
+# Each step runs once, in order, and bumps PRAGMA user_version to its
+# number in the same transaction. Append new steps; never edit old ones.
+SCHEMA_MIGRATIONS = [
+    (1, "id_mappings table", [
+        """
+        CREATE TABLE IF NOT EXISTS id_mappings (
+            id TEXT PRIMARY KEY,
+            source_system TEXT,
+            source_id TEXT,
+            target_system TEXT,
+            target_id TEXT,
+            created_at TEXT
+        )
+        """,
+    ]),
+    (2, "lookup indexes", [
+        # Also the conflict target for the batched contact upsert
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_customers_email_env ON customers (email, environment)",
+        # Covers get_target_id without touching the table
+        "CREATE INDEX IF NOT EXISTS idx_id_mappings_lookup "
+        "ON id_mappings (source_system, source_id, target_system, target_id)",
+        "CREATE INDEX IF NOT EXISTS idx_email_templates_brand "
+        "ON email_templates (brand_id, environment, is_active, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_entity ON audit_log (entity_type, entity_id)",
+    ]),
+    (3, "data version counters", [
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+    ]),
+    (4, "customer grid indexes", [
+        # The dashboard already treats these rows as SANDBOX; store it so
+        # environment filters can use plain index lookups
+        "UPDATE customers SET environment = 'SANDBOX' WHERE environment IS NULL OR environment = ''",
+        # Keyset pagination: one index per sortable column, matching the
+        # COALESCE(col, '') expression the grid queries sort on
+        "CREATE INDEX IF NOT EXISTS idx_customers_env_created ON customers (environment, COALESCE(created_at, ''), id)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_env_last_name ON customers (environment, COALESCE(last_name, ''), id)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_env_company ON customers (environment, COALESCE(company, ''), id)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_env_email ON customers (environment, COALESCE(email, ''), id)",
+        # Grid filters and their COUNT(*) totals
+        "CREATE INDEX IF NOT EXISTS idx_customers_env_brand ON customers (environment, brand)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_env_stage ON customers (environment, pipeline_stage)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_env_type ON customers (environment, customer_type)",
+    ]),
+    (5, "customer_stats aggregates", [
+        # Per-environment customer counts by pipeline_stage, customer_type and
+        # brand, kept current by triggers so every write path updates them
+        """
+        CREATE TABLE IF NOT EXISTS customer_stats (
+            environment TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (environment, dimension, value)
+        ) WITHOUT ROWID
+        """,
+        "DELETE FROM customer_stats",
+        """
+        INSERT INTO customer_stats (environment, dimension, value, count)
+        SELECT COALESCE(environment, ''), 'pipeline_stage', COALESCE(pipeline_stage, ''), COUNT(*)
+        FROM customers GROUP BY 1, 3
+        """,
+        """
+        INSERT INTO customer_stats (environment, dimension, value, count)
+        SELECT COALESCE(environment, ''), 'customer_type', COALESCE(customer_type, ''), COUNT(*)
+        FROM customers GROUP BY 1, 3
+        """,
+        """
+        INSERT INTO customer_stats (environment, dimension, value, count)
+        SELECT COALESCE(environment, ''), 'brand', COALESCE(brand, ''), COUNT(*)
+        FROM customers GROUP BY 1, 3
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_customer_stats_insert AFTER INSERT ON customers
+        BEGIN
+            INSERT INTO customer_stats (environment, dimension, value, count) VALUES
+                (COALESCE(NEW.environment, ''), 'pipeline_stage', COALESCE(NEW.pipeline_stage, ''), 1),
+                (COALESCE(NEW.environment, ''), 'customer_type', COALESCE(NEW.customer_type, ''), 1),
+                (COALESCE(NEW.environment, ''), 'brand', COALESCE(NEW.brand, ''), 1)
+            ON CONFLICT(environment, dimension, value) DO UPDATE SET count = count + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_customer_stats_delete AFTER DELETE ON customers
+        BEGIN
+            UPDATE customer_stats SET count = count - 1
+            WHERE environment = COALESCE(OLD.environment, '') AND dimension = 'pipeline_stage' AND value = COALESCE(OLD.pipeline_stage, '');
+            UPDATE customer_stats SET count = count - 1
+            WHERE environment = COALESCE(OLD.environment, '') AND dimension = 'customer_type' AND value = COALESCE(OLD.customer_type, '');
+            UPDATE customer_stats SET count = count - 1
+            WHERE environment = COALESCE(OLD.environment, '') AND dimension = 'brand' AND value = COALESCE(OLD.brand, '');
+            DELETE FROM customer_stats WHERE environment = COALESCE(OLD.environment, '') AND count <= 0;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_customer_stats_update
+        AFTER UPDATE OF environment, pipeline_stage, customer_type, brand ON customers
+        WHEN OLD.environment IS NOT NEW.environment
+          OR OLD.pipeline_stage IS NOT NEW.pipeline_stage
+          OR OLD.customer_type IS NOT NEW.customer_type
+          OR OLD.brand IS NOT NEW.brand
+        BEGIN
+            UPDATE customer_stats SET count = count - 1
+            WHERE environment = COALESCE(OLD.environment, '') AND dimension = 'pipeline_stage' AND value = COALESCE(OLD.pipeline_stage, '');
+            UPDATE customer_stats SET count = count - 1
+            WHERE environment = COALESCE(OLD.environment, '') AND dimension = 'customer_type' AND value = COALESCE(OLD.customer_type, '');
+            UPDATE customer_stats SET count = count - 1
+            WHERE environment = COALESCE(OLD.environment, '') AND dimension = 'brand' AND value = COALESCE(OLD.brand, '');
+            DELETE FROM customer_stats WHERE environment = COALESCE(OLD.environment, '') AND count <= 0;
+            INSERT INTO customer_stats (environment, dimension, value, count) VALUES
+                (COALESCE(NEW.environment, ''), 'pipeline_stage', COALESCE(NEW.pipeline_stage, ''), 1),
+                (COALESCE(NEW.environment, ''), 'customer_type', COALESCE(NEW.customer_type, ''), 1),
+                (COALESCE(NEW.environment, ''), 'brand', COALESCE(NEW.brand, ''), 1)
+            ON CONFLICT(environment, dimension, value) DO UPDATE SET count = count + 1;
+        END
+        """,
+    ]),
+    (6, "sync watermarks", [
+        # Incremental HubSpot sync position per object type and environment
+        """
+        CREATE TABLE IF NOT EXISTS sync_watermarks (
+            object_type TEXT NOT NULL,
+            environment TEXT NOT NULL,
+            modified_ms INTEGER NOT NULL,
+            last_id TEXT NOT NULL,
+            updated_at TEXT,
+            PRIMARY KEY (object_type, environment)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (7, "change fingerprints", [
+        # Hash of the mapped fields last written; equal hash = nothing to update
+        "ALTER TABLE customers ADD COLUMN fingerprint TEXT",
+        "ALTER TABLE id_mappings ADD COLUMN fingerprint TEXT",
+    ]),
+    (8, "migration runs", [
+        # One row per migration run; status is running, failed or completed
+        """
+        CREATE TABLE IF NOT EXISTS migration_runs (
+            run_id TEXT PRIMARY KEY,
+            job TEXT NOT NULL,
+            environment TEXT NOT NULL,
+            status TEXT NOT NULL,
+            started_at TEXT,
+            updated_at TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_migration_runs_job ON migration_runs (job, environment, started_at)",
+        # Where each object type of a run got to, saved with the batch it covers
+        """
+        CREATE TABLE IF NOT EXISTS run_checkpoints (
+            run_id TEXT NOT NULL,
+            object_type TEXT NOT NULL,
+            cursor TEXT,
+            batch INTEGER NOT NULL,
+            records INTEGER NOT NULL,
+            complete INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT,
+            PRIMARY KEY (run_id, object_type)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (9, "id sequences", [
+        # Next unreserved number per ID sequence; see generate_id
+        """
+        CREATE TABLE IF NOT EXISTS id_sequences (
+            name TEXT PRIMARY KEY,
+            next_value INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (10, "US states", [
+        # Reference rows for contact validation (services/validation.py)
+        "INSERT OR IGNORE INTO states (code, name) VALUES "
+        + ", ".join(f"('{code}', '{name}')" for code, name in US_STATES),
+    ]),
+    (11, "lowercase customer emails", [
+        # Contacts are matched on their normalised (lowercased) email. Rows
+        # whose email differs only in case from another row's are real
+        # duplicates: they keep their email until merged by hand.
+        """
+        UPDATE customers SET email = lower(trim(email))
+        WHERE email <> lower(trim(email))
+          AND NOT EXISTS (
+              SELECT 1 FROM customers other
+              WHERE other.id <> customers.id AND lower(trim(other.email)) = lower(trim(customers.email))
+          )
+        """,
+        "UPDATE data_versions SET version = version + 1 WHERE name = 'customers'",
+    ]),
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate_schema(conn):
+    """
+    Apply every SCHEMA_MIGRATIONS step newer than the database's user_version.
+    The version is re-read under a write lock, so concurrent callers never
+    apply the same step twice.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    for version, description, statements in SCHEMA_MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= schema_version(conn):
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"✅ Schema migration {version} applied: {description}")
+
+
+# =========================================================
+# DATA VERSIONS
+# =========================================================
+# One counter per dataset ("customers", "brands", "templates"). Every write
+# bumps its counter in the same transaction, so readers can key caches on
+# the version and drop them exactly when the data changes.
+def bump_data_version(conn, *names):
+    conn.executemany("""
+        INSERT INTO data_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    """, [(name,) for name in names])
+
+
+def get_data_versions():
+    ensure_schema()
+    with db_session(read_only=True) as conn:
+        rows = conn.execute("SELECT name, version FROM data_versions").fetchall()
+    return {r["name"]: r["version"] for r in rows}
+
+
+# =========================================================
+# SYNC WATERMARKS
+# =========================================================
+# (modified_ms, last_id) of the newest HubSpot record an incremental sync
+# has fully processed. The next run asks HubSpot for records modified at or
+# after its millisecond (records sharing it are processed again).
+def get_sync_watermark(object_type, environment):
+    ensure_schema()
+    with db_session(read_only=True) as conn:
+        row = conn.execute("""
+            SELECT modified_ms, last_id FROM sync_watermarks
+            WHERE object_type=? AND environment=?
+        """, (object_type, environment)).fetchone()
+    return (row["modified_ms"], row["last_id"]) if row else None
+
+
+def save_sync_watermark(object_type, environment, watermark, conn=None):
+    """
+    Store watermark; pass conn to save it in the caller's transaction.
+    """
+    if conn is None:
+        ensure_schema()
+        with db_session() as conn:
+            return save_sync_watermark(object_type, environment, watermark, conn)
+    modified_ms, last_id = watermark
+    conn.execute("""
+        INSERT INTO sync_watermarks (object_type, environment, modified_ms, last_id, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(object_type, environment) DO UPDATE SET
+            modified_ms = excluded.modified_ms,
+            last_id = excluded.last_id,
+            updated_at = excluded.updated_at
+    """, (object_type, environment, int(modified_ms), str(last_id), datetime.now().isoformat()))
+
+
+def reset_sync_watermark(object_type, environment):
+    ensure_schema()
+    with db_session() as conn:
+        conn.execute(
+            "DELETE FROM sync_watermarks WHERE object_type=? AND environment=?",
+            (object_type, environment)
+        )
+
+
+# =========================================================
+# MIGRATION RUNS
+# =========================================================
+# A run records, per object type, a cursor into its source and the number of
+# the last committed batch. Checkpoints are written in the same transaction
+# as the batch they cover, so a resumed run starts exactly after the last
+# batch that really landed.
+def start_migration_run(job, environment, resume=False):
+    """
+    Return the run id to use for job in environment.
+    resume=True picks up the newest run of that job that did not complete;
+    otherwise (or when there is none) a new run is started.
+    """
+    ensure_schema()
+    now = datetime.now().isoformat()
+    with db_session() as conn:
+        row = None
+        if resume:
+            row = conn.execute("""
+                SELECT run_id FROM migration_runs
+                WHERE job=? AND environment=? AND status != 'completed'
+                ORDER BY started_at DESC LIMIT 1
+            """, (job, environment)).fetchone()
+        if row:
+            run_id = row["run_id"]
+            conn.execute(
+                "UPDATE migration_runs SET status='running', updated_at=? WHERE run_id=?",
+                (now, run_id)
+            )
+        else:
+            run_id = generate_id("RUN", "migration_runs")
+            conn.execute("""
+                INSERT INTO migration_runs (run_id, job, environment, status, started_at, updated_at)
+                VALUES (?, ?, ?, 'running', ?, ?)
+            """, (run_id, job, environment, now, now))
+    return run_id
+
+
+def finish_migration_run(run_id, status="completed"):
+    ensure_schema()
+    with db_session() as conn:
+        conn.execute(
+            "UPDATE migration_runs SET status=?, updated_at=? WHERE run_id=?",
+            (status, datetime.now().isoformat(), run_id)
+        )
+
+
+def get_run_checkpoint(run_id, object_type):
+    """
+    {"cursor", "batch", "records", "complete"} saved for object_type, or None.
+    """
+    ensure_schema()
+    with db_session(read_only=True) as conn:
+        row = conn.execute("""
+            SELECT cursor, batch, records, complete FROM run_checkpoints
+            WHERE run_id=? AND object_type=?
+        """, (run_id, object_type)).fetchone()
+    if not row:
+        return None
+    return {
+        "cursor": json.loads(row["cursor"]) if row["cursor"] else None,
+        "batch": row["batch"],
+        "records": row["records"],
+        "complete": bool(row["complete"]),
+    }
+
+
+def save_run_checkpoint(run_id, object_type, cursor, batch, records, complete=False, conn=None):
+    """
+    Store a run's position; pass conn to save it in the batch's transaction.
+    cursor is any JSON-serialisable position understood by the source.
+    """
+    if conn is None:
+        ensure_schema()
+        with db_session() as conn:
+            return save_run_checkpoint(run_id, object_type, cursor, batch, records, complete, conn)
+    now = datetime.now().isoformat()
+    conn.execute("""
+        INSERT INTO run_checkpoints (run_id, object_type, cursor, batch, records, complete, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(run_id, object_type) DO UPDATE SET
+            cursor = excluded.cursor,
+            batch = excluded.batch,
+            records = excluded.records,
+            complete = excluded.complete,
+            updated_at = excluded.updated_at
+    """, (run_id, object_type, json.dumps(cursor), int(batch), int(records), int(complete), now))
+    conn.execute("UPDATE migration_runs SET updated_at=? WHERE run_id=?", (now, run_id))
 
 
 # =========================================================
 # BRAND FUNCTIONS
 # =========================================================
 def fetch_brands(environment):
-    conn = get_conn()
-    rows = conn.execute(
-        "SELECT * FROM brands WHERE environment=? ORDER BY name",
-        (environment,)
-    ).fetchall()
-    conn.close()
+    with db_session(read_only=True) as conn:
+        rows = conn.execute(
+            "SELECT * FROM brands WHERE environment=? ORDER BY name",
+            (environment,)
+        ).fetchall()
     return [dict(r) for r in rows]
 
 
 def create_brand(name, environment):
-    conn = get_conn()
-    conn.execute(
-        "INSERT OR IGNORE INTO brands (name, environment, created_at) VALUES (?, ?, ?)",
-        (name, environment, datetime.now().isoformat())
-    )
-    conn.commit()
-    conn.close()
+    with db_session() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO brands (name, environment, created_at) VALUES (?, ?, ?)",
+            (name, environment, datetime.now().isoformat())
+        )
+        bump_data_version(conn, "brands")
 
 
 def get_brand_by_name(name, environment):
-    conn = get_conn()
-    row = conn.execute(
-        "SELECT * FROM brands WHERE name=? AND environment=?",
-        (name, environment)
-    ).fetchone()
-    conn.close()
+    with db_session(read_only=True) as conn:
+        row = conn.execute(
+            "SELECT * FROM brands WHERE name=? AND environment=?",
+            (name, environment)
+        ).fetchone()
     return dict(row) if row else None
 
 
@@ -207,85 +795,313 @@ def get_brand_by_name(name, environment):
 # TEMPLATE FUNCTIONS
 # =========================================================
 def fetch_templates_by_brand(brand_id, environment):
-    conn = get_conn()
-    rows = conn.execute("""
-        SELECT * FROM email_templates
-        WHERE brand_id=? AND environment=? AND is_active=1
-        ORDER BY created_at DESC
-    """, (brand_id, environment)).fetchall()
-    conn.close()
+    with db_session(read_only=True) as conn:
+        rows = conn.execute("""
+            SELECT * FROM email_templates
+            WHERE brand_id=? AND environment=? AND is_active=1
+            ORDER BY created_at DESC
+        """, (brand_id, environment)).fetchall()
     return [dict(r) for r in rows]
 
 
 def create_template(brand_id, name, subject, body, image_url, environment):
-    conn = get_conn()
-    conn.execute("""
-        INSERT INTO email_templates
-        (brand_id, name, subject, body, image_url, environment, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (
-        brand_id,
-        name,
-        subject,
-        body,
-        image_url,
-        environment,
-        datetime.now().isoformat()
-    ))
-    conn.commit()
-    conn.close()
+    with db_session() as conn:
+        conn.execute("""
+            INSERT INTO email_templates
+            (brand_id, name, subject, body, image_url, environment, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            brand_id,
+            name,
+            subject,
+            body,
+            image_url,
+            environment,
+            datetime.now().isoformat()
+        ))
+        bump_data_version(conn, "templates")
 
 
 def deactivate_template(template_id):
-    conn = get_conn()
-    conn.execute("""
-        UPDATE email_templates
-        SET is_active=0, updated_at=?
-        WHERE id=?
-    """, (datetime.now().isoformat(), template_id))
-    conn.commit()
-    conn.close()
+    with db_session() as conn:
+        conn.execute("""
+            UPDATE email_templates
+            SET is_active=0, updated_at=?
+            WHERE id=?
+        """, (datetime.now().isoformat(), template_id))
+        bump_data_version(conn, "templates")
 
 
 # =========================================================
 # EXISTING FETCH FUNCTIONS
 # =========================================================
 def fetch_customers(environment=None):
-    conn = get_conn()
-    cursor = conn.cursor()
-    if environment:
-        cursor.execute("SELECT * FROM customers WHERE environment = ?", (environment,))
-    else:
-        cursor.execute("SELECT * FROM customers")
-    rows = cursor.fetchall()
-    conn.close()
+    with db_session(read_only=True) as conn:
+        if environment:
+            rows = conn.execute("SELECT * FROM customers WHERE environment = ?", (environment,)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM customers").fetchall()
     return [dict(row) for row in rows]
 
 
+def fetch_environment_customers(environment):
+    """
+    Customers of one environment, filtered in SQL.
+    Rows written before environments existed (NULL or empty) count as SANDBOX.
+    """
+    with db_session(read_only=True) as conn:
+        rows = conn.execute("""
+            SELECT * FROM customers
+            WHERE environment = ?
+            OR (? = 'SANDBOX' AND (environment IS NULL OR environment = ''))
+        """, (environment, environment)).fetchall()
+    customers = [dict(row) for row in rows]
+    for c in customers:
+        if not c["environment"]:
+            c["environment"] = "SANDBOX"
+    return customers
+
+
+# =========================================================
+# CUSTOMER GRID (keyset pagination)
+# =========================================================
+GRID_COLUMNS = [
+    "id", "first_name", "last_name", "email", "phone", "company", "brand",
+    "pipeline_stage", "customer_type", "city", "state", "created_at",
+]
+GRID_SORT_COLUMNS = ["created_at", "last_name", "company", "email"]
+GRID_FILTER_COLUMNS = ["brand", "pipeline_stage", "customer_type"]
+
+
+def _grid_where(environment, filters):
+    clauses, params = ["environment = ?"], [environment]
+    for column in GRID_FILTER_COLUMNS:
+        value = (filters or {}).get(column)
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    return clauses, params
+
+
+def fetch_customer_page(environment, filters=None, sort_by="created_at", descending=False,
+                        after=None, page_size=50):
+    """
+    One page of the customer grid.
+    after is the cursor returned with the previous page (None for the first).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if sort_by not in GRID_SORT_COLUMNS:
+        raise ValueError(f"Cannot sort customers by {sort_by!r}")
+    sort_expr = f"COALESCE({sort_by}, '')"
+    clauses, params = _grid_where(environment, filters)
+    if after is not None:
+        # Spelled out rather than as a row-value compare so SQLite can seek
+        # the index to the cursor instead of scanning up to it
+        op = "<" if descending else ">"
+        clauses.append(f"{sort_expr} {op}= ? AND ({sort_expr} {op} ? OR id {op} ?)")
+        params.extend([after[0], after[0], after[1]])
+    direction = "DESC" if descending else "ASC"
+
+    with db_session(read_only=True) as conn:
+        rows = conn.execute(f"""
+            SELECT {", ".join(GRID_COLUMNS)}, {sort_expr} AS _sort_key FROM customers
+            WHERE {" AND ".join(clauses)}
+            ORDER BY {sort_expr} {direction}, id {direction}
+            LIMIT ?
+        """, params + [page_size + 1]).fetchall()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = (rows[-1]["_sort_key"], rows[-1]["id"]) if has_more else None
+    return [{c: r[c] for c in GRID_COLUMNS} for r in rows], next_cursor
+
+
+def count_customers(environment, filters=None):
+    clauses, params = _grid_where(environment, filters)
+    with db_session(read_only=True) as conn:
+        return conn.execute(
+            f"SELECT COUNT(*) FROM customers WHERE {' AND '.join(clauses)}", params
+        ).fetchone()[0]
+
+
 def fetch_pipeline_stages(environment=None):
-    conn = get_conn()
-    cursor = conn.cursor()
-    if environment:
-        cursor.execute("SELECT * FROM pipeline_stages WHERE environment = ?", (environment,))
-    else:
-        cursor.execute("SELECT * FROM pipeline_stages")
-    rows = cursor.fetchall()
-    conn.close()
+    with db_session(read_only=True) as conn:
+        if environment:
+            rows = conn.execute("SELECT * FROM pipeline_stages WHERE environment = ?", (environment,)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM pipeline_stages").fetchall()
     return [dict(row) for row in rows]
 
 
 def fetch_tickets(environment=None):
-    conn = get_conn()
-    cursor = conn.cursor()
-    if environment:
-        cursor.execute("SELECT * FROM tickets WHERE environment = ?", (environment,))
-    else:
-        cursor.execute("SELECT * FROM tickets")
-    rows = cursor.fetchall()
-    conn.close()
+    with db_session(read_only=True) as conn:
+        if environment:
+            rows = conn.execute("SELECT * FROM tickets WHERE environment = ?", (environment,)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM tickets").fetchall()
     return [dict(row) for row in rows]
 
-import uuid
+# =========================================================
+# ID GENERATION
+# =========================================================
+# "sequence" (default): CUST-000000000042. Numbers come from the
+#     id_sequences table in reserved blocks of ID_BLOCK_SIZE, so a worker
+#     touches the table once per block and concurrent workers (threads or
+#     processes) never share a number. Zero padding keeps text order equal
+#     to numeric order, so new rows append at the end of the primary key
+#     index instead of splitting pages all over it.
+# "ulid" / "uuid7": time-ordered random ids (CUST-01J9...); no table needed,
+#     for ids that must stay unique across separate databases.
+ID_FORMAT = "sequence"
+ID_BLOCK_SIZE = 1000
+ID_DIGITS = 12
+
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+class IdAllocator:
+    """
+    Hands out monotonic numbers per sequence from blocks reserved in the
+    id_sequences table. Numbers left in a block when the process exits are
+    skipped, never reused.
+    reserve(sequence, count, conn) reserves count numbers and returns the
+    first; the dry-run allocator counts in memory instead.
+    """
+
+    def __init__(self, block_size=ID_BLOCK_SIZE, reserve=None):
+        self.block_size = block_size
+        self.reserve = reserve or _reserve_ids
+        self._blocks = {}            # (DB_PATH, sequence) -> [next, end)
+        self._lock = threading.Lock()
+
+    def allocate(self, sequence, count=1, conn=None):
+        """
+        First of count consecutive numbers; they are all reserved.
+        conn: the caller's connection. When it holds a write transaction and
+        the current block is short, exactly count numbers are reserved in
+        that transaction (a second connection would wait for the caller's
+        own lock) and not cached, so a rollback cannot leave numbers handed
+        out that the table does not account for.
+        """
+        key = (DB_PATH, sequence)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None or block[1] - block[0] < count:
+                if conn is not None and conn.in_transaction:
+                    return self.reserve(sequence, count, conn)
+                # A partial block is dropped rather than stitched to the next
+                # one: the numbers handed out must be consecutive
+                start = self.reserve(sequence, max(count, self.block_size))
+                block = self._blocks[key] = [start, start + max(count, self.block_size)]
+            first = block[0]
+            block[0] += count
+        return first
+
+    def reset(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+def _reserve_ids(sequence, count, conn=None):
+    """
+    Reserve count numbers of sequence; returns the first. One upsert, so
+    the read-and-bump is atomic under SQLite's write lock. Without conn it
+    runs on its own pooled connection and commits at once; with conn it
+    becomes part of that connection's transaction.
+    """
+    if conn is None:
+        ensure_schema()
+        with db_session() as conn:
+            return _reserve_ids(sequence, count, conn)
+    end = conn.execute("""
+        INSERT INTO id_sequences (name, next_value) VALUES (?, 1 + ?)
+        ON CONFLICT(name) DO UPDATE SET next_value = next_value + excluded.next_value - 1
+        RETURNING next_value
+    """, (sequence, count)).fetchone()[0]
+    return end - count
+
+
+_dry_run_next = {}                   # (DB_PATH, sequence) -> next number
+
+
+def _reserve_in_memory(sequence, count, conn=None):
+    """Dry runs: numbers from a per-process counter; nothing is written."""
+    key = (DB_PATH, sequence)
+    first = _dry_run_next.get(key, 1)
+    _dry_run_next[key] = first + count
+    return first
+
+
+_allocator = IdAllocator()
+_dry_run_allocator = IdAllocator(reserve=_reserve_in_memory)
+
+_time_lock = threading.Lock()
+_last_time_id = {}                   # bits -> (ms, random part)
+
+
+def _time_ordered(bits):
+    """
+    (ms, random int of `bits` bits). Within one millisecond the random part
+    is incremented instead of redrawn, so ids from one process stay sorted.
+    """
+    with _time_lock:
+        ms = time.time_ns() // 1_000_000
+        last = _last_time_id.get(bits)
+        if last and ms <= last[0] and last[1] + 1 < (1 << bits):
+            ms, rand = last[0], last[1] + 1
+        else:
+            rand = int.from_bytes(os.urandom((bits + 7) // 8), "big") >> (-bits % 8)
+        _last_time_id[bits] = (ms, rand)
+    return ms, rand
+
+
+def ulid():
+    """26-character Crockford base32 ULID: 48-bit ms timestamp + 80 random bits."""
+    ms, rand = _time_ordered(80)
+    value = (ms << 80) | rand
+    return "".join(_CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+def uuid7():
+    """RFC 9562 UUIDv7 string: 48-bit ms timestamp, then 74 random bits."""
+    ms, rand = _time_ordered(74)
+    value = (ms << 80) | (0x7 << 76) | ((rand >> 62) << 64) | (0b10 << 62) | (rand & ((1 << 62) - 1))
+    return str(uuid.UUID(int=value))
+
+
+def _format_id(prefix, number):
+    return f"{prefix}-{number:0{ID_DIGITS}d}"
+
+
+def generate_id(prefix="ID", sequence=None, id_format=None, dry_run=False, conn=None):
+    """
+    New key "<prefix>-<id>" in ID_FORMAT (or id_format). sequence names the
+    counter to draw from (e.g. "customers"); it defaults to prefix.
+    dry_run: number from an in-memory counter, so nothing is reserved.
+    conn: the caller's connection, if it may hold a write transaction
+    (see IdAllocator.allocate).
+    """
+    id_format = id_format or ID_FORMAT
+    if id_format == "sequence":
+        allocator = _dry_run_allocator if dry_run else _allocator
+        return _format_id(prefix, allocator.allocate(sequence or prefix, conn=conn))
+    if id_format == "ulid":
+        return f"{prefix}-{ulid()}"
+    if id_format == "uuid7":
+        return f"{prefix}-{uuid7()}"
+    raise ValueError(f"Unknown ID format {id_format!r}")
+
 
-def generate_id(prefix="ID"):
-    return f"{prefix}-{uuid.uuid4().hex[:8].upper()}"
\ No newline at end of file
+def generate_ids(prefix, count, sequence=None, id_format=None, dry_run=False, conn=None):
+    """
+    count keys at once; a sequence reserves them in one step, in order.
+    dry_run and conn as for generate_id.
+    """
+    id_format = id_format or ID_FORMAT
+    if count <= 0:
+        return []
+    if id_format == "sequence":
+        allocator = _dry_run_allocator if dry_run else _allocator
+        first = allocator.allocate(sequence or prefix, count, conn=conn)
+        return [_format_id(prefix, n) for n in range(first, first + count)]
+    return [generate_id(prefix, sequence, id_format) for _ in range(count)]
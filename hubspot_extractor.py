@@ -1,31 +1,243 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from utils import metrics
+
+# HubSpot CRM v3 list endpoints accept at most 100 records per page
+MAX_PAGE_SIZE = 100
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# CRM search: at most 200 records per page, and paging stops at 10,000
+# results per query, so long runs restart from the last modified time seen
+SEARCH_PAGE_SIZE = 200
+SEARCH_RESULT_LIMIT = 10_000
+
+# Last-modified property per object type (contacts predate the hs_ name)
+MODIFIED_PROPERTIES = {
+    'contacts': 'lastmodifieddate',
+    'companies': 'hs_lastmodifieddate',
+    'deals': 'hs_lastmodifieddate',
+}
+
+
 class HubSpotExtractor:
-    def __init__(self, config):
+    def __init__(self, config, session=None):
         self.config = config
         self.batch_size = config['migration'].get('batch_size', 50)
         self.dry_run = config['migration'].get('dry_run', True)
 
-    def fetch_contacts(self):
+        hubspot = config.get('hubspot', {})
+        self.api_key = hubspot.get('api_key')
+        self.endpoints = hubspot.get('endpoints', {})
+        self.properties = hubspot.get('properties', {})
+        self.associations = hubspot.get('associations', {})
+        self.timeout = hubspot.get('request_timeout', 30)
+        self.max_retries = hubspot.get('max_retries', 5)
+        self.modified_properties = dict(MODIFIED_PROPERTIES, **hubspot.get('modified_properties', {}))
+        self.page_size = max(1, min(self.batch_size, MAX_PAGE_SIZE))
+        self.session = session or requests.Session()
+
+    def fetch(self, object_type, start=None):
+        """
+        Every record of object_type (contacts, companies or deals).
+        start is a `_cursor` from an earlier run to continue after.
+        """
+        return getattr(self, f'fetch_{object_type}')(start)
+
+    def fetch_contacts(self, start=None):
         if self.dry_run:
             print(f"[Dry-run] Would fetch up to {self.batch_size} contacts")
-            return [
+            yield from [
                 {'id': '1001', 'first_name': 'Alice', 'last_name': 'Smith', 'email': 'alice@example.com'},
                 {'id': '1002', 'first_name': 'Bob', 'last_name': 'Jones', 'email': 'bob@example.com'}
             ]
-        # Real API logic goes here
-        return []
+            return
+        yield from self.iter_objects('contacts', start)
 
-    def fetch_companies(self):
+    def fetch_companies(self, start=None):
         if self.dry_run:
-            return [
+            yield from [
                 {'id': '2001', 'name': 'Acme Corp'},
                 {'id': '2002', 'name': 'Beta LLC'}
             ]
-        return []
+            return
+        yield from self.iter_objects('companies', start)
 
-    def fetch_deals(self):
+    def fetch_deals(self, start=None):
         if self.dry_run:
-            return [
+            yield from [
                 {'id': '3001', 'title': 'Deal One', 'amount': 1000},
                 {'id': '3002', 'title': 'Deal Two', 'amount': 2000}
             ]
-        return []
+            return
+        yield from self.iter_objects('deals', start)
+
+    # ---------------------------
+    # CRM v3 paging
+    # ---------------------------
+    def iter_objects(self, object_type, start=None):
+        """
+        Yield every record of object_type, one page of batch_size at a time.
+        The next page is requested in the background while the current one
+        is being consumed, so at most two pages are held in memory.
+        Records carry `_cursor`, [page token, records done in that page]:
+        pass it back as start to continue right after that record.
+        """
+        page_after, skip = start or (None, 0)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = pool.submit(self.fetch_page, object_type, page_after)
+            while pending is not None:
+                page = pending.result()
+                after = page.get('paging', {}).get('next', {}).get('after')
+                pending = pool.submit(self.fetch_page, object_type, after) if after else None
+                for index, result in enumerate(page.get('results', [])):
+                    if index < skip:
+                        continue
+                    record = self._flatten(result)
+                    record['_cursor'] = [page_after, index + 1]
+                    yield record
+                page_after, skip = after, 0
+
+    # ---------------------------
+    # Incremental sync (CRM v3 search)
+    # ---------------------------
+    def fetch_changed(self, object_type, watermark=None):
+        """
+        Yield records of object_type modified at or after watermark, oldest
+        first. watermark is (modified_ms, record_id) from a previous run, or
+        None for everything. Records carry `_watermark`, the position to save
+        once they have been processed.
+        Search sorts by modified time only, so records sharing a millisecond
+        come back in no fixed order: every record of the watermark's
+        millisecond is processed again (loads are idempotent) rather than
+        trusting the saved id to mark where the previous run stopped.
+        """
+        if self.dry_run:
+            print(f"[Dry-run] Would search {object_type} modified after {watermark}")
+            for record in self.fetch(object_type):
+                record['_watermark'] = (0, record['id'])
+                if watermark is None or record['_watermark'][0] >= watermark[0]:
+                    yield record
+            return
+
+        since = watermark[0] if watermark else 0
+        # Ids already yielded at the newest modified time seen, so a query
+        # restarted at that millisecond does not yield them twice
+        newest, seen = None, set()
+        while True:
+            restart = None
+            for page in self._iter_search_pages(object_type, since):
+                for result in page.get('results', []):
+                    record = self._flatten(result)
+                    modified = self._modified_ms(object_type, result)
+                    record['_watermark'] = (modified, record['id'])
+                    if modified < since or (modified == newest and record['id'] in seen):
+                        continue
+                    if modified != newest:
+                        newest, seen = modified, set()
+                    seen.add(record['id'])
+                    yield record
+                if page.get('_truncated'):
+                    restart = since if newest is None else newest
+            if restart is None:
+                return
+            if restart == since:
+                raise RuntimeError(
+                    f"More than {SEARCH_RESULT_LIMIT} {object_type} share modified time {since}"
+                )
+            since = restart
+
+    def _iter_search_pages(self, object_type, since_ms):
+        """
+        Search pages for one query, prefetching the next page like iter_objects.
+        The last page before the result limit is marked `_truncated`.
+        """
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = pool.submit(self.search_page, object_type, since_ms, None)
+            while pending is not None:
+                page = pending.result()
+                after = page.get('paging', {}).get('next', {}).get('after')
+                if after and int(after) >= SEARCH_RESULT_LIMIT:
+                    page['_truncated'] = True
+                    after = None
+                pending = pool.submit(self.search_page, object_type, since_ms, after) if after else None
+                yield page
+
+    def search_page(self, object_type, since_ms, after=None):
+        """
+        POST one page of records modified at or after since_ms, sorted by
+        modification time ascending.
+        """
+        modified = self.modified_properties[object_type]
+        body = {
+            'filterGroups': [{'filters': [
+                {'propertyName': modified, 'operator': 'GTE', 'value': str(since_ms)},
+            ]}],
+            'sorts': [{'propertyName': modified, 'direction': 'ASCENDING'}],
+            'limit': min(SEARCH_PAGE_SIZE, max(self.batch_size, 1)),
+        }
+        properties = self.properties.get(object_type)
+        if properties:
+            body['properties'] = list(properties) + [modified]
+        if after:
+            body['after'] = after
+        with metrics.timer('hubspot_page_seconds', object_type=object_type, endpoint='search'):
+            page = self._request('POST', self.endpoints[object_type].rstrip('/') + '/search', json=body)
+        metrics.count('hubspot_records_total', len(page.get('results', [])), object_type=object_type)
+        return page
+
+    def _modified_ms(self, object_type, result):
+        properties = result.get('properties') or {}
+        value = properties.get(self.modified_properties[object_type]) or result.get('updatedAt')
+        return _to_ms(value)
+
+    def fetch_page(self, object_type, after=None):
+        """
+        GET one page from the configured endpoint, retrying 429/5xx with backoff.
+        """
+        params = {'limit': self.page_size, 'archived': 'false'}
+        properties = self.properties.get(object_type)
+        if properties:
+            params['properties'] = ','.join(properties)
+        associations = self.associations.get(object_type)
+        if associations:
+            params['associations'] = ','.join(associations)
+        if after:
+            params['after'] = after
+        with metrics.timer('hubspot_page_seconds', object_type=object_type, endpoint='list'):
+            page = self._request('GET', self.endpoints[object_type], params=params)
+        metrics.count('hubspot_records_total', len(page.get('results', [])), object_type=object_type)
+        return page
+
+    def _request(self, method, url, **kwargs):
+        headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+        for attempt in range(self.max_retries + 1):
+            response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                response.raise_for_status()
+                return response.json()
+            metrics.count('hubspot_retries_total', status=response.status_code)
+            retry_after = response.headers.get('Retry-After')
+            time.sleep(float(retry_after) if retry_after else min(2 ** attempt, 30))
+
+    @staticmethod
+    def _flatten(result):
+        record = dict(result.get('properties') or {})
+        record['id'] = result.get('id')
+        record['hubspot_id'] = result.get('id')
+        if result.get('associations'):
+            record['associations'] = result['associations']
+        return record
+
+
+def _to_ms(value):
+    """HubSpot timestamp (ISO string or epoch ms) as epoch milliseconds."""
+    if not value:
+        return 0
+    if str(value).isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp() * 1000)
+
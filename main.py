@@ -1,11 +1,33 @@
-from utils.helpers import load_config, load_id_map, update_id_map
+import argparse
+import threading
+
+from database import finish_migration_run, get_run_checkpoint, get_sync_watermark, start_migration_run
+from pipeline import LoadRegistry, ObjectStage, RunCheckpoint, WatermarkCheckpoint, run_pipeline
+from utils import field_mapping, metrics
+from utils.helpers import load_config, load_id_map
 from hubspot_extractor import HubSpotExtractor
 from netsuite_loader import NetSuiteLoader
 
-def main(dry_run=True):
+# HubSpot object type -> NetSuiteLoader method
+OBJECT_LOADERS = [
+    ("contacts", "load_customer"),
+    ("companies", "load_company"),
+    ("deals", "load_deal"),
+]
+
+def mapped_loader(load, mapper):
+    """load(record) that sends mapper(record) instead, keeping the source id."""
+    def load_mapped(record):
+        return load(dict(mapper(record), id=record['id']))
+    return load_mapped
+
+
+def main(dry_run=True, incremental=None, resume=False):
     print("=== HubSpot → NetSuite MVP ===\n")
 
     config = load_config()
+    metrics.configure(config)
+    field_mapping.configure(config)
     id_map = load_id_map()
     extractor = HubSpotExtractor(config)
     loader = NetSuiteLoader(config, id_map=id_map)
@@ -18,34 +40,92 @@ def main(dry_run=True):
         if confirm != 'PROD':
             raise RuntimeError("Aborted by user.")
 
-    # === Process Contacts ===
-    contacts = extractor.fetch_contacts()
-    for c in contacts:
-        if c['id'] in id_map:
-            print(f"[Dry-run] Skipping {c['id']}, already in ID map")
-            continue
-        loader.load_customer(c)
-        update_id_map(c['id'], f"NS-{c['id']}", id_map)
-
-    # === Process Companies ===
-    companies = extractor.fetch_companies()
-    for comp in companies:
-        if comp['id'] in id_map:
-            continue
-        loader.load_company(comp)
-        update_id_map(comp['id'], f"NS-{comp['id']}", id_map)
-
-    # === Process Deals ===
-    deals = extractor.fetch_deals()
-    for deal in deals:
-        if deal['id'] in id_map:
-            continue
-        loader.load_deal(deal)
-        update_id_map(deal['id'], f"NS-{deal['id']}", id_map)
-
-    print("\nDry-run complete!")
-    print("Updated ID map:")
-    print(id_map)
+    if incremental is None:
+        incremental = config['migration'].get('incremental', False)
+
+    # === Run state: full runs checkpoint their page cursors ===
+    # Incremental runs already resume from their watermarks.
+    run_id = None
+    if not dry_run and not incremental:
+        run_id = start_migration_run("sync", env.upper(), resume=resume)
+        print(f"Run {run_id}")
+    elif resume:
+        print("Nothing to resume: dry-run and incremental runs are not checkpointed")
+
+    # === Extract and load every object type concurrently ===
+    settings = config['migration'].get('pipeline', {})
+    workers = settings.get('workers', {})
+    payload_mappings = config['migration'].get('payload_mappings') or {}
+    registry = LoadRegistry()
+    id_map_lock = threading.Lock()
+    stages = []
+    for object_type, load_name in OBJECT_LOADERS:
+        if run_id:
+            saved = get_run_checkpoint(run_id, object_type)
+            if saved and saved['complete']:
+                print(f"{object_type}: finished by run {run_id}, skipping")
+                records = iter(())
+            else:
+                records = extractor.fetch(object_type, saved['cursor'] if saved else None)
+            checkpoint = RunCheckpoint(
+                run_id, object_type, saved, id_map_lock,
+                save_every=config['migration'].get('checkpoint_every', 500)
+            )
+        elif incremental:
+            # Changed records are loaded even when mapped (the loader updates them)
+            start = get_sync_watermark(object_type, env.upper())
+            records = extractor.fetch_changed(object_type, start)
+            checkpoint = WatermarkCheckpoint(
+                object_type, env.upper(), start,
+                save_every=config['migration'].get('batch_size', 50), dry_run=dry_run
+            )
+        else:
+            records = extractor.fetch(object_type)
+            checkpoint = None
+        load = getattr(loader, load_name)
+        if object_type in payload_mappings:
+            load = mapped_loader(load, field_mapping.get_mapper(payload_mappings[object_type]))
+        stages.append(ObjectStage(
+            object_type, records, load, registry, id_map, id_map_lock,
+            workers=workers.get(object_type, 2),
+            queue_size=settings.get('queue_size', 200),
+            skip_mapped=not incremental,
+            checkpoint=checkpoint,
+        ))
+
+    try:
+        with metrics.profiled(config):
+            results = run_pipeline(stages, report_interval=settings.get('report_interval', 5))
+    except BaseException:
+        if run_id:
+            finish_migration_run(run_id, "failed")
+        raise
+    finally:
+        loader.close()
+        exported = metrics.export(config)
+        if exported:
+            print(f"Metrics written to {exported}")
+    if run_id:
+        incomplete = any(stage.extract_failed or stage.checkpoint_failed for stage in stages)
+        finish_migration_run(run_id, "failed" if incomplete else "completed")
+
+    for object_type, result in results.items():
+        print(f"{object_type}: loaded {result['loaded']}, skipped {result['skipped']}, "
+              f"failed {result['failed']}, max queue depth {result['max_queue_depth']}")
+        for error in result['errors']:
+            print(f"  ❌ {object_type} {error['id']}: {error['error']}")
+
+    print("\nDry-run complete!" if dry_run else "\nSync complete!")
+    print(f"ID map now holds {len(id_map)} records")
+    return results
 
 if __name__ == "__main__":
-    main(dry_run=True)
+    parser = argparse.ArgumentParser(description="HubSpot → NetSuite sync")
+    parser.add_argument("--incremental", action="store_true", default=None,
+                        help="only sync records modified since the last run")
+    parser.add_argument("--full", dest="incremental", action="store_false",
+                        help="sync every record, ignoring migration.incremental")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last full sync that did not complete")
+    args = parser.parse_args()
+    main(dry_run=True, incremental=args.incremental, resume=args.resume)
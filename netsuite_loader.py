@@ -1,13 +1,438 @@
+import base64
+import hashlib
+import hmac
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from urllib.parse import parse_qsl, quote, urlsplit
+
+import requests
+
+from utils import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Which api_endpoints entry each record kind is written to
+RECORD_ENDPOINTS = {"customer": "customer", "company": "customer", "contact": "contact", "deal": "deal"}
+
+
+class NetSuiteError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"NetSuite {status}: {message}")
+        self.status = status
+
+
+# ---------------------------
+# Rate limiting
+# ---------------------------
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+# ---------------------------
+# Latency tracking
+# ---------------------------
+class LatencyTracker:
+    def __init__(self):
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def stats(self):
+        with self.lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return {"count": 0}
+
+        def pct(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            "count": len(samples),
+            "mean": sum(samples) / len(samples),
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "p99": pct(0.99),
+            "max": samples[-1],
+        }
+
+
 class NetSuiteLoader:
-    def __init__(self, config, id_map=None):
+    def __init__(self, config, id_map=None, session=None):
         self.config = config
         self.id_map = id_map or {}
+        self.dry_run = config.get('migration', {}).get('dry_run', True)
 
+        netsuite = config.get('netsuite', {})
+        self.netsuite = netsuite
+        self.base_url = (netsuite.get('base_url') or '').rstrip('/')
+        self.endpoints = netsuite.get('api_endpoints', {})
+        self.concurrency = netsuite.get('concurrency', 5)
+        self.max_retries = netsuite.get('max_retries', 5)
+        self.timeout = netsuite.get('request_timeout', 30)
+        self.batch_endpoint = netsuite.get('batch_endpoint')
+        self.batch_size = netsuite.get('batch_size', 100)
+        self.batch_max_wait = netsuite.get('batch_max_wait', 1.0)
+        self.external_ids = netsuite.get('external_ids', False)
+        self.limiter = TokenBucket(netsuite.get('requests_per_second', 10))
+        # Caps requests in flight for every caller: load_many, batchers and
+        # pipeline threads calling upsert directly
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self.latency = LatencyTracker()
+        self.session = session or requests.Session()
+        self._pool = None
+
+    # ---------------------------
+    # One-record API
+    # ---------------------------
     def load_customer(self, customer):
-        print(f"[Dry-run] Would load customer to NetSuite: {customer}")
+        if self.dry_run:
+            print(f"[Dry-run] Would load customer to NetSuite: {customer}")
+            return None
+        return self.upsert("customer", customer)
 
     def load_company(self, company):
-        print(f"[Dry-run] Would load company to NetSuite: {company}")
+        if self.dry_run:
+            print(f"[Dry-run] Would load company to NetSuite: {company}")
+            return None
+        return self.upsert("company", company)
 
     def load_deal(self, deal):
-        print(f"[Dry-run] Would load deal to NetSuite: {deal}")
+        if self.dry_run:
+            print(f"[Dry-run] Would load deal to NetSuite: {deal}")
+            return None
+        return self.upsert("deal", deal)
+
+    # netsuite_api interface used by migration_engine.migrate_hubspot_to_netsuite
+    def create_customer(self, payload):
+        return self.create("customer", payload)
+
+    def update_customer(self, netsuite_id, payload):
+        return self.update("customer", netsuite_id, payload)
+
+    def upsert(self, kind, record):
+        """
+        Update when the record's source id is already mapped, otherwise create.
+        With external_ids on, an unmapped record is upserted by external id
+        instead, so a record created by a run that died before mapping it
+        is updated, not duplicated, when it is loaded again.
+        Returns the NetSuite id.
+        """
+        source_id = record.get('id')
+        netsuite_id = self.id_map.get(source_id) if source_id is not None else None
+        if netsuite_id:
+            self.update(kind, netsuite_id, record)
+            return netsuite_id
+        if self.external_ids and source_id is not None:
+            return self.upsert_external(kind, external_id(kind, source_id), record)
+        return self.create(kind, record)
+
+    def create(self, kind, payload):
+        response = self._request("POST", self._url(kind), json=payload)
+        return _id_from_response(response)
+
+    def upsert_external(self, kind, ext_id, payload):
+        """
+        PUT to the record's eid: URL. NetSuite creates the record, or updates
+        the one already carrying that external id; safe to repeat.
+        """
+        url = f"{self._url(kind)}/eid:{quote(ext_id, safe='')}"
+        response = self._request("PUT", url, json=dict(payload, externalId=ext_id))
+        return _id_from_response(response)
+
+    def update(self, kind, netsuite_id, payload):
+        self._request("PATCH", f"{self._url(kind)}/{netsuite_id}", json=payload)
+        return netsuite_id
+
+    # ---------------------------
+    # Concurrent API
+    # ---------------------------
+    def submit(self, kind, record):
+        """
+        Queue one upsert on the loader's thread pool. Returns a Future.
+        """
+        if self.dry_run:
+            return self._executor().submit(getattr(self, f"load_{kind}"), record)
+        return self._executor().submit(self.upsert, kind, record)
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="netsuite")
+        return self._pool
+
+    def load_many(self, kind, records):
+        """
+        Upsert records with at most `concurrency` requests in flight.
+        Yields (record, netsuite_id, error) as each request finishes; only
+        a bounded window of records is held in memory.
+        """
+        window = self.concurrency * 2
+        pending = {}
+        for record in records:
+            pending[self.submit(kind, record)] = record
+            if len(pending) >= window:
+                yield from self._drain(pending, until=window // 2)
+        yield from self._drain(pending, until=0)
+
+    def _drain(self, pending, until):
+        for future in as_completed(list(pending)):
+            record = pending.pop(future)
+            try:
+                yield record, future.result(), None
+            except Exception as e:
+                yield record, None, e
+            if len(pending) <= until:
+                return
+
+    # ---------------------------
+    # Batched API
+    # ---------------------------
+    def batch_upsert(self, kind, items):
+        """
+        Upsert many records in one call to the bulk endpoint.
+        items: list of (netsuite_id or None, payload) or
+        (netsuite_id or None, payload, source_id). With external_ids on, an
+        unmapped item with a source_id is upserted by its external id, as
+        upsert() does, so replaying a batch whose mappings were lost does
+        not create its records again.
+        Returns one (netsuite_id, error) pair per item, in order.
+        """
+        records = []
+        for i, (netsuite_id, payload, *source_id) in enumerate(items):
+            record = {"ref": str(i), "id": netsuite_id, "values": payload}
+            if not netsuite_id and self.external_ids and source_id and source_id[0] is not None:
+                record["externalId"] = external_id(kind, source_id[0])
+                record["values"] = dict(payload, externalId=record["externalId"])
+            records.append(record)
+        body = {"recordType": RECORD_ENDPOINTS[kind], "records": records}
+        response = self._request("POST", self.base_url + self.batch_endpoint, json=body)
+        by_ref = {str(r.get("ref")): r for r in response.json().get("results", [])}
+
+        results = []
+        for i, (netsuite_id, *_) in enumerate(items):
+            result = by_ref.get(str(i))
+            if result is None:
+                results.append((None, NetSuiteError("batch", "no result returned for record")))
+            elif result.get("error"):
+                results.append((None, NetSuiteError("batch", result["error"])))
+            else:
+                results.append((str(result.get("id") or netsuite_id), None))
+        return results
+
+    def batcher(self, kind, max_batch_size=None, max_wait=None):
+        """
+        RecordBatcher that coalesces single upserts into batch_upsert calls.
+        """
+        return RecordBatcher(
+            self, kind,
+            max_batch_size=max_batch_size or self.batch_size,
+            max_wait=self.batch_max_wait if max_wait is None else max_wait,
+        )
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def latency_stats(self):
+        return self.latency.stats()
+
+    # ---------------------------
+    # HTTP
+    # ---------------------------
+    def _url(self, kind):
+        return self.base_url + self.endpoints[RECORD_ENDPOINTS[kind]]
+
+    def _request(self, method, url, **kwargs):
+        """
+        Rate-limited request with jittered exponential backoff on 429/5xx.
+        At most `concurrency` requests are in flight at once; a request
+        gives its slot up while it backs off.
+        """
+        with metrics.timer("netsuite_request_seconds", method=method):
+            return self._request_with_retries(method, url, **kwargs)
+
+    def _request_with_retries(self, method, url, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            with self._slots:
+                started = time.perf_counter()
+                response = self.session.request(
+                    method, url,
+                    headers={"Authorization": self._auth_header(method, url), "Prefer": "transient"},
+                    timeout=self.timeout,
+                    **kwargs
+                )
+                self.latency.record(time.perf_counter() - started)
+
+            if response.status_code < 400:
+                return response
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                metrics.count("netsuite_errors_total", method=method, status=response.status_code)
+                raise NetSuiteError(response.status_code, response.text[:500])
+
+            metrics.count("netsuite_retries_total", method=method, status=response.status_code)
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                time.sleep(float(retry_after))
+            else:
+                # Full jitter: spread retries so workers don't stampede together
+                time.sleep(random.uniform(0, min(30.0, 0.5 * 2 ** attempt)))
+
+    def _auth_header(self, method, url):
+        """
+        OAuth 1.0a token-based authentication header (HMAC-SHA256).
+        Query parameters (e.g. RESTlet script/deploy) are part of the signature.
+        """
+        ns = self.netsuite
+        parts = urlsplit(url)
+        signed_url = f"{parts.scheme}://{parts.netloc}{parts.path}"
+        params = {
+            "oauth_consumer_key": ns.get("consumer_key", ""),
+            "oauth_token": ns.get("token_id", ""),
+            "oauth_signature_method": "HMAC-SHA256",
+            "oauth_timestamp": str(int(time.time())),
+            "oauth_nonce": uuid.uuid4().hex,
+            "oauth_version": "1.0",
+        }
+        signed = sorted(list(params.items()) + parse_qsl(parts.query))
+        normalized = "&".join(f"{_pct(k)}={_pct(v)}" for k, v in signed)
+        base_string = "&".join([method.upper(), _pct(signed_url), _pct(normalized)])
+        key = f"{_pct(ns.get('consumer_secret', ''))}&{_pct(ns.get('token_secret', ''))}"
+        digest = hmac.new(key.encode(), base_string.encode(), hashlib.sha256).digest()
+        params["oauth_signature"] = base64.b64encode(digest).decode()
+        realm = str(ns.get("account_id", "")).replace("-", "_").upper()
+        return f'OAuth realm="{realm}", ' + ", ".join(f'{k}="{_pct(v)}"' for k, v in params.items())
+
+
+# ---------------------------
+# Record coalescing
+# ---------------------------
+class RecordBatcher:
+    """
+    Buffers single-record upserts and sends them as batch_upsert calls, either
+    when max_batch_size records are waiting or max_wait seconds after the
+    oldest one arrived. Each add() returns a Future that resolves to that
+    record's NetSuite id or raises that record's error.
+    Batches are sent on the loader's pool, so up to `concurrency` run at once.
+    """
+
+    def __init__(self, loader, kind, max_batch_size=100, max_wait=1.0):
+        self.loader = loader
+        self.kind = kind
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches_sent = 0
+        self._buffer = []
+        self._oldest = None
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._timer = None
+        if max_wait:
+            self._timer = threading.Thread(target=self._flush_on_timer, daemon=True)
+            self._timer.start()
+
+    def add(self, payload, netsuite_id=None, source_id=None):
+        """source_id: the HubSpot id, for the external id of an unmapped record."""
+        future = Future()
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append((netsuite_id, payload, source_id, future))
+            full = len(self._buffer) >= self.max_batch_size
+        if full:
+            self._send_buffer()
+        return future
+
+    def flush(self):
+        """
+        Send whatever is buffered and wait for every batch in flight.
+        """
+        self._send_buffer()
+        with self._lock:
+            in_flight = list(self._in_flight)
+        wait(in_flight)
+
+    def close(self):
+        self._closed.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.flush()
+
+    def _flush_on_timer(self):
+        while not self._closed.wait(self.max_wait / 4):
+            with self._lock:
+                due = self._buffer and time.monotonic() - self._oldest >= self.max_wait
+            if due:
+                self._send_buffer()
+
+    def _send_buffer(self):
+        with self._lock:
+            items, self._buffer = self._buffer, []
+            if not items:
+                return
+            sent = self.loader._executor().submit(self._send, items)
+            self._in_flight.add(sent)
+            self.batches_sent += 1
+        sent.add_done_callback(self._discard)
+
+    def _discard(self, sent):
+        with self._lock:
+            self._in_flight.discard(sent)
+
+    def _send(self, items):
+        try:
+            results = self.loader.batch_upsert(self.kind, [item[:3] for item in items])
+        except Exception as e:
+            results = [(None, e)] * len(items)
+        for (*_, future), (netsuite_id, error) in zip(items, results):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(netsuite_id)
+
+
+def external_id(kind, source_id):
+    """NetSuite externalId for a HubSpot record."""
+    return f"hubspot_{kind}_{source_id}"
+
+
+def _pct(value):
+    return quote(str(value), safe="~")
+
+
+def _id_from_response(response):
+    # NetSuite answers a create with 204 and the new record URL in Location
+    location = response.headers.get("Location")
+    if location:
+        return location.rstrip("/").rsplit("/", 1)[-1]
+    if response.content:
+        return str(response.json().get("id"))
+    return None
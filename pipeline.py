@@ -0,0 +1,377 @@
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from database import save_run_checkpoint, save_sync_watermark
+from utils import metrics
+from utils.helpers import sync_id_map, update_id_map
+
+# Object types a record must wait for, read from its HubSpot associations.
+# Stages run in this order of priority but otherwise concurrently.
+DEPENDENCIES = {
+    "contacts": [],
+    "companies": [],
+    "deals": ["contacts", "companies"],
+}
+
+_DONE = object()
+
+
+# ---------------------------
+# Cross-stage load tracking
+# ---------------------------
+class LoadRegistry:
+    """
+    Which source ids each stage has loaded or failed, plus which stages are
+    finished. Records with dependencies wait here until every associated id
+    is settled: loaded (or skipped as mapped by an earlier run) by its own
+    stage, failed, or never coming because its stage has finished without
+    seeing it. The ID map is keyed by source id alone, so it cannot tell
+    which stage an id belongs to and is not consulted.
+    """
+
+    def __init__(self):
+        self.loaded = {}
+        self.failed = {}
+        self.finished = set()
+        self.condition = threading.Condition()
+
+    def mark(self, object_type, source_id, ok):
+        with self.condition:
+            target = self.loaded if ok else self.failed
+            target.setdefault(object_type, set()).add(source_id)
+            self.condition.notify_all()
+
+    def finish(self, object_type):
+        with self.condition:
+            self.finished.add(object_type)
+            self.condition.notify_all()
+
+    def _state(self, object_type, source_id):
+        if source_id in self.loaded.get(object_type, ()):
+            return "loaded"
+        if source_id in self.failed.get(object_type, ()):
+            return "failed"
+        if object_type in self.finished:
+            return "missing"
+        return None
+
+    def wait_for(self, needs):
+        """
+        Block until every (object_type, source_id) in needs is settled.
+        Returns the needs that failed to load.
+        """
+        with self.condition:
+            while True:
+                states = [(need, self._state(*need)) for need in needs]
+                if all(state is not None for _, state in states):
+                    return [need for need, state in states if state == "failed"]
+                self.condition.wait()
+
+
+# ---------------------------
+# Checkpoints
+# ---------------------------
+class OrderedCheckpoint(ABC):
+    """
+    Tracks the position of a stage whose records finish out of order. The
+    saved position only covers the unbroken prefix of finished records.
+    Subclasses decide whether a failed record stops the prefix
+    (block_on_failure) and must implement save(position, complete).
+    """
+    block_on_failure = True
+
+    def __init__(self, start, save_every=50, dry_run=False):
+        self.start = start
+        self.position = start
+        self.save_every = save_every
+        self.dry_run = dry_run
+        self.next_seq = 0
+        self.done = {}
+        self.blocked = False
+        self.unsaved = 0
+        self.lock = threading.Lock()
+
+    def record(self, seq, position, ok):
+        with self.lock:
+            self.done[seq] = (position, ok)
+            while not self.blocked and self.next_seq in self.done:
+                position, ok = self.done.pop(self.next_seq)
+                if not ok and self.block_on_failure:
+                    self.blocked = True
+                    break
+                self.position = position
+                self.next_seq += 1
+                self.unsaved += 1
+            if self.unsaved >= self.save_every:
+                self._save()
+
+    def close(self, complete=False):
+        with self.lock:
+            self._save(complete)
+
+    def _save(self, complete=False):
+        # A stage's completion is always recorded, even with nothing new
+        # since start; intermediate saves only when the position moved
+        if not self.dry_run and (complete or (self.unsaved and self.position != self.start)):
+            self.save(self.position, complete)
+        self.unsaved = 0
+
+    @abstractmethod
+    def save(self, position, complete):
+        """Persist position; complete marks the stage finished."""
+
+
+class WatermarkCheckpoint(OrderedCheckpoint):
+    """
+    Watermark of an incremental stage. A failed record blocks the saved
+    position, so it is retried on the next run.
+    """
+
+    def __init__(self, object_type, environment, start, save_every=50, dry_run=False):
+        super().__init__(start, save_every=save_every, dry_run=dry_run)
+        self.object_type = object_type
+        self.environment = environment
+
+    def save(self, position, complete):
+        if position is None:
+            return  # nothing processed yet: no watermark to keep
+        save_sync_watermark(self.object_type, self.environment, position)
+
+
+class RunCheckpoint(OrderedCheckpoint):
+    """
+    Extraction cursor of one object type in a resumable run. Failed records
+    are reported, not retried, so they do not hold the cursor back.
+    The ID map journal is fsynced before the cursor is written, so the
+    cursor never covers a record whose mapping could still be lost; records
+    past it that did get loaded are skipped on resume through the ID map.
+    """
+    block_on_failure = False
+
+    def __init__(self, run_id, object_type, checkpoint=None, id_map_lock=None, save_every=50, dry_run=False):
+        checkpoint = checkpoint or {}
+        super().__init__(checkpoint.get("cursor"), save_every=save_every, dry_run=dry_run)
+        self.run_id = run_id
+        self.object_type = object_type
+        self.id_map_lock = id_map_lock or threading.Lock()
+        self.batch = checkpoint.get("batch", 0)
+        self.records = checkpoint.get("records", 0)
+
+    def _save(self, complete=False):
+        self.records += self.unsaved
+        super()._save(complete)
+
+    def save(self, position, complete):
+        with self.id_map_lock:
+            sync_id_map()
+        self.batch += 1
+        save_run_checkpoint(self.run_id, self.object_type, position, self.batch, self.records, complete)
+
+
+# ---------------------------
+# One object type: extract -> queue -> load
+# ---------------------------
+class ObjectStage:
+    """
+    One extraction thread feeds a bounded queue; `workers` threads drain it
+    and load each record, after waiting for its dependencies. The queue
+    bound keeps a fast extractor from running ahead of a slow loader.
+    """
+
+    def __init__(self, object_type, records, load, registry, id_map, id_map_lock,
+                 workers=2, queue_size=200, skip_mapped=True, checkpoint=None):
+        self.object_type = object_type
+        self.records = records
+        self.load = load
+        self.registry = registry
+        self.id_map = id_map
+        self.id_map_lock = id_map_lock
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.skip_mapped = skip_mapped
+        self.checkpoint = checkpoint
+        self.counts = {"extracted": 0, "loaded": 0, "skipped": 0, "failed": 0, "waiting": 0}
+        self.errors = []
+        self.max_depth = 0
+        self.extract_failed = False
+        self.checkpoint_failed = False
+        self.lock = threading.Lock()
+        self.threads = []
+        self.active_workers = workers
+
+    def start(self):
+        self.threads = [threading.Thread(target=self._extract, name=f"{self.object_type}-extract", daemon=True)]
+        self.threads += [
+            threading.Thread(target=self._work, name=f"{self.object_type}-load-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def _finish(self):
+        # Last worker out: nothing more will be loaded by this stage
+        try:
+            if self.checkpoint:
+                self.checkpoint.close(complete=not (self.extract_failed or self.checkpoint_failed))
+        except Exception as e:
+            self._checkpoint_error(e)
+        finally:
+            self.registry.finish(self.object_type)
+
+    def depth(self):
+        depth = self.queue.qsize()
+        self.max_depth = max(self.max_depth, depth)
+        return depth
+
+    def _count(self, name, delta=1):
+        with self.lock:
+            self.counts[name] += delta
+        if name in ("loaded", "skipped", "failed"):
+            metrics.count("records_total", delta, job="sync", object_type=self.object_type, outcome=name)
+
+    def _extract(self):
+        try:
+            for seq, record in enumerate(self.records):
+                # Incremental records carry a watermark, full ones a page cursor
+                position = record.pop('_watermark', None)
+                cursor = record.pop('_cursor', None)
+                if position is None:
+                    position = cursor
+                self._count("extracted")
+                self.queue.put((seq, position, record))
+                self.depth()
+        except Exception as e:
+            self.extract_failed = True
+            self.errors.append({"id": None, "error": f"extraction failed: {e}"})
+            self._count("failed")
+        finally:
+            for _ in range(self.workers):
+                self.queue.put(_DONE)
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                with self.lock:
+                    self.active_workers -= 1
+                    last = self.active_workers == 0
+                if last:
+                    self._finish()
+                return
+            # A worker that dies never reaches _DONE and the stage would
+            # never finish, leaving dependent stages waiting forever
+            seq, position, record = item
+            try:
+                ok = self._process(record)
+            except Exception as e:
+                ok = self._fail(record, f"unexpected error: {e}")
+            if self.checkpoint:
+                try:
+                    self.checkpoint.record(seq, position, ok)
+                except Exception as e:
+                    self._checkpoint_error(e)
+
+    def _checkpoint_error(self, error):
+        # Reported once; later saves keep trying and the run is not marked complete
+        with self.lock:
+            first = not self.checkpoint_failed
+            self.checkpoint_failed = True
+        if first:
+            self.errors.append({"id": None, "error": f"checkpoint failed: {error}"})
+
+    def _process(self, record):
+        source_id = record['id']
+        if self.skip_mapped and source_id in self.id_map:
+            self._count("skipped")
+            self.registry.mark(self.object_type, source_id, True)
+            return True
+
+        needs = _dependencies(self.object_type, record)
+        if needs:
+            self._count("waiting")
+            failed = self.registry.wait_for(needs)
+            self._count("waiting", -1)
+            if failed:
+                return self._fail(record, "dependency failed to load: " + ", ".join(f"{t} {i}" for t, i in failed))
+
+        try:
+            netsuite_id = self.load(record)
+        except Exception as e:
+            return self._fail(record, str(e))
+
+        with self.id_map_lock:
+            if source_id not in self.id_map:
+                update_id_map(source_id, netsuite_id or f"NS-{source_id}", self.id_map)
+        self._count("loaded")
+        self.registry.mark(self.object_type, source_id, True)
+        return True
+
+    def _fail(self, record, error):
+        self._count("failed")
+        metrics.count("errors_total", job="sync", object_type=self.object_type)
+        self.errors.append({"id": record.get('id'), "error": error})
+        self.registry.mark(self.object_type, record.get('id'), False)
+        return False
+
+
+def _dependencies(object_type, record):
+    """(object_type, id) pairs record must wait for, from its associations."""
+    associations = record.get('associations') or {}
+    needs = []
+    for dependency in DEPENDENCIES.get(object_type, []):
+        for linked in (associations.get(dependency) or {}).get('results', []):
+            needs.append((dependency, str(linked['id'])))
+    return needs
+
+
+# ---------------------------
+# Scheduler
+# ---------------------------
+def run_pipeline(stages, report_interval=5.0, report=print):
+    """
+    Start every stage, report queue depth and progress every
+    report_interval seconds, and wait for all of them.
+    Returns {object_type: counts + max_queue_depth + errors}.
+    """
+    for stage in stages:
+        stage.start()
+
+    stop = threading.Event()
+
+    def monitor():
+        while not stop.wait(report_interval):
+            report(_progress_line(stages))
+
+    reporter = threading.Thread(target=monitor, name="pipeline-monitor", daemon=True)
+    reporter.start()
+    started = time.perf_counter()
+    try:
+        for stage in stages:
+            stage.join()
+    finally:
+        stop.set()
+        reporter.join()
+
+    report(f"{_progress_line(stages)} — finished in {time.perf_counter() - started:.1f}s")
+    return {
+        stage.object_type: dict(stage.counts, max_queue_depth=stage.max_depth, errors=stage.errors)
+        for stage in stages
+    }
+
+
+def _progress_line(stages):
+    parts = []
+    for stage in stages:
+        c = stage.counts
+        parts.append(
+            f"{stage.object_type}: queue {stage.depth()}/{stage.queue.maxsize}, "
+            f"extracted {c['extracted']}, loaded {c['loaded']}, skipped {c['skipped']}, "
+            f"waiting {c['waiting']}, failed {c['failed']}"
+        )
+    return "[pipeline] " + " | ".join(parts)
@@ -0,0 +1,414 @@
+# =========================================
+# services/audit.py
+# =========================================
+
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+import database
+from utils import metrics
+
+# ---------------------------
+# Settings
+# ---------------------------
+# Audit events live in their own SQLite file next to the CRM database
+# (fwd_crm_audit.db), so flushing them never waits on, or holds, the CRM
+# write lock. Set AUDIT_DB_PATH to use another file, or AUDIT_SEPARATE_FILE
+# to False to keep them in the CRM database itself.
+AUDIT_DB_PATH = None
+AUDIT_SEPARATE_FILE = True
+FLUSH_SIZE = 1000            # events per bulk insert
+FLUSH_INTERVAL = 1.0         # seconds an event may wait before it is written
+QUEUE_SIZE = 100_000         # producers block beyond this (backpressure)
+RETENTION_MONTHS = 12        # whole monthly partitions older than this are dropped
+STOP_RETRIES = 3             # flush attempts on close before events are spilled to a file
+
+PARTITION_PREFIX = "audit_log_"
+
+_STOP = object()
+
+
+class _Barrier:
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+
+
+def audit_db_path():
+    if not AUDIT_SEPARATE_FILE:
+        return database.DB_PATH
+    return AUDIT_DB_PATH or os.path.splitext(database.DB_PATH)[0] + "_audit.db"
+
+
+def spill_path(path):
+    """JSON lines file holding events the writer could not commit on close."""
+    return path + ".unwritten.jsonl"
+
+
+def partition_name(changed_at):
+    """audit_log_YYYYMM for an ISO timestamp."""
+    return PARTITION_PREFIX + changed_at[:7].replace("-", "")
+
+
+def _open_audit_db(path):
+    conn = sqlite3.connect(path, timeout=database.BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+    # Dropped partitions hand their pages back with incremental_vacuum;
+    # only takes effect on a new file
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _partitions(conn):
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name GLOB ? ORDER BY name",
+        (PARTITION_PREFIX + "[0-9][0-9][0-9][0-9][0-9][0-9]",)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+# ---------------------------
+# Background writer
+# ---------------------------
+class AuditWriter:
+    """
+    Queue-backed audit log writer.
+
+    log() only enqueues. A background thread collects events and writes
+    them in one transaction when FLUSH_SIZE are waiting or the oldest has
+    waited FLUSH_INTERVAL seconds. Events go to monthly partition tables
+    (audit_log_YYYYMM) keyed by their changed_at, so retention is a DROP
+    TABLE rather than a DELETE over millions of rows.
+
+    flush() is a barrier: it returns once every event logged before the
+    call is committed. close() flushes and stops the thread; it is
+    registered with atexit so shutdown never loses events. If the final
+    flush keeps failing, the events are saved to spill_path() and written
+    by the next writer on the same file.
+    """
+
+    def __init__(self, path, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL, queue_size=QUEUE_SIZE):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.failures = 0
+        self.spilled = 0
+        self._replaying_spill = False
+        self._known = set()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    # ---------------------------
+    # Producer side
+    # ---------------------------
+    def log(self, entity_type, entity_id, action, changed_by, changed_at=None):
+        self.queue.put((entity_type, entity_id, action, changed_at or datetime.now().isoformat(), changed_by))
+
+    def log_many(self, events):
+        """events: (entity_type, entity_id, action, changed_at, changed_by) tuples."""
+        for event in events:
+            self.queue.put(tuple(event))
+
+    def flush(self, timeout=None):
+        """
+        Block until everything logged so far is written.
+        Returns False if timeout expired first or the write failed (the
+        events stay queued for the next attempt).
+        """
+        if self._closed:
+            return True
+        barrier = _Barrier()
+        self.queue.put(barrier)
+        return barrier.done.wait(timeout) and barrier.ok
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(_STOP)
+        self._thread.join()
+
+    # ---------------------------
+    # Writer thread
+    # ---------------------------
+    def _run(self):
+        conn = _open_audit_db(self.path)
+        pending = self._load_spilled()
+        deadline = time.monotonic() if pending else None
+        try:
+            while True:
+                timeout = None if not pending else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    self._write(conn, pending)
+                    # Anything still pending failed; retry after another interval
+                    deadline = time.monotonic() + self.flush_interval
+                    continue
+
+                if item is _STOP:
+                    for attempt in range(STOP_RETRIES):
+                        if attempt:
+                            time.sleep(self.flush_interval)
+                        if self._write(conn, pending):
+                            return
+                    self._spill(pending)
+                    return
+                if isinstance(item, _Barrier):
+                    item.ok = self._write(conn, pending)
+                    item.done.set()
+                    continue
+
+                pending.append(item)
+                if len(pending) == 1:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(pending) >= self.flush_size:
+                    self._write(conn, pending)
+        finally:
+            conn.close()
+
+    def _write(self, conn, pending):
+        """
+        Write and clear pending; on error the events stay for the next flush.
+        Returns whether pending is now empty.
+        """
+        if not pending:
+            return True
+        by_partition = {}
+        for event in pending:
+            by_partition.setdefault(partition_name(event[3]), []).append(event)
+        try:
+            with metrics.timer("audit_flush_seconds"):
+                with conn:
+                    for partition, events in by_partition.items():
+                        self._ensure_partition(conn, partition)
+                        conn.executemany(f"""
+                            INSERT INTO {partition} (entity_type, entity_id, action, changed_at, changed_by)
+                            VALUES (?,?,?,?,?)
+                        """, events)
+        except sqlite3.Error as e:
+            self.failures += 1
+            self._known.clear()
+            print(f"Audit flush of {len(pending)} events failed, will retry: {e}", file=sys.stderr)
+            return False
+        self.written += len(pending)
+        metrics.count("audit_events_total", len(pending))
+        pending.clear()
+        if self._replaying_spill:
+            # An earlier writer's spilled events were part of this write
+            self._replaying_spill = False
+            try:
+                os.remove(spill_path(self.path))
+            except OSError as e:
+                print(f"Audit log: cannot remove {spill_path(self.path)}: {e}", file=sys.stderr)
+        return True
+
+    def _spill(self, pending):
+        """Save events that could not be committed to spill_path()."""
+        path = spill_path(self.path)
+        try:
+            # Replayed events are still in pending: rewrite rather than append
+            with open(path, "w" if self._replaying_spill else "a", encoding="utf-8") as f:
+                for event in pending:
+                    f.write(json.dumps(event) + "\n")
+        except OSError as e:
+            metrics.count("audit_events_dropped_total", len(pending))
+            print(f"Audit log lost {len(pending)} events: cannot save them to {path}: {e}", file=sys.stderr)
+            return
+        self.spilled += len(pending)
+        print(f"Audit log: {len(pending)} events could not be written; saved to {path}", file=sys.stderr)
+
+    def _load_spilled(self):
+        """Events an earlier writer spilled; the file goes once they are written."""
+        path = spill_path(self.path)
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            events = [tuple(json.loads(line)) for line in f if line.strip()]
+        self._replaying_spill = True
+        return events
+
+    def _ensure_partition(self, conn, partition):
+        if partition in self._known:
+            return
+        # INTEGER PRIMARY KEY: rows append in rowid order, no random-key splits
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {partition} (
+                id INTEGER PRIMARY KEY,
+                entity_type TEXT,
+                entity_id TEXT,
+                action TEXT,
+                changed_at TEXT,
+                changed_by TEXT
+            )
+        """)
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{partition}_entity ON {partition} (entity_type, entity_id)"
+        )
+        self._known.add(partition)
+
+
+# ---------------------------
+# Module-level writer
+# ---------------------------
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_audit_writer():
+    """The process-wide AuditWriter for the current audit database."""
+    global _writer
+    with _writer_lock:
+        path = audit_db_path()
+        if _writer is None or _writer.path != path:
+            if _writer is not None:
+                _writer.close()
+            # Apply the retention policy once per process and file
+            _drop_partitions(path, RETENTION_MONTHS)
+            _writer = AuditWriter(path)
+            atexit.register(_writer.close)
+        return _writer
+
+
+def log_audit_event(entity_type, entity_id, action, changed_by):
+    get_audit_writer().log(entity_type, entity_id, action, changed_by)
+
+
+def log_audit_events(events):
+    """Bulk log_audit_event: (entity_type, entity_id, action, changed_at, changed_by) tuples."""
+    if events:
+        get_audit_writer().log_many(events)
+
+
+def flush_audit_log(timeout=None):
+    """
+    Barrier: wait until every event logged so far is on disk.
+    False when the write failed or timeout expired (see AuditWriter.flush).
+    """
+    if _writer is None:
+        return True
+    return _writer.flush(timeout)
+
+
+def close_audit_log():
+    """
+    Flush and stop the process-wide writer, e.g. before removing its
+    database. The next audit event starts a new one.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+
+# ---------------------------
+# Reading
+# ---------------------------
+def attach_audit_db(conn, schema="audit"):
+    """
+    ATTACH the audit database to a CRM connection as `schema`, for queries
+    that join audit events with customers. No-op when both share a file.
+    """
+    path = audit_db_path()
+    if path != database.DB_PATH:
+        conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+        return schema
+    return "main"
+
+
+def fetch_audit_events(entity_type=None, entity_id=None, since=None, limit=200):
+    """
+    Newest audit events first, across partitions, optionally filtered.
+    since (ISO timestamp) also skips partitions that end before it.
+    """
+    flush_audit_log()
+    path = audit_db_path()
+    if not os.path.exists(path):
+        return []
+    conn = _open_audit_db(path)
+    try:
+        partitions = _partitions(conn)
+        if since:
+            partitions = [p for p in partitions if p >= partition_name(since)]
+        if not partitions:
+            return []
+        clauses, params = [], []
+        if entity_type:
+            clauses.append("entity_type = ?")
+            params.append(entity_type)
+        if entity_id:
+            clauses.append("entity_id = ?")
+            params.append(entity_id)
+        if since:
+            clauses.append("changed_at >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        union = " UNION ALL ".join(
+            f"SELECT entity_type, entity_id, action, changed_at, changed_by FROM {p} {where}" for p in partitions
+        )
+        rows = conn.execute(
+            f"SELECT * FROM ({union}) ORDER BY changed_at DESC LIMIT ?", params * len(partitions) + [limit]
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(r) for r in rows]
+
+
+# ---------------------------
+# Retention
+# ---------------------------
+def prune_audit_log(retain_months=RETENTION_MONTHS, now=None):
+    """
+    Drop monthly partitions older than retain_months and return their
+    pages to the file system. Returns the dropped partition names.
+    """
+    flush_audit_log()
+    dropped = _drop_partitions(audit_db_path(), retain_months, now)
+    if _writer is not None:
+        _writer._known.difference_update(dropped)
+    return dropped
+
+
+def _drop_partitions(path, retain_months, now=None):
+    if not os.path.exists(path):
+        return []
+    now = now or datetime.now()
+    month = now.year * 12 + now.month - 1 - retain_months
+    cutoff = f"{PARTITION_PREFIX}{month // 12:04d}{month % 12 + 1:02d}"
+
+    conn = _open_audit_db(path)
+    try:
+        dropped = [p for p in _partitions(conn) if p < cutoff]
+        with conn:
+            for partition in dropped:
+                conn.execute(f"DROP TABLE {partition}")
+        if dropped:
+            conn.execute("PRAGMA incremental_vacuum")
+    finally:
+        conn.close()
+    return dropped
+
+
+def compact_audit_log():
+    """Full VACUUM of the audit database (rewrites the file)."""
+    flush_audit_log()
+    path = audit_db_path()
+    if os.path.exists(path):
+        conn = _open_audit_db(path)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
@@ -0,0 +1,76 @@
+# =========================================
+# services/contact_import.py
+# Dashboard CSV import: set-based duplicate detection + bulk write
+# =========================================
+
+import pandas as pd
+
+from database import get_conn, ensure_schema
+from services.migration_engine import bulk_upsert_contacts
+from services.validation import normalize_emails
+
+SKIP_DUPLICATES = "Skip duplicates"
+OVERWRITE_EXISTING = "Overwrite existing"
+ASK_FOR_EACH = "Ask for each"
+
+
+def classify_import(df_import, environment):
+    """
+    Mark every CSV row as new or as a conflict with an existing customer.
+    The file's emails are loaded into a temp staging table and joined
+    against customers once, instead of scanning the customer list per row.
+    Emails are compared lowercased and stripped, the way they are stored.
+    Returns a copy of df_import with an `existing_id` column (None = new).
+    """
+    ensure_schema()
+    df = df_import.copy()
+    df["email"] = normalize_emails(df["email"])[0]
+    emails = df["email"].dropna().astype(str).unique().tolist()
+
+    conn = get_conn()
+    try:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_staging (email TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM import_staging")
+        conn.executemany("INSERT OR IGNORE INTO import_staging (email) VALUES (?)", [(e,) for e in emails])
+        rows = conn.execute("""
+            SELECT s.email, c.id FROM import_staging s
+            JOIN customers c ON c.email = s.email AND c.environment = ?
+        """, (environment,)).fetchall()
+        conn.execute("DROP TABLE import_staging")
+        conn.commit()
+    finally:
+        conn.close()
+
+    existing = pd.DataFrame([tuple(r) for r in rows], columns=["email", "existing_id"])
+    df["email"] = df["email"].astype(object).where(df["email"].notna(), None)
+    merged = df.merge(existing, on="email", how="left")
+    merged["existing_id"] = merged["existing_id"].astype(object).where(merged["existing_id"].notna(), None)
+    return merged
+
+
+def select_rows(classified, conflict_option, overwrite_emails=()):
+    """
+    Apply the duplicate policy as a set operation.
+    overwrite_emails: conflicts the user approved under "Ask for each".
+    """
+    is_conflict = classified["existing_id"].notna()
+    if conflict_option == OVERWRITE_EXISTING:
+        keep = pd.Series(True, index=classified.index)
+    elif conflict_option == ASK_FOR_EACH:
+        keep = ~is_conflict | classified["email"].isin(list(overwrite_emails))
+    else:
+        keep = ~is_conflict
+    return classified[keep]
+
+
+def import_contacts(classified, environment, conflict_option, overwrite_emails=()):
+    """
+    Write the rows selected by the policy with one bulk upsert.
+    Returns the created/updated/failed summary plus a `skipped` count.
+    """
+    selected = select_rows(classified, conflict_option, overwrite_emails)
+    rows = selected.drop(columns=["existing_id"])
+    records = rows.astype(object).where(rows.notna(), None).to_dict(orient="records")
+    summary = bulk_upsert_contacts(records, environment=environment)
+    summary["skipped"] = len(classified) - len(selected)
+    return summary
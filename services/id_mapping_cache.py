@@ -0,0 +1,193 @@
+# =========================================
+# services/id_mapping_cache.py
+# =========================================
+
+from collections import OrderedDict
+from datetime import datetime
+
+from database import db_session, ensure_schema, generate_ids
+
+# Marks an ID we looked up and know has no mapping
+_MISSING = object()
+
+# SQLite caps bound parameters per statement; stay well below it
+_MAX_IN_PARAMS = 900
+
+
+class IdMappingCache:
+    """
+    In-memory LRU front for the id_mappings table.
+
+    Mappings can be bulk-loaded for a whole source/target pair (load_pair)
+    or prefetched for just the IDs of the next batch (prefetch). Lookups are
+    then answered from memory, and save_id_mapping writes through to the
+    table so the cache never disagrees with what this process wrote.
+    Mappings written by other processes are only seen after a miss or reload.
+    Each mapping's fingerprint (hash of what was last pushed to the target)
+    is cached alongside it.
+    """
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._fingerprints = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ---------------------------
+    # Cache internals
+    # ---------------------------
+    def _store(self, key, value, fingerprint=None):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if fingerprint is None:
+            self._fingerprints.pop(key, None)
+        else:
+            self._fingerprints[key] = fingerprint
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._fingerprints.pop(evicted, None)
+            self.evictions += 1
+
+    # ---------------------------
+    # Loading
+    # ---------------------------
+    def load_pair(self, source_system, target_system):
+        """
+        Load every mapping for a source/target pair in one query.
+        Only worth it when the pair fits in max_entries.
+        """
+        ensure_schema()
+        with db_session(read_only=True) as conn:
+            cursor = conn.execute("""
+            SELECT source_id, target_id, fingerprint FROM id_mappings
+            WHERE source_system=? AND target_system=?
+            """, (source_system, target_system))
+            while True:
+                rows = cursor.fetchmany(10_000)
+                if not rows:
+                    break
+                for source_id, target_id, fingerprint in rows:
+                    self._store((source_system, source_id, target_system), target_id, fingerprint)
+
+    def prefetch(self, source_system, source_ids, target_system):
+        """
+        Load the mappings for the given IDs that are not cached yet.
+        IDs with no mapping are remembered as missing.
+        """
+        wanted = {
+            sid for sid in source_ids
+            if sid is not None and (source_system, sid, target_system) not in self._entries
+        }
+        if not wanted:
+            return
+        ensure_schema()
+        found = {}
+        wanted = list(wanted)
+        with db_session(read_only=True) as conn:
+            for i in range(0, len(wanted), _MAX_IN_PARAMS):
+                chunk = wanted[i:i + _MAX_IN_PARAMS]
+                rows = conn.execute(f"""
+                SELECT source_id, target_id, fingerprint FROM id_mappings
+                WHERE source_system=? AND target_system=?
+                AND source_id IN ({','.join('?' * len(chunk))})
+                """, [source_system, target_system] + chunk).fetchall()
+                found.update((r[0], (r[1], r[2])) for r in rows)
+        for sid in wanted:
+            target_id, fingerprint = found.get(sid, (_MISSING, None))
+            self._store((source_system, sid, target_system), target_id, fingerprint)
+
+    # ---------------------------
+    # Lookups / writes
+    # ---------------------------
+    def get_target_id(self, source_system, source_id, target_system):
+        """
+        Same contract as migration_engine.get_target_id, served from memory.
+        """
+        key = (source_system, source_id, target_system)
+        value = self._entries.get(key)
+        if value is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return None if value is _MISSING else value
+
+        self.misses += 1
+        ensure_schema()
+        with db_session(read_only=True) as conn:
+            row = conn.execute("""
+            SELECT target_id, fingerprint FROM id_mappings
+            WHERE source_system=? AND source_id=? AND target_system=?
+            """, key).fetchone()
+        target_id = row[0] if row else None
+        self._store(key, _MISSING if target_id is None else target_id, row[1] if row else None)
+        return target_id
+
+    def get_fingerprint(self, source_system, source_id, target_system):
+        """
+        Fingerprint stored with a mapping, or None. Only answers from memory,
+        so call it after get_target_id/prefetch has loaded the mapping.
+        """
+        return self._fingerprints.get((source_system, source_id, target_system))
+
+    def save_id_mapping(self, source_system, source_id, target_system, target_id, dry_run=False,
+                        fingerprint=None):
+        """
+        Write a mapping to id_mappings and the cache.
+        """
+        if dry_run:
+            return
+        self.save_id_mappings([(source_system, source_id, target_system, target_id, fingerprint)])
+
+    def save_id_mappings(self, mappings, dry_run=False):
+        """
+        Bulk save_id_mapping: one transaction for a list of
+        (source_system, source_id, target_system, target_id[, fingerprint]) tuples.
+        """
+        if dry_run or not mappings:
+            return
+        ensure_schema()
+        now = datetime.now().isoformat()
+        mappings = [tuple(m) + (None,) * (5 - len(m)) for m in mappings]
+        ids = generate_ids("MAP", len(mappings), "id_mappings")
+        with db_session() as conn:
+            conn.executemany("""
+            INSERT INTO id_mappings (id, source_system, source_id, target_system, target_id, fingerprint, created_at)
+            VALUES (?,?,?,?,?,?,?)
+            """, [(map_id,) + m + (now,) for map_id, m in zip(ids, mappings)])
+        for source_system, source_id, target_system, target_id, fingerprint in mappings:
+            self._store((source_system, source_id, target_system), target_id, fingerprint)
+
+    def save_fingerprints(self, updates, dry_run=False):
+        """
+        Record what was just pushed for existing mappings: a list of
+        (source_system, source_id, target_system, fingerprint) tuples.
+        """
+        if dry_run or not updates:
+            return
+        ensure_schema()
+        with db_session() as conn:
+            conn.executemany("""
+            UPDATE id_mappings SET fingerprint=?
+            WHERE source_system=? AND source_id=? AND target_system=?
+            """, [(fp, source_system, source_id, target_system)
+                  for source_system, source_id, target_system, fp in updates])
+        for source_system, source_id, target_system, fingerprint in updates:
+            key = (source_system, source_id, target_system)
+            if key in self._entries:
+                self._fingerprints[key] = fingerprint
+
+    def invalidate(self):
+        self._entries.clear()
+        self._fingerprints.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+        }
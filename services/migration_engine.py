@@ -2,22 +2,73 @@
 # services/migration_engine.py
 # =========================================
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import hashlib
+import itertools
+import json
+import multiprocessing
 import sqlite3
 import pandas as pd
-from database import get_conn, generate_id
+from database import (
+    get_conn, db_session, ensure_schema, bump_data_version, generate_id, generate_ids,
+    finish_migration_run, get_run_checkpoint, save_run_checkpoint,
+)
+from services.audit import log_audit_event, log_audit_events
+from services.id_mapping_cache import IdMappingCache
+from services.validation import VALIDATED_FIELDS, get_contact_validator
+from utils import metrics
+from utils.field_mapping import get_frame_mapper, get_mapper
+
+# ---------------------------
+# Change fingerprints
+# ---------------------------
+def _normalise_value(value):
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return None
+        if value.is_integer():
+            value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def record_fingerprint(record, fields=None):
+    """
+    Hash of a record's fields (all keys when fields is None), normalised so
+    that resyncing identical data gives the same fingerprint: strings are
+    stripped, empty values count as None and numbers compare as text.
+    """
+    fields = sorted(record) if fields is None else fields
+    values = [[f, _normalise_value(record.get(f))] for f in fields]
+    payload = json.dumps(values, separators=(",", ":")).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
 
 # ---------------------------
 # Save or update a contact
 # ---------------------------
-def save_or_update_contact(contact, environment="SANDBOX", dry_run=False):
+def save_or_update_contact(contact, environment="SANDBOX", dry_run=False, validate=True):
     """
     Save a contact to the customers table.
     Handles both create and update.
     Supports dry_run mode.
-    Logs to audit_log.
-    Returns dict with id and action.
+    Logs to the audit log.
+    Returns dict with id and action ("unchanged" when the stored row
+    already matches and nothing was written).
+    validate: normalise and check it like migrated contacts (see
+    services/validation.py); a rejected contact raises ValueError.
+    Pass False for contacts that already went through map_contact_chunk.
     """
+    ensure_schema()
+    if validate:
+        mapped, errors = map_contact_chunk([contact], project_contact, get_contact_validator())
+        if errors:
+            raise ValueError(f"Contact {contact.get('email')!r} {errors[0][1]}")
+        contact = mapped[0][1]
     conn = get_conn()
     cursor = conn.cursor()
 
@@ -25,6 +76,11 @@ def save_or_update_contact(contact, environment="SANDBOX", dry_run=False):
     cursor.execute("SELECT * FROM customers WHERE email=? AND environment=?", 
                    (contact.get("email"), environment))
     existing = cursor.fetchone()
+    fingerprint = record_fingerprint(contact, CONTACT_FIELDS)
+
+    if existing and existing["fingerprint"] == fingerprint:
+        conn.close()
+        return {"id": existing["id"], "action": "unchanged"}
 
     if existing:
         # Update existing
@@ -50,7 +106,8 @@ def save_or_update_contact(contact, environment="SANDBOX", dry_run=False):
                 zip=?,
                 country=?,
                 notes=?,
-                last_synced_at=?
+                last_synced_at=?,
+                fingerprint=?
             WHERE id=?
             """, (
                 contact.get("hubspot_id"),
@@ -71,17 +128,18 @@ def save_or_update_contact(contact, environment="SANDBOX", dry_run=False):
                 contact.get("country"),
                 contact.get("notes"),
                 datetime.now().isoformat(),
+                fingerprint,
                 entity_id
             ))
 
     else:
         # Create new
-        entity_id = generate_id("CUST", "customers")
+        entity_id = generate_id("CUST", "customers", dry_run=dry_run, conn=conn)
         action = "create"
         if not dry_run:
-            cursor.execute("""
-            INSERT INTO customers VALUES (
-                ?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?
+            cursor.execute(f"""
+            INSERT INTO customers ({", ".join(CUSTOMER_COLUMNS)}) VALUES (
+                ?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?
             )
             """, (
                 entity_id,
@@ -105,24 +163,15 @@ def save_or_update_contact(contact, environment="SANDBOX", dry_run=False):
                 contact.get("notes"),
                 datetime.now().isoformat(),
                 datetime.now().isoformat(),
-                environment
+                environment,
+                fingerprint
             ))
 
-    # Audit log
-    if not dry_run:
-        cursor.execute("""
-        INSERT INTO audit_log VALUES (?,?,?,?,?,?)
-        """, (
-            generate_id("AUD", "audit_log"),
-            "customer",
-            entity_id,
-            action,
-            datetime.now().isoformat(),
-            "migration_engine"
-        ))
-
     if not dry_run:
+        bump_data_version(conn, "customers")
         conn.commit()
+        # Audit log (written in the background, see services/audit.py)
+        log_audit_event("customer", entity_id, action, "migration_engine")
     conn.close()
 
     return {"id": entity_id, "action": action}
@@ -138,107 +187,568 @@ def save_id_mapping(source_system, source_id, target_system, target_id, dry_run=
     if dry_run:
         return
 
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS id_mappings (
-        id TEXT PRIMARY KEY,
-        source_system TEXT,
-        source_id TEXT,
-        target_system TEXT,
-        target_id TEXT,
-        created_at TEXT
-    )
-    """)
-    cursor.execute("""
-    INSERT INTO id_mappings VALUES (?,?,?,?,?,?)
-    """, (
-        generate_id("MAP", "id_mappings"),
-        source_system,
-        source_id,
-        target_system,
-        target_id,
-        datetime.now().isoformat()
-    ))
-    conn.commit()
-    conn.close()
+    ensure_schema()
+    with db_session() as conn:
+        conn.execute("""
+        INSERT INTO id_mappings (id, source_system, source_id, target_system, target_id, created_at)
+        VALUES (?,?,?,?,?,?)
+        """, (
+            generate_id("MAP", "id_mappings", conn=conn),
+            source_system,
+            source_id,
+            target_system,
+            target_id,
+            datetime.now().isoformat()
+        ))
 
 
 def get_target_id(source_system, source_id, target_system):
     """
     Return the target system ID if exists.
     """
-    conn = get_conn()
-    cursor = conn.cursor()
-    cursor.execute("""
-    SELECT target_id FROM id_mappings
-    WHERE source_system=? AND source_id=? AND target_system=?
-    """, (source_system, source_id, target_system))
-    row = cursor.fetchone()
-    conn.close()
+    ensure_schema()
+    with db_session(read_only=True) as conn:
+        row = conn.execute("""
+        SELECT target_id FROM id_mappings
+        WHERE source_system=? AND source_id=? AND target_system=?
+        """, (source_system, source_id, target_system)).fetchone()
     return row[0] if row else None
 
 
+# ---------------------------
+# HubSpot → FWD CRM field mapping
+# ---------------------------
+def map_hubspot_contact(hs_contact):
+    """
+    Map a HubSpot contact record onto the customers columns
+    (mappings.contacts in config.yaml).
+    """
+    return get_mapper("contacts")(hs_contact)
+
+
 # ---------------------------
 # Batch migrate HubSpot contacts
 # ---------------------------
-def migrate_hubspot_contacts(hubspot_contacts, environment="SANDBOX", dry_run=False):
+def migrate_hubspot_contacts(hubspot_contacts, environment="SANDBOX", dry_run=False, batch_size=None,
+                             run_id=None, workers=None):
     """
     Migrate a list of HubSpot contacts to the FWD CRM.
-    Returns summary with created/updated/failed counts.
+    Pass batch_size to write N records per transaction instead of one.
+    Pass run_id (from database.start_migration_run) to checkpoint every
+    batch, or workers to map batches in that many processes; see
+    migrate_hubspot_contacts_batched.
+    Returns summary with created/updated/unchanged/failed counts.
     """
-    summary = {"created": 0, "updated": 0, "failed": 0, "errors": []}
+    if batch_size or run_id or workers:
+        return migrate_hubspot_contacts_batched(
+            hubspot_contacts, environment=environment, dry_run=dry_run,
+            batch_size=batch_size or 500, run_id=run_id, workers=workers
+        )
+
+    summary = {"created": 0, "updated": 0, "unchanged": 0, "failed": 0, "errors": []}
+    validator = get_contact_validator()
+
+    for batch in _chunked(hubspot_contacts, _MAX_IN_PARAMS):
+        with metrics.timer("transform_seconds", stage="map_contact"):
+            mapped, errors = map_contact_chunk(batch, validator=validator)
+        _count_mapping_errors(batch, errors, summary)
+        for i, contact in mapped:
+            _save_contact(batch[i], contact, environment, dry_run, summary)
+
+    metrics.count_summary("hubspot_contacts", summary)
+    return summary
 
-    for hs_contact in hubspot_contacts:
-        try:
-            contact = {
-                "hubspot_id": hs_contact.get("hubspot_id"),
-                "netsuite_id": hs_contact.get("netsuite_id"),
-                "source_system": "hubspot",
-                "first_name": hs_contact.get("firstname"),
-                "last_name": hs_contact.get("lastname"),
-                "email": hs_contact.get("email"),
-                "phone": hs_contact.get("phone"),
-                "company": hs_contact.get("company"),
-                "brand": hs_contact.get("brand"),
-                "lifecycle_stage": hs_contact.get("lifecycle_stage", "Lead"),
-                "pipeline_stage": hs_contact.get("pipeline_stage", "Lead"),
-                "customer_type": hs_contact.get("customer_type", "Retail"),
-                "address": hs_contact.get("address"),
-                "city": hs_contact.get("city"),
-                "state": hs_contact.get("state"),
-                "zip": hs_contact.get("zip"),
-                "country": hs_contact.get("country"),
-                "notes": hs_contact.get("notes"),
-            }
-
-            result = save_or_update_contact(contact, environment=environment, dry_run=dry_run)
-
-            if result["action"] == "create":
-                summary["created"] += 1
-            else:
-                summary["updated"] += 1
 
-            # Save ID mapping
-            save_id_mapping("hubspot", hs_contact.get("hubspot_id"), "fwd_crm", result["id"], dry_run=dry_run)
+def _save_contact(hs_contact, contact, environment, dry_run, summary):
+    try:
+        result = save_or_update_contact(contact, environment=environment, dry_run=dry_run, validate=False)
+
+        if result["action"] == "unchanged":
+            # Already migrated with these values; its mapping exists too
+            summary["unchanged"] += 1
+            return
+        if result["action"] == "create":
+            summary["created"] += 1
+        else:
+            summary["updated"] += 1
+
+        # Save ID mapping
+        save_id_mapping("hubspot", hs_contact.get("hubspot_id"), "fwd_crm", result["id"], dry_run=dry_run)
 
+    except Exception as e:
+        summary["failed"] += 1
+        summary["errors"].append({"email": hs_contact.get("email"), "error": str(e)})
+
+
+# ---------------------------
+# Batched (single-transaction) contact writes
+# ---------------------------
+CUSTOMER_COLUMNS = [
+    "id", "hubspot_id", "netsuite_id", "source_system", "first_name", "last_name",
+    "email", "phone", "company", "brand", "lifecycle_stage", "pipeline_stage",
+    "customer_type", "address", "city", "state", "zip", "country", "notes",
+    "created_at", "last_synced_at", "environment", "fingerprint",
+]
+
+# Columns taken from the contact itself
+CONTACT_FIELDS = [
+    c for c in CUSTOMER_COLUMNS
+    if c not in ("id", "created_at", "last_synced_at", "environment", "fingerprint")
+]
+
+# Columns an upsert must leave alone on an existing row
+_UPSERT_KEEP = {"id", "email", "created_at", "environment"}
+
+UPSERT_CUSTOMER_SQL = """
+INSERT INTO customers ({cols}) VALUES ({params})
+ON CONFLICT(email, environment) DO UPDATE SET
+    {updates}
+""".format(
+    cols=", ".join(CUSTOMER_COLUMNS),
+    params=", ".join("?" for _ in CUSTOMER_COLUMNS),
+    updates=",\n    ".join(
+        f"{c}=excluded.{c}" for c in CUSTOMER_COLUMNS if c not in _UPSERT_KEEP
+    ),
+)
+
+# SQLite caps bound parameters per statement; stay well below it
+_MAX_IN_PARAMS = 900
+
+
+def _chunked(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _existing_customer_ids(cursor, emails, environment):
+    """
+    Return {email: (id, fingerprint)} for the emails that already exist in
+    this environment.
+    """
+    emails = list({e for e in emails if e is not None})
+    found = {}
+    for i in range(0, len(emails), _MAX_IN_PARAMS):
+        chunk = emails[i:i + _MAX_IN_PARAMS]
+        cursor.execute(
+            f"SELECT id, email, fingerprint FROM customers "
+            f"WHERE environment=? AND email IN ({','.join('?' * len(chunk))})",
+            [environment] + chunk
+        )
+        for row in cursor.fetchall():
+            found[row["email"]] = (row["id"], row["fingerprint"])
+    return found
+
+
+def project_contact(contact):
+    """
+    Keep only the customers columns of an already FWD-shaped contact
+    (dashboard form, CSV template).
+    """
+    return {k: contact.get(k) for k in CONTACT_FIELDS}
+
+
+def map_contact_chunk(batch, mapper=map_hubspot_contact, validator=None):
+    """
+    Map, validate and fingerprint a batch without touching the database,
+    so it can run in a worker process. Returns (mapped, errors): lists of
+    (index, contact) and (index, message) in batch order.
+    validator: a services.validation.ContactValidator. The mapped batch goes
+    through it as one DataFrame; its normalised values replace the
+    contacts' own and its rejects become errors.
+    """
+    mapped, errors = [], []
+    for i, record in enumerate(batch):
+        try:
+            mapped.append((i, mapper(record)))
         except Exception as e:
-            summary["failed"] += 1
-            summary["errors"].append({"email": hs_contact.get("email"), "error": str(e)})
+            errors.append((i, str(e)))
+
+    if validator is not None and mapped:
+        frame = pd.DataFrame(
+            {field: [contact.get(field) for _, contact in mapped] for field in VALIDATED_FIELDS},
+            index=[i for i, _ in mapped], dtype=object,
+        )
+        clean, rejects = validator(frame)
+        errors.extend((i, f"rejected: {reasons}") for i, reasons in rejects["reasons"].items())
+        errors.sort(key=lambda error: error[0])
+        accepted = set(clean.index)
+        rows = zip(*(clean[field].tolist() for field in VALIDATED_FIELDS))
+        mapped = [
+            (i, dict(contact, **dict(zip(VALIDATED_FIELDS, row))))
+            for (i, contact), row in zip((item for item in mapped if item[0] in accepted), rows)
+        ]
+
+    for _, contact in mapped:
+        contact["fingerprint"] = record_fingerprint(contact, CONTACT_FIELDS)
+    return mapped, errors
+
+
+def _count_mapping_errors(batch, errors, summary):
+    for i, message in errors:
+        summary["failed"] += 1
+        summary["errors"].append({"email": batch[i].get("email"), "error": message})
+
+
+def _plan_contact_batch(cursor, batch, environment, summary, mapper, mapped=None, dry_run=False):
+    """
+    Map a batch and decide create, update or unchanged for every record.
+    Each mapped contact carries its fingerprint; an existing row with the
+    same fingerprint needs no write at all.
+    Records that fail to map are counted as failed and dropped.
+    mapped: map_contact_chunk's result for this batch, if already computed.
+    """
+    if mapped is None:
+        with metrics.timer("transform_seconds", stage="map_contact_batch"):
+            mapped = map_contact_chunk(batch, mapper, get_contact_validator())
+    contacts, errors = mapped
+    _count_mapping_errors(batch, errors, summary)
+    mapped = [(batch[i], contact) for i, contact in contacts]
+
+    existing = _existing_customer_ids(cursor, [c["email"] for _, c in mapped], environment)
+    # One reservation for the whole batch; a repeated new email leaves a gap
+    new_ids = iter(generate_ids(
+        "CUST", sum(1 for _, c in mapped if c["email"] not in existing), "customers",
+        dry_run=dry_run, conn=cursor.connection,
+    ))
+
+    plan = []
+    for hs_contact, contact in mapped:
+        email = contact["email"]
+        if email is not None and email in existing:
+            # Also covers a repeated email later in the same batch
+            entity_id, fingerprint = existing[email]
+            action = "unchanged" if fingerprint == contact["fingerprint"] else "update"
+        else:
+            entity_id = next(new_ids)
+            action = "create"
+        if email is not None:
+            existing[email] = (entity_id, contact["fingerprint"])
+        plan.append((hs_contact, contact, entity_id, action))
+    return plan
+
+
+def _contact_batch_rows(conn, plan, environment, map_source):
+    now = datetime.now().isoformat()
+    customer_rows, mapping_rows = [], []
+    mapping_ids = iter(generate_ids("MAP", len(plan) if map_source else 0, "id_mappings", conn=conn))
+    for hs_contact, contact, entity_id, action in plan:
+        values = dict(contact, id=entity_id, created_at=now, last_synced_at=now, environment=environment)
+        customer_rows.append(tuple(values.get(c) for c in CUSTOMER_COLUMNS))
+        if map_source:
+            mapping_rows.append((
+                next(mapping_ids), map_source, hs_contact.get(f"{map_source}_id"), "fwd_crm", entity_id, now
+            ))
+    return customer_rows, mapping_rows
+
+
+def _write_contact_rows(cursor, customer_rows, mapping_rows):
+    cursor.executemany(UPSERT_CUSTOMER_SQL, customer_rows)
+    cursor.executemany("""
+        INSERT INTO id_mappings (id, source_system, source_id, target_system, target_id, created_at)
+        VALUES (?,?,?,?,?,?)
+    """, mapping_rows)
+
+
+def _write_contact_batch(conn, batch, environment, dry_run, summary,
+                         mapper=map_hubspot_contact, map_source="hubspot", checkpoint=None, mapped=None):
+    """
+    Write one batch inside a single transaction.
+    mapper turns each record into customers columns; map_source names the
+    system whose "<map_source>_id" is recorded in id_mappings (None: no mappings).
+    If the bulk statements fail, the batch is replayed row by row under
+    savepoints so only the offending records are reported as failed.
+    Unchanged records are counted and skipped: no upsert, audit or mapping row.
+    Audit events for the written records are queued once the batch commits.
+    checkpoint: save_run_checkpoint arguments, committed with the batch.
+    mapped: the batch already run through map_contact_chunk (by a worker).
+    """
+    cursor = conn.cursor()
+    plan = _plan_contact_batch(cursor, batch, environment, summary, mapper, mapped, dry_run)
+    unchanged = sum(1 for item in plan if item[3] == "unchanged")
+    summary["unchanged"] += unchanged
+    plan = [item for item in plan if item[3] != "unchanged"]
+
+    if dry_run:
+        succeeded = plan
+    else:
+        customer_rows, mapping_rows = _contact_batch_rows(conn, plan, environment, map_source)
+        # A savepoint outside a transaction would commit on RELEASE; open one
+        # so rows, mappings, version bump and checkpoint commit together.
+        if not conn.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SAVEPOINT contact_batch")
+        try:
+            _write_contact_rows(cursor, customer_rows, mapping_rows)
+            cursor.execute("RELEASE contact_batch")
+            succeeded = plan
+        except sqlite3.Error:
+            cursor.execute("ROLLBACK TO contact_batch")
+            cursor.execute("RELEASE contact_batch")
+            succeeded = []
+            for i, item in enumerate(plan):
+                cursor.execute("SAVEPOINT contact_row")
+                try:
+                    _write_contact_rows(cursor, customer_rows[i:i + 1], mapping_rows[i:i + 1])
+                    cursor.execute("RELEASE contact_row")
+                    succeeded.append(item)
+                except sqlite3.Error as e:
+                    cursor.execute("ROLLBACK TO contact_row")
+                    cursor.execute("RELEASE contact_row")
+                    summary["failed"] += 1
+                    summary["errors"].append({"email": item[1].get("email"), "error": str(e)})
+        if succeeded:
+            bump_data_version(conn, "customers")
+        if checkpoint:
+            save_run_checkpoint(conn=conn, **checkpoint)
+        conn.commit()
+        now = datetime.now().isoformat()
+        log_audit_events([
+            ("customer", entity_id, action, now, "migration_engine") for _, _, entity_id, action in succeeded
+        ])
+
+    for _, _, _, action in succeeded:
+        if action == "create":
+            summary["created"] += 1
+        else:
+            summary["updated"] += 1
+
+
+# ---------------------------
+# Parallel mapping, single writer
+# ---------------------------
+# SQLite takes one writer at a time, but most of a contact batch's CPU time
+# is mapping and fingerprinting. With workers > 1 that part runs in a
+# process pool while this process stays the only writer, applying results
+# in input order. At most workers * PARALLEL_PENDING_PER_WORKER batches are
+# in flight: the source is only read as fast as the writer keeps up.
+PARALLEL_PENDING_PER_WORKER = 2
+# "spawn" keeps workers clear of the audit writer and NetSuite threads a
+# forked child would inherit mid-flight
+PARALLEL_START_METHOD = "spawn"
+
+
+def _mapped_batches(batches, workers=None, mapper=map_hubspot_contact):
+    """
+    Yield (batch, mapped) for every batch, in order. mapped is
+    map_contact_chunk's result from a worker process, or None when
+    workers is not above 1 (the writer then maps the batch itself).
+    """
+    if not workers or workers <= 1:
+        for batch in batches:
+            yield batch, None
+        return
+
+    # Loaded here once; workers get the reference tables with each batch
+    validator = get_contact_validator()
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context(PARALLEL_START_METHOD)
+    )
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append((batch, pool.submit(map_contact_chunk, batch, mapper, validator)))
+            if len(pending) >= workers * PARALLEL_PENDING_PER_WORKER:
+                batch, future = pending.popleft()
+                with metrics.timer("transform_wait_seconds"):
+                    mapped = future.result()
+                yield batch, mapped
+        while pending:
+            batch, future = pending.popleft()
+            with metrics.timer("transform_wait_seconds"):
+                mapped = future.result()
+            yield batch, mapped
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def migrate_hubspot_contacts_batched(hubspot_contacts, environment="SANDBOX", dry_run=False, batch_size=500,
+                                     run_id=None, workers=None):
+    """
+    Migrate HubSpot contacts batch_size records at a time.
+    Each batch is one transaction on one connection: a bulk upsert into
+    customers plus bulk id_mappings rows; audit events follow in bulk.
+    With a run_id, each batch also commits the run's "contacts" checkpoint
+    (records consumed so far). Calling again with the same run_id and the
+    same input skips straight past the committed batches without mapping
+    or looking them up, and the run is marked completed or failed at the end.
+    With workers > 1 batches are mapped in a process pool (see
+    _mapped_batches); the result is the same as with one process.
+    Returns the same summary shape as migrate_hubspot_contacts.
+    """
+    summary = {"created": 0, "updated": 0, "unchanged": 0, "failed": 0, "errors": []}
+
+    if not dry_run:
+        ensure_schema()
+
+    checkpoint = None
+    if run_id:
+        checkpoint = get_run_checkpoint(run_id, "contacts") or {"batch": 0, "records": 0}
+        summary["run_id"] = run_id
+        summary["resumed_after"] = checkpoint["records"]
+        hubspot_contacts = itertools.islice(hubspot_contacts, checkpoint["records"], None)
+
+    conn = get_conn()
+    try:
+        for batch, mapped in _mapped_batches(_chunked(hubspot_contacts, batch_size), workers):
+            batch_checkpoint = None
+            if checkpoint:
+                checkpoint["batch"] += 1
+                checkpoint["records"] += len(batch)
+                batch_checkpoint = {
+                    "run_id": run_id, "object_type": "contacts",
+                    "cursor": {"offset": checkpoint["records"]},
+                    "batch": checkpoint["batch"], "records": checkpoint["records"],
+                }
+            _write_contact_batch(
+                conn, batch, environment, dry_run, summary, checkpoint=batch_checkpoint, mapped=mapped
+            )
+    except BaseException:
+        # Drop the failed batch's write lock before marking the run failed
+        conn.close()
+        if run_id and not dry_run:
+            finish_migration_run(run_id, "failed")
+        raise
+    finally:
+        conn.close()
+
+    if run_id and not dry_run:
+        finish_migration_run(run_id)
+    metrics.count_summary("hubspot_contacts", summary)
+    return summary
+
 
+def bulk_upsert_contacts(contacts, environment="SANDBOX", dry_run=False):
+    """
+    Upsert already FWD-shaped contacts (the save_or_update_contact input)
+    in one transaction. Returns the usual created/updated/failed summary.
+    """
+    summary = {"created": 0, "updated": 0, "unchanged": 0, "failed": 0, "errors": []}
+    contacts = list(contacts)
+    if not contacts:
+        return summary
+
+    if not dry_run:
+        ensure_schema()
+
+    conn = get_conn()
+    try:
+        _write_contact_batch(
+            conn, contacts, environment, dry_run, summary,
+            mapper=project_contact, map_source=None
+        )
+    finally:
+        conn.close()
+
+    metrics.count_summary("bulk_upsert_contacts", summary)
     return summary
 
 
 # ---------------------------
 # Migrate from CSV
 # ---------------------------
-def migrate_from_csv(file_path, environment="SANDBOX", dry_run=False):
+# HubSpot export columns read by map_hubspot_contact
+CSV_COLUMNS = [
+    "hubspot_id", "netsuite_id", "firstname", "lastname", "email", "phone",
+    "company", "brand", "lifecycle_stage", "pipeline_stage", "customer_type",
+    "address", "city", "state", "zip", "country", "notes",
+]
+
+
+def migrate_from_csv(file_path, environment="SANDBOX", dry_run=False, chunk_size=None, on_progress=None,
+                     workers=None):
     """
     Import contacts from CSV and migrate.
+    Pass chunk_size to stream the file instead of loading it whole, and
+    workers to map chunks in a process pool; see migrate_csv_in_chunks.
     """
+    if chunk_size:
+        return migrate_csv_in_chunks(
+            file_path, environment=environment, dry_run=dry_run,
+            chunk_size=chunk_size, on_progress=on_progress, workers=workers
+        )
     df = pd.read_csv(file_path)
     contacts = df.to_dict(orient="records")
-    return migrate_hubspot_contacts(contacts, environment=environment, dry_run=dry_run)
+    return migrate_hubspot_contacts(contacts, environment=environment, dry_run=dry_run, workers=workers)
+
+
+def iter_csv_frames(file_path, chunk_size=10_000, columns=CSV_COLUMNS):
+    """
+    Yield DataFrames of chunk_size rows.
+    Only the known columns are parsed, all as text (so ZIPs keep leading
+    zeros), and empty cells come back as None.
+    """
+    wanted = set(columns)
+    reader = pd.read_csv(
+        file_path,
+        chunksize=chunk_size,
+        usecols=lambda c: c in wanted,
+        dtype=str,
+    )
+    for chunk in reader:
+        yield chunk.astype(object).where(chunk.notna(), None)
+
+
+def iter_csv_chunks(file_path, chunk_size=10_000, columns=CSV_COLUMNS):
+    """Yield lists of contact dicts, chunk_size rows at a time; see iter_csv_frames."""
+    for chunk in iter_csv_frames(file_path, chunk_size, columns):
+        yield chunk.to_dict(orient="records")
+
+
+def iter_mapped_csv_chunks(file_path, chunk_size=10_000, mapping="contacts"):
+    """
+    Yield lists of already mapped contacts (customers columns), chunk_size
+    rows at a time. Each chunk goes through the column-wise variant of
+    mappings.<mapping>, not through the per-record mapper.
+    """
+    map_frame = get_frame_mapper(mapping)
+    for chunk in iter_csv_frames(file_path, chunk_size):
+        with metrics.timer("transform_seconds", stage="map_contact_frame"):
+            contacts = map_frame(chunk).to_dict(orient="records")
+        yield contacts
+
+
+def migrate_csv_in_chunks(file_path, environment="SANDBOX", dry_run=False, chunk_size=10_000, on_progress=None,
+                          workers=None):
+    """
+    Stream a CSV into the FWD CRM chunk by chunk.
+    Chunks are mapped column-wise (iter_mapped_csv_chunks), then go
+    straight through the batched write path in one transaction each, so
+    peak memory is bounded by chunk_size, not file size (times the chunks
+    in flight when workers > 1 fingerprint them in parallel).
+    on_progress(chunk_number, rows_done, summary) is called after every chunk.
+    """
+    summary = {"created": 0, "updated": 0, "unchanged": 0, "failed": 0, "errors": []}
+
+    if not dry_run:
+        ensure_schema()
+
+    rows_done = 0
+    conn = get_conn()
+    try:
+        chunks = _mapped_batches(iter_mapped_csv_chunks(file_path, chunk_size), workers, mapper=project_contact)
+        for chunk_number, (contacts, mapped) in enumerate(chunks, start=1):
+            _write_contact_batch(
+                conn, contacts, environment, dry_run, summary, mapper=project_contact, mapped=mapped
+            )
+            rows_done += len(contacts)
+            if on_progress:
+                on_progress(chunk_number, rows_done, summary)
+            else:
+                print(f"[CSV] chunk {chunk_number}: {rows_done} rows "
+                      f"(created {summary['created']}, updated {summary['updated']}, "
+                      f"unchanged {summary['unchanged']}, failed {summary['failed']})")
+    finally:
+        conn.close()
+
+    metrics.count_summary("csv_import", summary)
+    return summary
 
 
 # ---------------------------
@@ -255,51 +765,121 @@ if __name__ == "__main__":
     # ---------------------------
 # HubSpot → NetSuite migration
 # ---------------------------
-def migrate_hubspot_to_netsuite(hubspot_contacts, netsuite_api, environment="SANDBOX", dry_run=False):
+def map_netsuite_payload(hs_contact):
+    """
+    Build the NetSuite customer payload for a HubSpot contact
+    (mappings.netsuite_customers in config.yaml).
+    """
+    return get_mapper("netsuite_customers")(hs_contact)
+
+
+def migrate_hubspot_to_netsuite(hubspot_contacts, netsuite_api, environment="SANDBOX", dry_run=False,
+                                id_cache=None, batch_size=500, batch_mode=False):
     """
     Push HubSpot contacts to NetSuite.
     netsuite_api: instance with methods like create_customer(), update_customer()
-    Returns summary of created/updated/failed.
+    id_cache: optional IdMappingCache to share across calls; ID mappings for
+    each batch of batch_size contacts are prefetched into it in bulk.
+    batch_mode: coalesce the pushes into bulk upserts through
+    netsuite_api.batcher("customer") (see NetSuiteLoader); results are still
+    counted and mapped per record.
+    Contacts whose payload matches the fingerprint stored on their NetSuite
+    mapping are counted as unchanged and not sent.
+    Returns summary of created/updated/unchanged/failed.
     """
-    summary = {"created": 0, "updated": 0, "failed": 0, "errors": []}
+    summary = {"created": 0, "updated": 0, "unchanged": 0, "failed": 0, "errors": []}
+    if id_cache is None:
+        id_cache = IdMappingCache()
+
+    for batch in _chunked(hubspot_contacts, batch_size):
+        id_cache.prefetch("hubspot", [c.get("hubspot_id") for c in batch], "fwd_crm")
+        fwd_ids = [id_cache.get_target_id("hubspot", c.get("hubspot_id"), "fwd_crm") for c in batch]
+        id_cache.prefetch("fwd_crm", fwd_ids, "netsuite")
+        if batch_mode and not dry_run:
+            _push_netsuite_bulk(batch, netsuite_api, id_cache, summary)
+        else:
+            _push_netsuite_batch(batch, netsuite_api, dry_run, id_cache, summary)
+
+    metrics.count_summary("netsuite_push", summary)
+    return summary
 
+
+def _push_netsuite_bulk(hubspot_contacts, netsuite_api, id_cache, summary):
+    """
+    Queue every contact of the batch on a RecordBatcher, flush, then
+    demultiplex: each success is counted (and mapped when created), each
+    failure is reported on its own.
+    """
+    batcher = netsuite_api.batcher("customer")
+    queued = []
+    for hs_contact in hubspot_contacts:
+        try:
+            fwd_id = id_cache.get_target_id("hubspot", hs_contact.get("hubspot_id"), "fwd_crm")
+            if not fwd_id:
+                raise ValueError("Contact not yet in FWD CRM. Run FWD migration first.")
+            netsuite_id = id_cache.get_target_id("fwd_crm", fwd_id, "netsuite")
+            with metrics.timer("transform_seconds", stage="map_netsuite"):
+                payload = map_netsuite_payload(hs_contact)
+                fingerprint = record_fingerprint(payload)
+            if netsuite_id and id_cache.get_fingerprint("fwd_crm", fwd_id, "netsuite") == fingerprint:
+                summary["unchanged"] += 1
+                continue
+            future = batcher.add(payload, netsuite_id=netsuite_id, source_id=hs_contact.get("hubspot_id"))
+            queued.append((hs_contact, fwd_id, netsuite_id, fingerprint, future))
+        except Exception as e:
+            summary["failed"] += 1
+            summary["errors"].append({"email": hs_contact.get("email"), "error": str(e)})
+    batcher.close()
+
+    new_mappings = []
+    pushed = []
+    for hs_contact, fwd_id, netsuite_id, fingerprint, future in queued:
+        try:
+            new_ns_id = future.result()
+        except Exception as e:
+            summary["failed"] += 1
+            summary["errors"].append({"email": hs_contact.get("email"), "error": str(e)})
+            continue
+        if netsuite_id:
+            pushed.append(("fwd_crm", fwd_id, "netsuite", fingerprint))
+            summary["updated"] += 1
+        else:
+            new_mappings.append(("fwd_crm", fwd_id, "netsuite", new_ns_id, fingerprint))
+            summary["created"] += 1
+    id_cache.save_id_mappings(new_mappings)
+    id_cache.save_fingerprints(pushed)
+
+
+def _push_netsuite_batch(hubspot_contacts, netsuite_api, dry_run, id_cache, summary):
+    pushed = []
     for hs_contact in hubspot_contacts:
         try:
             # Check if already migrated
-            fwd_id = get_target_id("hubspot", hs_contact.get("hubspot_id"), "fwd_crm")
+            fwd_id = id_cache.get_target_id("hubspot", hs_contact.get("hubspot_id"), "fwd_crm")
             if not fwd_id:
                 # Skip contacts not yet in FWD CRM
                 raise ValueError("Contact not yet in FWD CRM. Run FWD migration first.")
 
-            netsuite_id = get_target_id("fwd_crm", fwd_id, "netsuite")
-
-            payload = {
-                "first_name": hs_contact.get("firstname"),
-                "last_name": hs_contact.get("lastname"),
-                "email": hs_contact.get("email"),
-                "phone": hs_contact.get("phone"),
-                "company": hs_contact.get("company"),
-                "brand": hs_contact.get("brand"),
-                "address": hs_contact.get("address"),
-                "city": hs_contact.get("city"),
-                "state": hs_contact.get("state"),
-                "zip": hs_contact.get("zip"),
-                "country": hs_contact.get("country"),
-                "customer_type": hs_contact.get("customer_type", "Retail"),
-                "lifecycle_stage": hs_contact.get("lifecycle_stage", "Lead"),
-                "pipeline_stage": hs_contact.get("pipeline_stage", "Lead"),
-                "notes": hs_contact.get("notes")
-            }
-
-            if netsuite_id:
+            netsuite_id = id_cache.get_target_id("fwd_crm", fwd_id, "netsuite")
+
+            with metrics.timer("transform_seconds", stage="map_netsuite"):
+                payload = map_netsuite_payload(hs_contact)
+                fingerprint = record_fingerprint(payload)
+
+            if netsuite_id and id_cache.get_fingerprint("fwd_crm", fwd_id, "netsuite") == fingerprint:
+                # NetSuite already has exactly this payload
+                summary["unchanged"] += 1
+            elif netsuite_id:
                 if not dry_run:
                     netsuite_api.update_customer(netsuite_id, payload)
+                    pushed.append(("fwd_crm", fwd_id, "netsuite", fingerprint))
                 action = "update"
                 summary["updated"] += 1
             else:
                 if not dry_run:
                     new_ns_id = netsuite_api.create_customer(payload)
-                    save_id_mapping("fwd_crm", fwd_id, "netsuite", new_ns_id, dry_run=dry_run)
+                    id_cache.save_id_mapping("fwd_crm", fwd_id, "netsuite", new_ns_id, dry_run=dry_run,
+                                             fingerprint=fingerprint)
                 action = "create"
                 summary["created"] += 1
 
@@ -307,4 +887,4 @@ def migrate_hubspot_to_netsuite(hubspot_contacts, netsuite_api, environment="SAN
             summary["failed"] += 1
             summary["errors"].append({"email": hs_contact.get("email"), "error": str(e)})
 
-    return summary
\ No newline at end of file
+    id_cache.save_fingerprints(pushed)
\ No newline at end of file
@@ -0,0 +1,44 @@
+# =========================================
+# services/reporting.py
+# =========================================
+
+from database import db_session, ensure_schema
+
+# Dimensions kept in customer_stats by the schema-step-5 triggers
+REPORT_DIMENSIONS = ["pipeline_stage", "customer_type", "brand"]
+
+
+def fetch_customer_stats(environment):
+    """
+    Customer counts for one environment, grouped by dimension.
+    Returns {dimension: [{"value": ..., "count": ...}, ...]} from the
+    customer_stats summary table; customers itself is never scanned.
+    """
+    ensure_schema()
+    stats = {dimension: [] for dimension in REPORT_DIMENSIONS}
+    with db_session(read_only=True) as conn:
+        rows = conn.execute("""
+            SELECT dimension, value, count FROM customer_stats
+            WHERE environment = ?
+            ORDER BY dimension, value
+        """, (environment,)).fetchall()
+    for row in rows:
+        if row["dimension"] in stats:
+            stats[row["dimension"]].append({"value": row["value"], "count": row["count"]})
+    return stats
+
+
+def rebuild_customer_stats():
+    """
+    Recompute customer_stats from scratch, e.g. after rows were changed
+    with triggers disabled or restored from a backup.
+    """
+    ensure_schema()
+    with db_session() as conn:
+        conn.execute("DELETE FROM customer_stats")
+        for dimension in REPORT_DIMENSIONS:
+            conn.execute(f"""
+                INSERT INTO customer_stats (environment, dimension, value, count)
+                SELECT COALESCE(environment, ''), '{dimension}', COALESCE({dimension}, ''), COUNT(*)
+                FROM customers GROUP BY 1, 3
+            """)
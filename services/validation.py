@@ -0,0 +1,215 @@
+# =========================================
+# services/validation.py
+# Column-wise contact normalisation and validation before load
+# =========================================
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+import database
+from database import db_session, ensure_schema
+from utils import metrics
+from utils.zip_index import normalize_zip
+
+# ---------------------------
+# Settings
+# ---------------------------
+VALIDATE_CONTACTS = True
+REQUIRE_EMAIL = True                 # email is the dedup key: rows without one are rejected
+DEFAULT_COUNTRY = "United States"    # state and ZIP rules apply to it and to rows with no country
+DEFAULT_CALLING_CODE = "1"           # for 10-digit national phone numbers
+
+# Columns the validator rewrites; everything else passes through untouched
+VALIDATED_FIELDS = ("email", "phone", "state", "country", "zip")
+
+EMAIL_PATTERN = (
+    r"^[A-Za-z0-9.!#$%&'*+/=?^_`{|}~-]+"
+    r"@[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?(?:\.[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?)+$"
+)
+COUNTRY_ALIASES = {
+    "us": "United States", "u.s.": "United States", "usa": "United States", "u.s.a.": "United States",
+    "united states of america": "United States",
+}
+
+
+def _text(series):
+    """Stripped text with empty cells as <NA>."""
+    text = series.astype("string").str.strip()
+    return text.mask(text == "")
+
+
+def _objects(series):
+    return series.astype(object).where(series.notna(), None)
+
+
+# ---------------------------
+# Column normalisers
+# ---------------------------
+# Each takes a Series and returns (normalised Series, invalid mask); empty
+# values are never invalid.
+def normalize_emails(series):
+    emails = _text(series).str.lower()
+    invalid = emails.notna() & ~emails.str.match(EMAIL_PATTERN).fillna(False).astype(bool)
+    return emails, invalid
+
+
+def normalize_phones(series, calling_code=DEFAULT_CALLING_CODE):
+    """
+    E.164: "+<country code><number>", 8 to 15 digits. "+" and "00" numbers
+    keep their country code; 10-digit ones (and 11 starting with
+    calling_code) get calling_code. Extensions are dropped.
+    """
+    # Trailing ".0": the column was read as floats
+    text = _text(series).str.replace(r"(?:\.0|\s*(?:x|ext\.?|#)\s*\d+)$", "", case=False, regex=True)
+    digits = text.str.replace(r"\D", "", regex=True).to_numpy(dtype=object, na_value="")
+    present = text.notna().to_numpy()
+    plus = text.str.startswith("+").to_numpy(dtype=bool, na_value=False)
+    length = np.fromiter(map(len, digits), dtype=int, count=len(digits))
+    prefix = np.array([d[:2] for d in digits], dtype=object)
+    head = np.array([d[:len(calling_code)] for d in digits], dtype=object)
+
+    zero_zero = ~plus & (prefix == "00")
+    international = plus | zero_zero
+    national = ~international & (length == 10)
+    trunk = ~international & (length == len(calling_code) + 10) & (head == calling_code)
+    number = np.select(
+        [plus | trunk, zero_zero, national],
+        ["+" + digits, "+" + np.array([d[2:] for d in digits], dtype=object), "+" + calling_code + digits],
+        default=None,
+    )
+    e164_length = np.fromiter((len(n) if n else 0 for n in number), dtype=int, count=len(number))
+    valid = (e164_length >= 9) & (e164_length <= 16)
+    invalid = present & ~valid
+    return (
+        pd.Series(np.where(valid, number, None), index=series.index, dtype=object),
+        pd.Series(invalid, index=series.index),
+    )
+
+
+class ContactValidator:
+    """
+    Normalises and validates contact columns in bulk against the states and
+    countries reference tables, which it holds as plain dicts (so it can be
+    pickled to worker processes).
+
+    An empty reference table switches its check off. State and ZIP are
+    only checked for DEFAULT_COUNTRY (or no country): state becomes its
+    two-letter code, ZIP its 5 digits.
+    """
+
+    def __init__(self, states, countries, calling_code=DEFAULT_CALLING_CODE):
+        self.states = {}
+        for code, name in states:
+            self.states[code.upper()] = code
+            if name:
+                self.states[name.upper()] = code
+        self.countries = {name.casefold(): name for name in countries}
+        self.calling_code = calling_code
+
+    def __call__(self, df):
+        return self.validate(df)
+
+    def validate(self, df):
+        """
+        (clean, rejects) for a DataFrame of contacts.
+        clean: the accepted rows, VALIDATED_FIELDS normalised (None when empty).
+        rejects: one row per rejected record, indexed like df, with its
+        original email and the reasons ("invalid phone; unknown state").
+        """
+        out = df.copy()
+        problems = {}
+
+        if "email" in out:
+            out["email"], problems["invalid email"] = normalize_emails(out["email"])
+            if REQUIRE_EMAIL:
+                problems["missing email"] = out["email"].isna()
+        elif REQUIRE_EMAIL:
+            problems["missing email"] = pd.Series(True, index=out.index)
+
+        if "phone" in out:
+            out["phone"], problems["invalid phone"] = normalize_phones(out["phone"], self.calling_code)
+
+        country = _text(out["country"]) if "country" in out else pd.Series(pd.NA, index=out.index, dtype="string")
+        folded = country.str.casefold()
+        canonical = folded.map(COUNTRY_ALIASES).astype("string")
+        if self.countries:
+            canonical = canonical.fillna(folded.map(self.countries).astype("string"))
+            problems["unknown country"] = country.notna() & canonical.isna()
+        country = canonical.fillna(country)
+        if "country" in out:
+            out["country"] = country
+        domestic = (country.isna() | (country == DEFAULT_COUNTRY)).fillna(False).astype(bool)
+
+        if "state" in out:
+            state = _text(out["state"])
+            if self.states:
+                code = state.str.upper().map(self.states).astype("string")
+                problems["unknown state"] = domestic & state.notna() & code.isna()
+                state = state.mask(domestic & code.notna(), code)
+            out["state"] = state
+
+        if "zip" in out:
+            text = _text(out["zip"])
+            zips = pd.Series(
+                [normalize_zip(v) if v is not pd.NA else None for v in text], index=out.index, dtype="string"
+            )
+            problems["invalid zip"] = domestic & text.notna() & zips.isna()
+            out["zip"] = text.mask(domestic, zips)
+
+        for field in VALIDATED_FIELDS:
+            if field in out:
+                out[field] = _objects(out[field])
+
+        reasons = pd.Series("", index=out.index, dtype=object)
+        rejected = pd.Series(False, index=out.index)
+        for reason, mask in problems.items():
+            mask = mask.fillna(False).astype(bool)
+            if mask.any():
+                metrics.count("validation_rejects_total", int(mask.sum()), reason=reason)
+                reasons = reasons.where(~mask, reasons + "; " + reason)
+                rejected |= mask
+        rejects = pd.DataFrame({
+            "email": df["email"][rejected] if "email" in df else None,
+            "reasons": reasons[rejected].str[2:],
+        }, index=out.index[rejected])
+        return out[~rejected], rejects
+
+
+# ---------------------------
+# Reference data
+# ---------------------------
+_validators = {}
+_lock = threading.Lock()
+
+
+def load_reference_data():
+    """([(code, name)] from states, [name] from countries)."""
+    ensure_schema()
+    with db_session(read_only=True) as conn:
+        states = [(r["code"], r["name"]) for r in conn.execute("SELECT code, name FROM states")]
+        countries = [r["name"] for r in conn.execute("SELECT name FROM countries")]
+    return states, countries
+
+
+def get_contact_validator(refresh=False):
+    """
+    The ContactValidator for the current database (reference tables read
+    once per process), or None when VALIDATE_CONTACTS is off.
+    """
+    if not VALIDATE_CONTACTS:
+        return None
+    with _lock:
+        validator = _validators.get(database.DB_PATH)
+        if validator is None or refresh:
+            validator = _validators[database.DB_PATH] = ContactValidator(*load_reference_data())
+        return validator
+
+
+def validate_contacts(df):
+    """(clean, rejects) for a DataFrame of contacts; see ContactValidator.validate."""
+    validator = get_contact_validator()
+    if validator is None:
+        return df, pd.DataFrame({"email": [], "reasons": []})
+    return validator(df)
@@ -0,0 +1,217 @@
+# =========================================
+# stubs/hubspot_stub.py
+# Local stand-in for the HubSpot CRM v3 list and search endpoints
+# =========================================
+
+import argparse
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MAX_PAGE_SIZE = 100
+SEARCH_PAGE_SIZE = 200
+SEARCH_RESULT_LIMIT = 10_000
+BASE_TIME = datetime(2024, 1, 1)
+BASE_MS = int((BASE_TIME - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+# Record IDs start at these offsets so object types never overlap
+ID_OFFSETS = {"contacts": 1_000_000, "companies": 2_000_000, "deals": 3_000_000}
+SINGULAR = {"contacts": "contact", "companies": "company", "deals": "deal"}
+
+
+def make_record(object_type, index, per_second=1):
+    """
+    Deterministic synthetic record number `index` of object_type.
+    per_second records share each modified time.
+    """
+    record_id = str(ID_OFFSETS[object_type] + index)
+    modified = (BASE_TIME + timedelta(seconds=index // per_second)).isoformat() + "Z"
+    if object_type == "contacts":
+        properties = {
+            "firstname": f"First{index}",
+            "lastname": f"Last{index}",
+            "email": f"contact{index}@example.com",
+            "phone": f"555{index:07d}",
+            "company": f"Company {index % 1000}",
+            "city": "Rochester",
+            "state": "NH",
+            "zip": "03867",
+            "country": "United States",
+        }
+    elif object_type == "companies":
+        properties = {
+            "name": f"Company {index}",
+            "domain": f"company{index}.example.com",
+        }
+    else:
+        properties = {
+            "dealname": f"Deal {index}",
+            "amount": str(100 + index % 10_000),
+            "dealstage": "appointmentscheduled",
+        }
+    properties["hs_lastmodifieddate"] = modified
+    properties["lastmodifieddate"] = modified
+    return {
+        "id": record_id,
+        "properties": properties,
+        "createdAt": modified,
+        "updatedAt": modified,
+        "archived": False,
+    }
+
+
+class HubSpotStubHandler(BaseHTTPRequestHandler):
+    # Set per server by start_hubspot_stub
+    counts = {}
+    latency = 0.0
+    per_second = 1
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 4 or parts[:3] != ["crm", "v3", "objects"] or parts[3] not in self.counts:
+            return self._send(404, {"status": "error", "message": "Not found"})
+
+        object_type = parts[3]
+        query = parse_qs(url.query)
+        limit = min(int(query.get("limit", ["10"])[0]), MAX_PAGE_SIZE)
+        start = int(query.get("after", ["0"])[0])
+        wanted = query.get("properties", [""])[0].split(",") if "properties" in query else None
+        associations = query.get("associations", [""])[0].split(",") if "associations" in query else []
+
+        end = min(start + limit, self.counts[object_type])
+        results = []
+        for index in range(start, end):
+            record = make_record(object_type, index, self.per_second)
+            if wanted is not None:
+                record["properties"] = {k: v for k, v in record["properties"].items() if k in wanted}
+            linked = self._associations(object_type, index, associations)
+            if linked:
+                record["associations"] = linked
+            results.append(record)
+
+        body = {"results": results}
+        if end < self.counts[object_type]:
+            body["paging"] = {"next": {"after": str(end)}}
+        if self.latency:
+            threading.Event().wait(self.latency)
+        self._send(200, body)
+
+    def do_POST(self):
+        """
+        /crm/v3/objects/<type>/search with one GTE filter on the modified date.
+        Record `index` was modified BASE_TIME + index // per_second seconds.
+        Like HubSpot, results are sorted by modified time only: records
+        sharing one come back in descending id order.
+        """
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if len(parts) != 5 or parts[4] != "search" or parts[3] not in self.counts:
+            return self._send(404, {"status": "error", "message": "Not found"})
+
+        object_type = parts[3]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+        since_ms = 0
+        for group in body.get("filterGroups", []):
+            for f in group.get("filters", []):
+                if f.get("operator") == "GTE":
+                    since_ms = int(f["value"])
+        limit = min(int(body.get("limit", 10)), SEARCH_PAGE_SIZE)
+        after = int(body.get("after") or 0)
+        if after >= SEARCH_RESULT_LIMIT:
+            return self._send(400, {"status": "error", "message": "Search paging limit reached"})
+
+        per_second = self.per_second
+        first = max(0, -(-(since_ms - BASE_MS) // 1000)) * per_second
+        start = first + after
+        end = min(start + limit, self.counts[object_type], first + SEARCH_RESULT_LIMIT)
+        wanted = body.get("properties")
+        results = []
+        for position in range(start, end):
+            # Reverse the order within each modified time
+            group = position - position % per_second
+            index = min(group + per_second, self.counts[object_type]) - 1 - (position - group)
+            record = make_record(object_type, index, per_second)
+            if wanted is not None:
+                record["properties"] = {k: v for k, v in record["properties"].items() if k in wanted}
+            results.append(record)
+
+        response = {"total": max(0, self.counts[object_type] - first), "results": results}
+        if end < self.counts[object_type]:
+            response["paging"] = {"next": {"after": str(end - first)}}
+        if self.latency:
+            threading.Event().wait(self.latency)
+        self._send(200, response)
+
+    def _associations(self, object_type, index, wanted):
+        """Deal `index` belongs to contact and company `index` (modulo their counts)."""
+        if object_type != "deals":
+            return {}
+        linked = {}
+        for other in wanted:
+            if self.counts.get(other):
+                other_id = str(ID_OFFSETS[other] + index % self.counts[other])
+                linked[other] = {"results": [{"id": other_id, "type": f"deal_to_{SINGULAR[other]}"}]}
+        return linked
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_hubspot_stub(counts=None, host="127.0.0.1", port=0, latency=0.0, per_second=1):
+    """
+    Serve the stub in a daemon thread.
+    per_second records share each modified time (see make_record).
+    Returns (server, base_url); call server.shutdown() when done.
+    """
+    handler = type("Handler", (HubSpotStubHandler,), {
+        "counts": dict(counts or {"contacts": 1000, "companies": 100, "deals": 100}),
+        "latency": latency,
+        "per_second": per_second,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def stub_config(config, base_url):
+    """
+    Copy of config with the HubSpot endpoints pointed at the stub.
+    """
+    config = json.loads(json.dumps(config))
+    config["hubspot"]["endpoints"] = {
+        object_type: f"{base_url}/crm/v3/objects/{object_type}"
+        for object_type in ("contacts", "companies", "deals")
+    }
+    return config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HubSpot CRM v3 stub")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--contacts", type=int, default=10_000)
+    parser.add_argument("--companies", type=int, default=1_000)
+    parser.add_argument("--deals", type=int, default=1_000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+
+    server, base_url = start_hubspot_stub(
+        {"contacts": args.contacts, "companies": args.companies, "deals": args.deals},
+        port=args.port,
+        latency=args.latency,
+    )
+    print(f"HubSpot stub listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
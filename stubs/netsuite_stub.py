@@ -0,0 +1,214 @@
+# =========================================
+# stubs/netsuite_stub.py
+# Local stand-in for the NetSuite REST record endpoints
+# =========================================
+
+import argparse
+import itertools
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+
+class NetSuiteStubState:
+    """
+    Records held by the stub plus the knobs that shape its behaviour.
+    concurrency_limit mimics NetSuite concurrency governance: requests beyond
+    it are answered with 429. error_rate injects random 503s.
+    POSTs to batch_path behave like the bulk upsert RESTlet; a record whose
+    values carry "_fail" is rejected individually, one with an externalId
+    and no id is upserted by it. PUTs to <path>/eid:<id> upsert by
+    external id.
+    """
+
+    def __init__(self, latency=0.0, concurrency_limit=None, error_rate=0.0, seed=0,
+                 batch_path="/app/site/hosting/restlet.nl"):
+        self.latency = latency
+        self.batch_path = batch_path
+        self.concurrency_limit = concurrency_limit
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.records = {}
+        self.external = {}
+        self.ids = itertools.count(1)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.batches = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+
+class NetSuiteStubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def _handle(self, method):
+        state = self.state
+        with state.lock:
+            state.requests += 1
+            if state.concurrency_limit and state.in_flight >= state.concurrency_limit:
+                state.rejected += 1
+                return self._send(429, {"title": "Concurrency limit exceeded"}, {"Retry-After": "0.05"})
+            if state.error_rate and state.random.random() < state.error_rate:
+                return self._send(503, {"title": "Service unavailable"})
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        try:
+            if state.latency:
+                threading.Event().wait(state.latency)
+            body = self._read_json()
+            path = self.path.split("?")[0].rstrip("/")
+            if method == "POST" and path == state.batch_path:
+                self._batch(body)
+            elif method == "POST":
+                self._create(path, body)
+            elif method == "PATCH":
+                self._update(path, body)
+            elif method == "PUT" and "/eid:" in path:
+                self._upsert_external(path, body)
+            else:
+                self._get(path)
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    def _create(self, path, body):
+        with self.state.lock:
+            record_id = str(next(self.state.ids))
+            self.state.records[f"{path}/{record_id}"] = body
+        self._send(204, None, {"Location": f"{self._base()}{path}/{record_id}"})
+
+    def _upsert_external(self, path, body):
+        record_path, _, ext_id = path.rpartition("/eid:")
+        ext_id = unquote(ext_id)
+        with self.state.lock:
+            key = self.state.external.get((record_path, ext_id))
+            if key is None:
+                key = f"{record_path}/{next(self.state.ids)}"
+                self.state.external[(record_path, ext_id)] = key
+                self.state.records[key] = body
+            else:
+                self.state.records[key].update(body or {})
+        self._send(204, None, {"Location": f"{self._base()}{key}"})
+
+    def _batch(self, body):
+        record_path = f"/{body.get('recordType', 'record')}"
+        results = []
+        with self.state.lock:
+            self.state.batches += 1
+            for record in body.get("records", []):
+                values = record.get("values") or {}
+                if values.get("_fail"):
+                    results.append({"ref": record.get("ref"), "error": str(values["_fail"])})
+                    continue
+                record_id = record.get("id")
+                ext_id = record.get("externalId")
+                if not record_id and ext_id:
+                    key = self.state.external.get((record_path, ext_id))
+                    if key is None:
+                        key = f"{record_path}/{next(self.state.ids)}"
+                        self.state.external[(record_path, ext_id)] = key
+                        self.state.records[key] = {}
+                    record_id = key.rsplit("/", 1)[-1]
+                key = f"{record_path}/{record_id}"
+                if record_id and key in self.state.records:
+                    self.state.records[key].update(values)
+                else:
+                    record_id = str(next(self.state.ids))
+                    self.state.records[f"{record_path}/{record_id}"] = values
+                results.append({"ref": record.get("ref"), "id": record_id})
+        self._send(200, {"results": results})
+
+    def _update(self, path, body):
+        with self.state.lock:
+            if path not in self.state.records:
+                return self._send(404, {"title": "Record not found"})
+            self.state.records[path].update(body or {})
+        self._send(204, None)
+
+    def _get(self, path):
+        record = self.state.records.get(path)
+        if record is None:
+            return self._send(404, {"title": "Record not found"})
+        self._send(200, dict(record, id=path.rsplit("/", 1)[-1]))
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _base(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if payload:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if payload:
+            self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_netsuite_stub(host="127.0.0.1", port=0, **state_options):
+    """
+    Serve the stub in a daemon thread.
+    Returns (server, base_url); server.state exposes records and counters.
+    """
+    state = NetSuiteStubState(**state_options)
+    handler = type("Handler", (NetSuiteStubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def stub_config(config, base_url):
+    """
+    Copy of config with NetSuite pointed at the stub and dry-run switched off.
+    """
+    config = json.loads(json.dumps(config))
+    config["netsuite"]["base_url"] = base_url
+    config["migration"]["dry_run"] = False
+    return config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local NetSuite REST stub")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--concurrency-limit", type=int, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, base_url = start_netsuite_stub(
+        port=args.port,
+        latency=args.latency,
+        concurrency_limit=args.concurrency_limit,
+        error_rate=args.error_rate,
+    )
+    print(f"NetSuite stub listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+# The repository root holds the top-level modules (database, pipeline, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import database  # noqa: E402
+from services.audit import close_audit_log  # noqa: E402
+from utils.helpers import load_config  # noqa: E402
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "config.yaml")
+
+
+@pytest.fixture
+def config(monkeypatch):
+    """config/config.yaml with dry-run off (point it at a stub before use)."""
+    monkeypatch.setattr("utils.helpers.CONFIG_PATH", CONFIG_PATH)
+    config = load_config()
+    config["migration"]["dry_run"] = False
+    return config
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, migrated CRM database (audit log and ID map too) under tmp_path."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "fwd_crm.db"))
+    monkeypatch.setattr("utils.helpers.ID_MAP_PATH", str(tmp_path / "id_map.json"))
+    database.ensure_schema()
+    yield database.DB_PATH
+    close_audit_log()
+    database.close_all_connections()
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+from services import audit
+
+EVENT = ("customer", "C1", "create", "2026-10-01T00:00:00", "tests")
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = audit.AuditWriter(str(tmp_path / "audit.db"), flush_interval=0.05)
+    yield writer
+    writer.close()
+
+
+@pytest.fixture
+def failing_writes(monkeypatch):
+    def fail(self, conn, partition):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(audit.AuditWriter, "_ensure_partition", fail)
+    return monkeypatch
+
+
+def _count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM audit_log_202610").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_flush_reports_a_failed_write(writer, failing_writes):
+    writer.log_many([EVENT])
+    assert writer.flush(timeout=5) is False
+    assert writer.written == 0
+
+
+def test_events_from_a_failed_flush_are_written_by_the_next_one(writer, failing_writes):
+    writer.log_many([EVENT])
+    assert writer.flush(timeout=5) is False
+
+    failing_writes.undo()
+    assert writer.flush(timeout=5) is True
+    assert writer.written == 1
+    assert _count(writer.path) == 1
+
+
+def test_close_saves_unwritten_events_for_the_next_writer(tmp_path, failing_writes):
+    path = str(tmp_path / "audit.db")
+    writer = audit.AuditWriter(path, flush_interval=0.01)
+    writer.log_many([EVENT, EVENT[:1] + ("C2",) + EVENT[2:]])
+    writer.close()
+    assert writer.spilled == 2
+
+    failing_writes.undo()
+    writer = audit.AuditWriter(path)
+    assert writer.flush(timeout=5) is True
+    writer.close()
+    assert _count(path) == 2
+    assert not (tmp_path / "audit.db.unwritten.jsonl").exists()
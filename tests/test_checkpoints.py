@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+from database import get_run_checkpoint, get_sync_watermark, start_migration_run
+from pipeline import (
+    LoadRegistry, ObjectStage, OrderedCheckpoint, RunCheckpoint, WatermarkCheckpoint, run_pipeline,
+)
+
+
+def _run_stage(records, checkpoint):
+    stage = ObjectStage(
+        "contacts", iter(records), lambda record: f"NS-{record['id']}", LoadRegistry(), {},
+        threading.Lock(), checkpoint=checkpoint,
+    )
+    return run_pipeline([stage], report=lambda line: None)["contacts"]
+
+
+def test_stage_with_nothing_to_do_is_checkpointed_complete(db):
+    run_id = start_migration_run("sync", "SANDBOX")
+    _run_stage([], RunCheckpoint(run_id, "contacts"))
+    assert get_run_checkpoint(run_id, "contacts")["complete"]
+
+
+def test_resumed_stage_without_new_records_is_checkpointed_complete(db):
+    run_id = start_migration_run("sync", "SANDBOX")
+    records = [{"id": str(i), "_cursor": [None, i + 1]} for i in range(3)]
+    # First run: everything loaded, but it died before closing the stage
+    checkpoint = RunCheckpoint(run_id, "contacts", save_every=1)
+    for seq, record in enumerate(records):
+        checkpoint.record(seq, record["_cursor"], True)
+    saved = get_run_checkpoint(run_id, "contacts")
+    assert not saved["complete"]
+
+    result = _run_stage([], RunCheckpoint(run_id, "contacts", saved))
+
+    assert result["loaded"] == 0
+    saved = get_run_checkpoint(run_id, "contacts")
+    assert saved["complete"] and saved["cursor"] == [None, 3] and saved["records"] == 3
+
+
+def test_dry_runs_save_nothing(db):
+    run_id = start_migration_run("sync", "SANDBOX")
+    _run_stage([{"id": "1", "_cursor": [None, 1]}], RunCheckpoint(run_id, "contacts", dry_run=True))
+    assert get_run_checkpoint(run_id, "contacts") is None
+
+
+def test_watermark_without_records_keeps_the_previous_one(db):
+    _run_stage([], WatermarkCheckpoint("contacts", "SANDBOX", None))
+    assert get_sync_watermark("contacts", "SANDBOX") is None
+    _run_stage([{"id": "7", "_watermark": (1000, "7")}], WatermarkCheckpoint("contacts", "SANDBOX", None))
+    _run_stage([], WatermarkCheckpoint("contacts", "SANDBOX", (1000, "7")))
+    assert get_sync_watermark("contacts", "SANDBOX") == (1000, "7")
+
+
+def test_checkpoint_without_save_fails_when_built():
+    class Unsaved(OrderedCheckpoint):
+        pass
+
+    with pytest.raises(TypeError):
+        Unsaved(start=None)
@@ -0,0 +1,114 @@
+import pytest
+
+import database
+from database import db_session, ensure_schema, get_run_checkpoint, start_migration_run
+from services import migration_engine
+from services.migration_engine import migrate_hubspot_contacts, migrate_hubspot_contacts_batched
+
+COUNTS = ("created", "updated", "unchanged", "failed")
+
+
+def _contacts(n, changes=None):
+    return [
+        dict({
+            "hubspot_id": str(100 + i), "email": f"Contact{i}@Example.com", "firstname": f"First{i}",
+            "lastname": f"Last{i}", "phone": f"555{i:07d}", "state": "NH", "zip": "03867",
+        }, **(changes or {}).get(i, {}))
+        for i in range(n)
+    ]
+
+
+def _customers(environment="SANDBOX"):
+    with db_session(read_only=True) as conn:
+        rows = conn.execute("""
+            SELECT hubspot_id, email, first_name, last_name, phone, state, zip, fingerprint
+            FROM customers WHERE environment = ? ORDER BY email
+        """, (environment,)).fetchall()
+    return [tuple(row) for row in rows]
+
+
+def _count(sql, *params):
+    with db_session(read_only=True) as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+
+def _counts(summary):
+    return {name: summary[name] for name in COUNTS}
+
+
+def _use_database(monkeypatch, path):
+    monkeypatch.setattr(database, "DB_PATH", str(path))
+    ensure_schema()
+
+
+def test_batched_and_serial_runs_agree(db, tmp_path, monkeypatch):
+    runs = [
+        _contacts(12, {3: {"email": "not-an-email"}}),
+        # Second pass: two changed, one new, the rest unchanged
+        _contacts(13, {3: {"email": "not-an-email"}, 4: {"firstname": "Changed"}, 7: {"phone": "603 555 0100"}}),
+    ]
+    serial = [_counts(migrate_hubspot_contacts(run)) for run in runs]
+    serial_rows = _customers()
+
+    _use_database(monkeypatch, tmp_path / "batched.db")
+    batched = [_counts(migrate_hubspot_contacts_batched(iter(run), batch_size=5)) for run in runs]
+
+    assert batched == serial
+    assert serial[0] == {"created": 11, "updated": 0, "unchanged": 0, "failed": 1}
+    assert serial[1] == {"created": 1, "updated": 2, "unchanged": 9, "failed": 1}
+    assert _customers() == serial_rows
+
+
+def test_failing_rows_fall_back_to_row_by_row_writes(db):
+    # The email is taken in another environment: the bulk upsert hits the
+    # global UNIQUE(email) and the batch is replayed row by row
+    migrate_hubspot_contacts(_contacts(1, {0: {"email": "taken@example.com"}}), environment="PROD")
+    version = _count("SELECT version FROM data_versions WHERE name = 'customers'")
+
+    summary = migrate_hubspot_contacts_batched(
+        iter(_contacts(5, {2: {"email": "taken@example.com"}})), batch_size=5
+    )
+
+    assert _counts(summary) == {"created": 4, "updated": 0, "unchanged": 0, "failed": 1}
+    assert summary["errors"][0]["email"] == "taken@example.com"
+    assert "UNIQUE" in summary["errors"][0]["error"]
+    assert len(_customers()) == 4
+    assert _count("SELECT COUNT(*) FROM id_mappings WHERE source_system = 'hubspot'") == 5  # 1 PROD + 4
+    assert _count("SELECT version FROM data_versions WHERE name = 'customers'") == version + 1
+
+
+def test_batch_rows_and_checkpoint_commit_together(db, monkeypatch):
+    run_id = start_migration_run("contacts", "SANDBOX")
+
+    def fail(**checkpoint):
+        raise RuntimeError("checkpoint write failed")
+
+    monkeypatch.setattr(migration_engine, "save_run_checkpoint", fail)
+    with pytest.raises(RuntimeError):
+        migrate_hubspot_contacts_batched(iter(_contacts(10)), batch_size=5, run_id=run_id)
+
+    # Neither the first batch's rows nor its mappings outlive the failed commit
+    assert _customers() == []
+    assert _count("SELECT COUNT(*) FROM id_mappings") == 0
+    assert _count("SELECT status FROM migration_runs WHERE run_id = ?", run_id) == "failed"
+
+
+def test_resume_skips_committed_batches(db):
+    run_id = start_migration_run("contacts", "SANDBOX")
+    contacts = _contacts(12)
+
+    def dies_after(n):
+        for i, contact in enumerate(contacts):
+            if i == n:
+                raise ConnectionError("HubSpot went away")
+            yield contact
+
+    with pytest.raises(ConnectionError):
+        migrate_hubspot_contacts_batched(dies_after(7), batch_size=5, run_id=run_id)
+    assert get_run_checkpoint(run_id, "contacts")["records"] == 5
+
+    summary = migrate_hubspot_contacts_batched(iter(contacts), batch_size=5, run_id=run_id)
+
+    assert summary["resumed_after"] == 5
+    assert _counts(summary) == {"created": 7, "updated": 0, "unchanged": 0, "failed": 0}
+    assert len(_customers()) == 12
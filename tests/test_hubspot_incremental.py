@@ -0,0 +1,54 @@
+import pytest
+
+import hubspot_extractor
+from hubspot_extractor import HubSpotExtractor
+from stubs import hubspot_stub
+
+COUNT = 30
+PER_SECOND = 4  # records sharing each modified time, returned highest id first
+
+
+@pytest.fixture
+def extractor(config):
+    server, base_url = hubspot_stub.start_hubspot_stub(
+        {"contacts": COUNT, "companies": 0, "deals": 0}, per_second=PER_SECOND
+    )
+    config = hubspot_stub.stub_config(config, base_url)
+    config["migration"]["batch_size"] = 7
+    yield HubSpotExtractor(config)
+    server.shutdown()
+
+
+def _index(record):
+    return int(record["id"]) - hubspot_stub.ID_OFFSETS["contacts"]
+
+
+def test_yields_every_record_sharing_a_modified_time(extractor):
+    records = list(extractor.fetch_changed("contacts"))
+    assert sorted(_index(r) for r in records) == list(range(COUNT))
+    # Oldest first, whatever the id order within a millisecond
+    modified = [r["_watermark"][0] for r in records]
+    assert modified == sorted(modified)
+
+
+@pytest.mark.parametrize("processed", [1, 2, 4, 9, 30])
+def test_resume_reprocesses_the_watermark_millisecond(extractor, processed):
+    first_run = list(extractor.fetch_changed("contacts"))
+    watermark = first_run[processed - 1]["_watermark"]
+    unprocessed = {_index(r) for r in first_run[processed:]}
+
+    resumed = [_index(r) for r in extractor.fetch_changed("contacts", watermark)]
+
+    assert unprocessed <= set(resumed)
+    assert len(resumed) == len(set(resumed))
+    # Only the boundary millisecond is fetched again
+    boundary = {i for i in range(COUNT) if i // PER_SECOND == _index(first_run[processed - 1]) // PER_SECOND}
+    assert set(resumed) - unprocessed <= boundary
+
+
+def test_restart_after_the_search_limit_yields_each_record_once(extractor, monkeypatch):
+    # The restarted query begins at the newest millisecond already yielded
+    monkeypatch.setattr(hubspot_extractor, "SEARCH_RESULT_LIMIT", 10)
+    monkeypatch.setattr(hubspot_stub, "SEARCH_RESULT_LIMIT", 10)
+    indexes = [_index(r) for r in extractor.fetch_changed("contacts")]
+    assert sorted(indexes) == list(range(COUNT))
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from hubspot_extractor import HubSpotExtractor
+from stubs import hubspot_stub
+
+COUNTS = {"contacts": 23, "companies": 0, "deals": 0}
+
+
+@pytest.fixture
+def extractor(config):
+    server, base_url = hubspot_stub.start_hubspot_stub(COUNTS)
+    config = hubspot_stub.stub_config(config, base_url)
+    config["migration"]["batch_size"] = 5
+    yield HubSpotExtractor(config)
+    server.shutdown()
+
+
+def _ids(records):
+    return [record["id"] for record in records]
+
+
+def _expected(start=0):
+    offset = hubspot_stub.ID_OFFSETS["contacts"]
+    return [str(offset + i) for i in range(start, COUNTS["contacts"])]
+
+
+def test_pages_through_every_record_once_in_order(extractor):
+    assert _ids(extractor.fetch("contacts")) == _expected()
+
+
+@pytest.mark.parametrize("consumed", [1, 4, 5, 12, 23])
+def test_resumes_right_after_the_cursor(extractor, consumed):
+    records = list(extractor.fetch("contacts"))
+    cursor = records[consumed - 1]["_cursor"]
+    assert _ids(extractor.fetch("contacts", cursor)) == _expected(consumed)
+
+
+def test_cursor_survives_a_json_round_trip(extractor):
+    # Run checkpoints store the cursor as JSON, which turns it into a list
+    records = list(extractor.fetch("contacts"))
+    cursor = json.loads(json.dumps(records[7]["_cursor"]))
+    assert _ids(extractor.fetch("contacts", cursor)) == _expected(8)
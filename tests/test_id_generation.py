@@ -0,0 +1,41 @@
+import time
+
+import database
+from database import db_session, generate_id, generate_ids
+from services.migration_engine import migrate_hubspot_contacts_batched, save_or_update_contact
+
+CONTACTS = [
+    {"hubspot_id": str(i), "email": f"c{i}@example.com", "firstname": f"C{i}"} for i in range(5)
+]
+
+
+def _sequences():
+    with db_session(read_only=True) as conn:
+        return conn.execute("SELECT name, next_value FROM id_sequences").fetchall()
+
+
+def test_dry_runs_reserve_no_ids(db):
+    summary = migrate_hubspot_contacts_batched(iter(CONTACTS), dry_run=True)
+    save_or_update_contact({"email": "new@example.com", "first_name": "N"}, dry_run=True)
+
+    assert summary["created"] == 5
+    assert _sequences() == []
+
+
+def test_ids_are_reserved_inside_the_callers_write_transaction(db, monkeypatch):
+    # A second connection would wait busy_timeout for this one's lock
+    monkeypatch.setattr(database, "BUSY_TIMEOUT_SECONDS", 1)
+    database.close_all_connections()
+    conn = database.get_conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        started = time.perf_counter()
+        ids = generate_ids("CUST", 3, "customers", conn=conn)
+        assert time.perf_counter() - started < 0.5
+        conn.commit()
+    finally:
+        conn.close()
+
+    assert ids == [f"CUST-{n:012d}" for n in (1, 2, 3)]
+    # Later blocks start after the numbers that transaction reserved
+    assert generate_id("CUST", "customers") == f"CUST-{4:012d}"
@@ -0,0 +1,148 @@
+import threading
+
+import pytest
+
+import database
+from netsuite_loader import NetSuiteError, NetSuiteLoader
+from services.id_mapping_cache import IdMappingCache
+from services.migration_engine import migrate_hubspot_to_netsuite, save_id_mapping
+from stubs import netsuite_stub
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**state_options):
+        server, base_url = netsuite_stub.start_netsuite_stub(**state_options)
+        servers.append(server)
+        return server, base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def _loader(config, base_url, **netsuite):
+    config = netsuite_stub.stub_config(config, base_url)
+    config["netsuite"].update({"requests_per_second": 1000, "external_ids": False}, **netsuite)
+    return NetSuiteLoader(config)
+
+
+def test_retries_429_until_every_record_is_loaded(config, stub):
+    # The stub answers 429 beyond one request in flight; the loader allows four
+    server, base_url = stub(latency=0.02, concurrency_limit=1)
+    loader = _loader(config, base_url, concurrency=4, max_retries=50)
+    results = list(loader.load_many("customer", [{"id": str(i)} for i in range(12)]))
+    loader.close()
+
+    assert [error for _, _, error in results if error] == []
+    assert len(server.state.records) == 12
+    assert server.state.rejected > 0
+    assert server.state.requests == 12 + server.state.rejected
+
+
+def test_gives_up_after_max_retries(config, stub):
+    server, base_url = stub(error_rate=1.0)
+    loader = _loader(config, base_url, max_retries=2)
+    with pytest.raises(NetSuiteError) as raised:
+        loader.upsert("customer", {"id": "1"})
+    assert raised.value.status == 503
+    assert server.state.requests == 3
+
+
+def test_direct_upserts_stay_within_concurrency(config, stub):
+    server, base_url = stub(latency=0.02, concurrency_limit=3)
+    loader = _loader(config, base_url, concurrency=3)
+    threads = [
+        threading.Thread(target=loader.upsert, args=("customer", {"id": str(i)})) for i in range(12)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert server.state.rejected == 0
+    assert server.state.max_in_flight <= 3
+    assert len(server.state.records) == 12
+
+
+def test_batch_results_are_matched_to_their_records(config, stub):
+    server, base_url = stub()
+    loader = _loader(config, base_url)
+    items = [(None, {"name": f"Customer {i}"}) for i in range(5)]
+    items[2] = (None, {"name": "Customer 2", "_fail": "invalid subsidiary"})
+
+    results = loader.batch_upsert("customer", items)
+
+    assert server.state.batches == 1
+    assert [error is None for _, error in results] == [True, True, False, True, True]
+    assert "invalid subsidiary" in str(results[2][1])
+    for (_, payload), (netsuite_id, error) in zip(items, results):
+        if error is None:
+            assert server.state.records[f"/customer/{netsuite_id}"]["name"] == payload["name"]
+
+
+def test_batcher_futures_resolve_per_record(config, stub):
+    server, base_url = stub()
+    loader = _loader(config, base_url)
+    batcher = loader.batcher("customer", max_batch_size=4, max_wait=0)
+    futures = [
+        batcher.add({"name": f"Customer {i}", **({"_fail": "duplicate"} if i == 5 else {})})
+        for i in range(10)
+    ]
+    batcher.close()
+    loader.close()
+
+    assert batcher.batches_sent == 3
+    assert server.state.batches == 3
+    assert isinstance(futures[5].exception(), NetSuiteError)
+    loaded = [future.result() for i, future in enumerate(futures) if i != 5]
+    assert len(set(loaded)) == 9
+    assert {server.state.records[f"/customer/{netsuite_id}"]["name"] for netsuite_id in loaded} == {
+        f"Customer {i}" for i in range(10) if i != 5
+    }
+
+
+def test_replayed_batch_does_not_create_records_twice(config, stub):
+    # A run that dies after NetSuite accepted a batch but before its id
+    # mappings were saved sends the same unmapped records again on resume
+    server, base_url = stub()
+    loader = _loader(config, base_url, external_ids=True)
+    items = [(None, {"name": f"Customer {i}"}, str(100 + i)) for i in range(5)]
+
+    first = loader.batch_upsert("customer", items)
+    replayed = loader.batch_upsert("customer", [(None, dict(payload, phone="555"), source_id)
+                                                for _, payload, source_id in items])
+
+    assert [error for _, error in first + replayed] == [None] * 10
+    assert [netsuite_id for netsuite_id, _ in replayed] == [netsuite_id for netsuite_id, _ in first]
+    assert len(server.state.records) == 5
+    assert all(record["phone"] == "555" for record in server.state.records.values())
+
+
+def test_bulk_push_replayed_after_losing_its_mappings_creates_nothing_new(config, stub, db):
+    server, base_url = stub()
+    loader = _loader(config, base_url, external_ids=True)
+    contacts = [{"hubspot_id": str(200 + i), "email": f"c{i}@example.com", "firstname": f"C{i}"} for i in range(6)]
+    for contact in contacts:
+        save_id_mapping("hubspot", contact["hubspot_id"], "fwd_crm", f"CUST-{contact['hubspot_id']}")
+
+    first = migrate_hubspot_to_netsuite(contacts, loader, batch_mode=True, id_cache=IdMappingCache())
+    created = {r["source_id"]: r["target_id"] for r in _netsuite_mappings()}
+    # The crash: NetSuite kept the records, the mappings never committed
+    with database.db_session() as conn:
+        conn.execute("DELETE FROM id_mappings WHERE target_system = 'netsuite'")
+    replay = migrate_hubspot_to_netsuite(contacts, loader, batch_mode=True, id_cache=IdMappingCache())
+    loader.close()
+
+    assert first["created"] == replay["created"] == 6
+    assert len(server.state.records) == 6
+    assert {r["source_id"]: r["target_id"] for r in _netsuite_mappings()} == created
+
+
+def _netsuite_mappings():
+    with database.db_session(read_only=True) as conn:
+        return conn.execute(
+            "SELECT source_id, target_id FROM id_mappings WHERE target_system = 'netsuite'"
+        ).fetchall()
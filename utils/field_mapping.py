@@ -0,0 +1,210 @@
+import os
+from collections import namedtuple
+
+import pandas as pd
+import yaml
+
+from utils.zip_index import normalize_zip
+
+# --------------------
+# Declarative field mappings
+# --------------------
+# The `mappings` section of config/config.yaml describes each record shape
+# as target field -> source property:
+#
+#   mappings:
+#     contacts:
+#       first_name: firstname                              # copy a property
+#       source_system: {value: hubspot}                    # constant
+#       lifecycle_stage: {source: lifecycle_stage, default: Lead}
+#       email: {source: email, transform: [strip, lower]}
+#
+# default is used when the property is missing from the record (like
+# dict.get); a property that is present but empty stays None. Transforms
+# run in order on non-empty values.
+#
+# compile_mapping() turns a spec into a plain function that builds the
+# target dict in one literal, generated once, so a mapped record costs no
+# more than a hand-written mapper. compile_frame_mapping() maps a whole
+# pandas chunk column by column to the same values.
+
+CONFIG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "config", "config.yaml"))
+
+Field = namedtuple("Field", "target source default has_default value is_constant transforms")
+
+
+def _text(value):
+    return value if isinstance(value, str) else str(value)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _integer(value):
+    number = _number(value)
+    return int(number) if number is not None and number.is_integer() else None
+
+
+def _frame_text(series):
+    return series.astype("string")
+
+
+# name -> (per-value function, per-column function). Value functions only
+# see non-empty values; both variants give None for what they can't parse.
+TRANSFORMS = {
+    "str": (_text, _frame_text),
+    "strip": (lambda v: _text(v).strip(), lambda s: _frame_text(s).str.strip()),
+    "lower": (lambda v: _text(v).lower(), lambda s: _frame_text(s).str.lower()),
+    "upper": (lambda v: _text(v).upper(), lambda s: _frame_text(s).str.upper()),
+    "title": (lambda v: _text(v).title(), lambda s: _frame_text(s).str.title()),
+    "float": (_number, lambda s: pd.to_numeric(s, errors="coerce")),
+    "int": (_integer, lambda s: pd.Series([_integer(v) if pd.notna(v) else None for v in s], index=s.index,
+                                          dtype=object)),
+    "zip": (normalize_zip, lambda s: s.map(normalize_zip, na_action="ignore")),
+}
+
+
+def parse_mapping(spec, name="mapping"):
+    """Validate a mapping spec; returns its Fields in order."""
+    if not isinstance(spec, dict) or not spec:
+        raise ValueError(f"Mapping {name!r} must be a non-empty target -> source dict")
+    fields = []
+    for target, rule in spec.items():
+        if isinstance(rule, str):
+            rule = {"source": rule}
+        if not isinstance(target, str) or not isinstance(rule, dict):
+            raise ValueError(f"Mapping {name!r}: bad rule for {target!r}")
+        unknown = set(rule) - {"source", "default", "value", "transform"}
+        if unknown:
+            raise ValueError(f"Mapping {name!r}.{target}: unknown keys {sorted(unknown)}")
+        transforms = rule.get("transform") or []
+        if isinstance(transforms, str):
+            transforms = [transforms]
+        for transform in transforms:
+            if transform not in TRANSFORMS:
+                raise ValueError(f"Mapping {name!r}.{target}: unknown transform {transform!r}")
+        is_constant = "value" in rule
+        source = rule.get("source", target)
+        if not is_constant and not isinstance(source, str):
+            raise ValueError(f"Mapping {name!r}.{target}: source must be a property name")
+        fields.append(Field(
+            target, None if is_constant else source, rule.get("default"), "default" in rule,
+            rule.get("value"), is_constant, tuple(transforms),
+        ))
+    return fields
+
+
+def _chain(transforms):
+    functions = [TRANSFORMS[t][0] for t in transforms]
+
+    def apply(value):
+        for function in functions:
+            if value is None or value != value:  # None or NaN
+                return None
+            value = function(value)
+        return value
+    return apply
+
+
+def compile_mapping(spec, name="mapping"):
+    """
+    Per-record mapper for spec: a generated function equivalent to
+    {"target": transform(record.get("source", default)), ...}.
+    """
+    fields = parse_mapping(spec, name)
+    namespace, items = {}, []
+    for i, field in enumerate(fields):
+        if field.is_constant:
+            namespace[f"_c{i}"] = field.value
+            expr = f"_c{i}"
+        else:
+            if field.has_default:
+                namespace[f"_d{i}"] = field.default
+                expr = f"get({field.source!r}, _d{i})"
+            else:
+                expr = f"get({field.source!r})"
+            if field.transforms:
+                namespace[f"_t{i}"] = _chain(field.transforms)
+                expr = f"_t{i}({expr})"
+        items.append(f"{field.target!r}: {expr}")
+    source = "def mapper(record):\n    get = record.get\n    return {" + ", ".join(items) + "}\n"
+    exec(compile(source, f"<mapping {name}>", "exec"), namespace)
+    mapper = namespace["mapper"]
+    mapper.__name__ = mapper.__qualname__ = f"map_{name}"
+    mapper.fields = fields
+    mapper.source = source
+    return mapper
+
+
+def compile_frame_mapping(spec, name="mapping"):
+    """
+    Column-wise mapper for spec: DataFrame in, DataFrame of the target
+    fields out (same index), empty cells as None. Row for row it gives what
+    compile_mapping's function gives for that row as a dict.
+    """
+    fields = parse_mapping(spec, name)
+
+    def map_frame(df):
+        columns = {}
+        for field in fields:
+            if field.is_constant:
+                columns[field.target] = field.value
+            elif field.source in df.columns:
+                column = df[field.source]
+                for transform in field.transforms:
+                    column = TRANSFORMS[transform][1](column)
+                columns[field.target] = column
+            else:
+                columns[field.target] = _chain(field.transforms)(field.default)
+        out = pd.DataFrame(columns, index=df.index)
+        return out.astype(object).where(out.notna(), None)
+
+    map_frame.__name__ = f"map_{name}_frame"
+    map_frame.fields = fields
+    return map_frame
+
+
+# --------------------
+# Mappings from config
+# --------------------
+_specs = None
+_mappers = {}
+_frame_mappers = {}
+
+
+def configure(config):
+    """Use config's `mappings` section (e.g. a config main.py already loaded)."""
+    global _specs
+    _specs = (config or {}).get("mappings") or {}
+    _mappers.clear()
+    _frame_mappers.clear()
+
+
+def mapping_spec(name):
+    global _specs
+    if _specs is None:
+        with open(CONFIG_PATH) as f:
+            _specs = (yaml.safe_load(f) or {}).get("mappings") or {}
+    if name not in _specs:
+        raise KeyError(f"No mapping {name!r} in the mappings section of {CONFIG_PATH}")
+    return _specs[name]
+
+
+def get_mapper(name):
+    """Compiled per-record mapper for mappings.<name> (compiled once)."""
+    mapper = _mappers.get(name)
+    if mapper is None:
+        mapper = _mappers[name] = compile_mapping(mapping_spec(name), name)
+    return mapper
+
+
+def get_frame_mapper(name):
+    """Compiled column-wise mapper for mappings.<name> (compiled once)."""
+    mapper = _frame_mappers.get(name)
+    if mapper is None:
+        mapper = _frame_mappers[name] = compile_frame_mapping(mapping_spec(name), name)
+    return mapper
@@ -1,8 +1,11 @@
-import json
+import atexit
 import yaml
 import os
 import requests
 
+from utils.id_map_store import IdMapStore
+from utils.zip_index import DATA_DIR, ZipLookupCache, get_zip_index, lookup_zip_column, normalize_zip
+
 # --------------------
 # Paths for config & ID map
 # --------------------
@@ -18,20 +21,30 @@ def load_config():
     with open(CONFIG_PATH, "r") as f:
         return yaml.safe_load(f)
 
+# The map is persisted through an append-only journal (see utils/id_map_store.py);
+# these functions keep the original dict-based API on top of it.
+_id_map_store = None
+
+def _get_id_map_store():
+    global _id_map_store
+    if _id_map_store is None or _id_map_store.path != ID_MAP_PATH:
+        _id_map_store = IdMapStore(ID_MAP_PATH)
+        atexit.register(_id_map_store.close)
+    return _id_map_store
+
 def load_id_map():
-    if not os.path.exists(ID_MAP_PATH):
-        with open(ID_MAP_PATH, "w") as f:
-            json.dump({}, f, indent=2)
-    with open(ID_MAP_PATH, "r") as f:
-        return json.load(f)
+    return _get_id_map_store().load()
 
 def save_id_map(id_map):
-    with open(ID_MAP_PATH, "w") as f:
-        json.dump(id_map, f, indent=2)
+    _get_id_map_store().compact(id_map)
 
 def update_id_map(shopify_id, netsuite_id, id_map):
     id_map[shopify_id] = netsuite_id
-    save_id_map(id_map)
+    _get_id_map_store().append(shopify_id, netsuite_id, id_map)
+
+def sync_id_map():
+    """Make every update_id_map so far durable (fsync the journal)."""
+    _get_id_map_store().sync()
 
 # --------------------
 # ZIP Code helper
@@ -43,21 +56,63 @@ LOCAL_ZIP_DATA = {
     # Add more common ZIPs here
 }
 
-def get_city_state(zip_code):
-    """Return city/state for a given ZIP. Try local dictionary first, then fallback to API."""
+# The offline index (utils/zip_index.py) answers almost every lookup; the
+# network is only asked about ZIPs it doesn't know, and those answers are
+# memoised on disk for ZIP_CACHE_TTL_SECONDS.
+ZIP_NETWORK_FALLBACK = True
+ZIP_CACHE_PATH = os.path.join(DATA_DIR, "zip_cache.db")
+ZIP_CACHE_TTL_SECONDS = 30 * 24 * 3600
+_zip_cache = None
+
+def _get_zip_cache():
+    global _zip_cache
+    if _zip_cache is None or _zip_cache.path != ZIP_CACHE_PATH:
+        _zip_cache = ZipLookupCache(ZIP_CACHE_PATH, ZIP_CACHE_TTL_SECONDS)
+    return _zip_cache
+
+def get_city_state(zip_code, allow_network=None):
+    """Return city/state for a given ZIP. Try the offline index first, then the (cached) API."""
     if zip_code in LOCAL_ZIP_DATA:
         return LOCAL_ZIP_DATA[zip_code]
 
+    index = get_zip_index()
+    found = index.lookup(zip_code) if index else None
+    if found:
+        return found
+
+    zip5 = normalize_zip(zip_code)
+    if allow_network is None:
+        allow_network = ZIP_NETWORK_FALLBACK
+    if not zip5 or not allow_network:
+        return {"city": "", "state": ""}
+
+    cache = _get_zip_cache()
+    cached = cache.get(zip5)
+    if cached is not None:
+        return cached
+
     try:
-        response = requests.get(f"http://api.zippopotam.us/us/{zip_code}", timeout=5)
+        response = requests.get(f"http://api.zippopotam.us/us/{zip5}", timeout=5)
         if response.status_code == 200:
             data = response.json()
-            return {
+            result = {
                 "city": data["places"][0]["place name"],
                 "state": data["places"][0]["state abbreviation"]
             }
+        elif response.status_code == 404:
+            # Definitively unknown ZIP
+            result = {"city": "", "state": ""}
+        else:
+            # Throttled or down: answer empty now, ask again next time
+            print(f"ZIP API error: HTTP {response.status_code} for {zip5}")
+            return {"city": "", "state": ""}
+        cache.put(zip5, result)
+        return result
     except Exception as e:
         print(f"ZIP API error: {e}")
 
     return {"city": "", "state": ""}
 
+def get_city_state_column(zip_series):
+    """Batch version of get_city_state for a DataFrame column (offline index only)."""
+    return lookup_zip_column(zip_series)
@@ -0,0 +1,112 @@
+import json
+import os
+
+# --------------------
+# Append-only ID map store
+# --------------------
+# The map lives in two files:
+#   id_map.json      compacted snapshot (same format as before)
+#   id_map.json.log  journal, one {"k": ..., "v": ...} JSON line per update
+# Updates only append to the journal. Once the journal holds more entries than
+# the snapshot, the two are merged into a fresh snapshot and the journal is
+# truncated. A torn last journal line (crash mid-write) is ignored on load.
+
+COMPACT_MIN_ENTRIES = 10_000
+FSYNC_EVERY = 500
+
+
+class IdMapStore:
+    def __init__(self, path, compact_min_entries=COMPACT_MIN_ENTRIES, fsync_every=FSYNC_EVERY):
+        self.path = path
+        self.journal_path = path + ".log"
+        self.compact_min_entries = compact_min_entries
+        self.fsync_every = fsync_every
+        self._journal = None
+        self._journal_entries = 0
+        self._unsynced = 0
+        self._snapshot_size = 0
+
+    # --------------------
+    # Loading
+    # --------------------
+    def load(self):
+        """Return the full map: snapshot plus replayed journal."""
+        id_map = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                id_map = json.load(f)
+        self._snapshot_size = len(id_map)
+
+        self._journal_entries = 0
+        if os.path.exists(self.journal_path):
+            good_bytes = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn write at the tail
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn write at the tail
+                    id_map[entry["k"]] = entry["v"]
+                    self._journal_entries += 1
+                    good_bytes += len(line)
+            if good_bytes < os.path.getsize(self.journal_path):
+                # Drop the torn tail so new appends start on a clean line
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(good_bytes)
+        elif not os.path.exists(self.path):
+            self._write_snapshot(id_map)
+        return id_map
+
+    # --------------------
+    # Writes
+    # --------------------
+    def append(self, key, value, id_map=None):
+        """
+        Record one update. O(1): a single journal line.
+        Pass the in-memory map to let the store compact when the journal grows.
+        """
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a")
+        self._journal.write(json.dumps({"k": key, "v": value}) + "\n")
+        self._journal.flush()
+        self._journal_entries += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+        if id_map is not None and self._journal_entries >= max(self.compact_min_entries, self._snapshot_size):
+            self.compact(id_map)
+
+    def sync(self):
+        """Group commit: fsync everything appended since the last sync."""
+        if self._journal is not None and self._unsynced:
+            os.fsync(self._journal.fileno())
+        self._unsynced = 0
+
+    def compact(self, id_map):
+        """Write id_map as the new snapshot and truncate the journal."""
+        self._write_snapshot(id_map)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_entries = 0
+        self._unsynced = 0
+
+    def close(self):
+        self.sync()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _write_snapshot(self, id_map):
+        # Write-then-rename so a crash never leaves a truncated snapshot
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(id_map, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._snapshot_size = len(id_map)
@@ -0,0 +1,291 @@
+import bisect
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --------------------
+# Lightweight metrics
+# --------------------
+# Counters and latency histograms kept in process, exported as a Prometheus
+# text file or a JSON snapshot. Everything is off until enable() (or
+# configure() with metrics.enabled) is called; while off, timer() hands back
+# a shared no-op context manager and count()/observe() return after one
+# flag check, so instrumented hot paths cost next to nothing.
+
+# Upper bounds in seconds; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "db_get_conn_seconds": "Time to hand out a pooled SQLite connection",
+    "sql_seconds": "SQLite statement time (execute/executemany/commit) by statement family",
+    "hubspot_page_seconds": "HubSpot CRM v3 page request time",
+    "hubspot_records_total": "Records returned by HubSpot pages",
+    "hubspot_retries_total": "HubSpot requests retried after 429/5xx",
+    "netsuite_request_seconds": "NetSuite REST request time, including retries",
+    "netsuite_retries_total": "NetSuite requests retried after 429/5xx",
+    "netsuite_errors_total": "NetSuite requests that failed for good",
+    "transform_seconds": "Time spent mapping and fingerprinting records",
+    "transform_wait_seconds": "Time the contact writer waited on worker processes for mapped batches",
+    "records_total": "Records processed, by job and outcome",
+    "errors_total": "Records that failed, by job",
+    "validation_rejects_total": "Contacts rejected by validation, by reason",
+    "audit_flush_seconds": "Time to write one bulk flush of audit events",
+    "audit_events_total": "Audit events written",
+    "audit_events_dropped_total": "Audit events that could be neither written nor saved on close",
+}
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def count(self, name, value, labels):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+_registry = MetricsRegistry()
+
+
+def enabled():
+    return _registry.enabled
+
+
+def enable(on=True):
+    _registry.enabled = bool(on)
+
+
+def reset():
+    _registry.reset()
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+# --------------------
+# Recording
+# --------------------
+def count(name, value=1, **labels):
+    if _registry.enabled and value:
+        _registry.count(name, value, _labels(labels))
+
+
+def observe(name, seconds, **labels):
+    if _registry.enabled:
+        _registry.observe(name, seconds, _labels(labels))
+
+
+def count_summary(job, summary, **labels):
+    """Add a migration summary's created/updated/unchanged/failed counts."""
+    if not _registry.enabled:
+        return
+    for outcome in ("created", "updated", "unchanged", "failed"):
+        count("records_total", summary.get(outcome, 0), job=job, outcome=outcome, **labels)
+    count("errors_total", summary.get("failed", 0), job=job, **labels)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _registry.observe(self.name, time.perf_counter() - self.started, self.labels)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """
+    Context manager recording its block's duration in histogram `name`.
+    """
+    if not _registry.enabled:
+        return _NULL_TIMER
+    return _Timer(name, _labels(labels))
+
+
+# --------------------
+# Export
+# --------------------
+def snapshot():
+    """
+    {"counters": [...], "histograms": [...]}, each entry carrying its name
+    and labels; histograms also carry count, sum and cumulative buckets.
+    """
+    with _registry.lock:
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_registry.counters.items())
+        ]
+        histograms = []
+        for (name, labels), h in sorted(_registry.histograms.items()):
+            cumulative, running = [], 0
+            for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                running += n
+                cumulative.append([bound, running])
+            histograms.append({
+                "name": name, "labels": dict(labels), "count": h.count, "sum": h.sum,
+                "mean": h.sum / h.count if h.count else 0.0, "buckets": cumulative,
+            })
+    return {"timestamp": time.time(), "counters": counters, "histograms": histograms}
+
+
+def _prom_labels(labels, extra=None):
+    pairs = list(labels.items()) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def prometheus_text():
+    """The current metrics in the Prometheus text exposition format."""
+    data = snapshot()
+    lines, described = [], set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for c in data["counters"]:
+        describe(c["name"], "counter")
+        lines.append(f"{c['name']}{_prom_labels(c['labels'])} {c['value']}")
+    for h in data["histograms"]:
+        describe(h["name"], "histogram")
+        for bound, n in h["buckets"]:
+            lines.append(f"{h['name']}_bucket{_prom_labels(h['labels'], ('le', bound))} {n}")
+        lines.append(f"{h['name']}_sum{_prom_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{h['name']}_count{_prom_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path):
+    """
+    Write the metrics to path: Prometheus text for *.prom, JSON otherwise.
+    The file is replaced atomically so a scraper never reads half of it.
+    """
+    payload = prometheus_text() if path.endswith(".prom") else json.dumps(snapshot(), indent=2)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return path
+
+
+# --------------------
+# Config / profiling
+# --------------------
+def configure(config):
+    """
+    Apply the `metrics` section of config.yaml; returns that section.
+    """
+    settings = (config or {}).get("metrics") or {}
+    enable(settings.get("enabled", False))
+    return settings
+
+
+def export(config):
+    """Write metrics to metrics.export_path when metrics are enabled."""
+    settings = (config or {}).get("metrics") or {}
+    if _registry.enabled and settings.get("export_path"):
+        return write_metrics(settings["export_path"])
+    return None
+
+
+@contextmanager
+def profiled(config):
+    """
+    Profile the block with cProfile or pyinstrument, per metrics.profile
+    ("none", "cprofile" or "pyinstrument"), writing to metrics.profile_path.
+    Both profile the calling thread only; time spent in pipeline worker
+    threads shows up in the metrics timers instead.
+    """
+    settings = (config or {}).get("metrics") or {}
+    mode = (settings.get("profile") or "none").lower()
+    path = settings.get("profile_path") or os.path.join("data", f"profile.{mode}")
+    if mode == "none":
+        yield
+        return
+
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            print(f"cProfile stats written to {path}")
+    elif mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError("metrics.profile is 'pyinstrument' but pyinstrument is not installed")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, "w") as f:
+                f.write(profiler.output_html())
+            print(f"pyinstrument report written to {path}")
+    else:
+        raise ValueError(f"Unknown metrics.profile {mode!r}")
@@ -0,0 +1,253 @@
+import argparse
+import bisect
+import csv
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+# --------------------
+# Offline US ZIP index
+# --------------------
+# data/us_zips.bin is a read-only, mmap-able index of every US ZIP code.
+# The bundled file was built from the MIT-licensed `zipcodes` package
+# dataset (updated 2021-10-03); rebuild it from any zip,city,state CSV with
+#   python -m utils.zip_index build <source.csv>
+#
+# Layout (little endian):
+#   header   8s magic, I zip count, I city count, I state count
+#   zips     I[count]        ZIP as an integer, sorted ascending
+#   cities   H[count]        index into the city table
+#   states   B[count]        index into the state table
+#   state    2s[state count] two-letter state codes
+#   offsets  I[city count+1] byte offsets into the city blob
+#   blob     UTF-8 city names
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+ZIP_INDEX_PATH = os.path.join(DATA_DIR, "us_zips.bin")
+MAGIC = b"ZIPIDX1\0"
+HEADER = struct.Struct("<8sIII")
+
+
+def normalize_zip(value):
+    """
+    Return the 5-digit ZIP for "3867", 3867.0, "03867-1234", " 03867 ", else None.
+    """
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return None
+        value = int(value)
+    text = str(value).strip().split("-")[0]
+    if text.endswith(".0"):
+        text = text[:-2]
+    if not text.isdigit() or len(text) > 5:
+        return None
+    return text.zfill(5)
+
+
+class ZipIndex:
+    """
+    Binary-searchable view over the mmapped index file.
+    Only the pages touched by lookups are ever read from disk.
+    """
+
+    def __init__(self, path=ZIP_INDEX_PATH):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, city_count, state_count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a ZIP index file: {path}")
+        self.count = count
+
+        view = memoryview(self._mm)
+        pos = HEADER.size
+        self._zips = view[pos:pos + 4 * count].cast("I")
+        pos += 4 * count
+        self._city_ids = view[pos:pos + 2 * count].cast("H")
+        pos += 2 * count
+        self._state_ids = view[pos:pos + count]
+        pos += count
+        self._states = [bytes(view[pos + 2 * i:pos + 2 * i + 2]).decode() for i in range(state_count)]
+        pos += 2 * state_count
+        self._offsets = view[pos:pos + 4 * (city_count + 1)].cast("I")
+        pos += 4 * (city_count + 1)
+        self._blob_start = pos
+
+    def _row(self, i):
+        city_id = self._city_ids[i]
+        start = self._blob_start + self._offsets[city_id]
+        end = self._blob_start + self._offsets[city_id + 1]
+        return {"city": self._mm[start:end].decode(), "state": self._states[self._state_ids[i]]}
+
+    def lookup(self, zip_code):
+        """Return {"city", "state"} for a ZIP, or None if it is not in the index."""
+        zip5 = normalize_zip(zip_code)
+        if zip5 is None:
+            return None
+        key = int(zip5)
+        i = bisect.bisect_left(self._zips, key)
+        if i < self.count and self._zips[i] == key:
+            return self._row(i)
+        return None
+
+    def lookup_many(self, zip_codes):
+        """
+        Look up a whole column at once. Each distinct ZIP is searched once.
+        Returns a list of {"city", "state"} (empty strings when unknown).
+        """
+        found = {}
+        results = []
+        for value in zip_codes:
+            zip5 = normalize_zip(value)
+            if zip5 not in found:
+                found[zip5] = self.lookup(zip5) if zip5 else None
+            results.append(found[zip5] or {"city": "", "state": ""})
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_zip_index():
+    """Load the bundled index on first use; None if the file is missing."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None and os.path.exists(ZIP_INDEX_PATH):
+                _index = ZipIndex(ZIP_INDEX_PATH)
+    return _index
+
+
+def lookup_zip_column(series):
+    """
+    Vectorised city/state lookup for a pandas Series of ZIPs.
+    Returns a DataFrame with `zip`, `city` and `state` columns, same index.
+    """
+    import pandas as pd
+
+    index = get_zip_index()
+    zips = series.map(normalize_zip)
+    uniques = zips.dropna().unique()
+    rows = index.lookup_many(uniques) if index else [{"city": "", "state": ""}] * len(uniques)
+    city = dict(zip(uniques, (r["city"] for r in rows)))
+    state = dict(zip(uniques, (r["state"] for r in rows)))
+    return pd.DataFrame({
+        "zip": zips,
+        "city": zips.map(city).fillna(""),
+        "state": zips.map(state).fillna(""),
+    }, index=series.index)
+
+
+# --------------------
+# Persistent network-lookup cache
+# --------------------
+class ZipLookupCache:
+    """
+    SQLite-backed memo of network ZIP lookups with a TTL.
+    Misses are cached too, so unknown ZIPs don't trigger a request every time.
+    """
+
+    def __init__(self, path, ttl_seconds):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS zip_lookups (
+                zip TEXT PRIMARY KEY,
+                city TEXT,
+                state TEXT,
+                fetched_at REAL
+            )
+            """)
+        return self._conn
+
+    def get(self, zip5):
+        """Cached {"city", "state"} for zip5, or None if absent or expired."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT city, state, fetched_at FROM zip_lookups WHERE zip=?", (zip5,)
+            ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl_seconds:
+            return None
+        return {"city": row[0], "state": row[1]}
+
+    def put(self, zip5, result):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO zip_lookups VALUES (?, ?, ?, ?)",
+                (zip5, result["city"], result["state"], time.time())
+            )
+            conn.commit()
+
+
+# --------------------
+# Index builder
+# --------------------
+def build_zip_index(rows, path=ZIP_INDEX_PATH):
+    """
+    Write the index file from (zip, city, state) rows.
+    Duplicate ZIPs keep their first row.
+    """
+    entries = {}
+    for zip_code, city, state in rows:
+        zip5 = normalize_zip(zip_code)
+        if zip5 and zip5 not in entries:
+            entries[zip5] = (city.strip(), state.strip().upper())
+
+    zips = sorted(entries)
+    cities = sorted({city for city, _ in entries.values()})
+    states = sorted({state for _, state in entries.values()})
+    if len(cities) > 0xFFFF or len(states) > 0xFF:
+        raise ValueError("Too many distinct cities or states for the index format")
+    city_ids = {c: i for i, c in enumerate(cities)}
+    state_ids = {s: i for i, s in enumerate(states)}
+
+    blob = bytearray()
+    offsets = [0]
+    for city in cities:
+        blob += city.encode()
+        offsets.append(len(blob))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(zips), len(cities), len(states)))
+        f.write(struct.pack(f"<{len(zips)}I", *(int(z) for z in zips)))
+        f.write(struct.pack(f"<{len(zips)}H", *(city_ids[entries[z][0]] for z in zips)))
+        f.write(bytes(state_ids[entries[z][1]] for z in zips))
+        f.write(b"".join(s.encode().ljust(2)[:2] for s in states))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(bytes(blob))
+    os.replace(tmp_path, path)
+    return len(zips)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline US ZIP index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build the index from a zip,city,state CSV")
+    build.add_argument("source")
+    build.add_argument("--output", default=ZIP_INDEX_PATH)
+    find = sub.add_parser("lookup", help="look up ZIP codes")
+    find.add_argument("zips", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with open(args.source, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            count = build_zip_index(((r["zip"], r["city"], r["state"]) for r in reader), args.output)
+        print(f"Wrote {count} ZIP codes to {args.output}")
+    else:
+        index = get_zip_index()
+        for z in args.zips:
+            print(z, index.lookup(z) if index else None)